@@ -1,4 +1,3 @@
-from .xsection_plugin_main import XSectionPlugin
 import sys
 from pathlib import Path
 
@@ -12,4 +11,6 @@ if str(custom_package_dir) not in sys.path:
 
 def classFactory(iface):
     print('initializing profile plugin')
+    # imported here rather than with the package, so QGIS only pays for it when the plugin is loaded
+    from .xsection_plugin_main import XSectionPlugin
     return XSectionPlugin(iface)
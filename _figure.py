@@ -1,13 +1,14 @@
 from pathlib import Path
-import psycopg2
 import pandas as pd
-import shapely as shp
 from plotly import graph_objects as go
 # import webview
 from plotly.subplots import make_subplots
-import geopandas as gpd
 import plotly
-import pickle
+import numpy as np
+try:
+    from .engine import lod
+except ImportError:
+    from engine import lod
 
 data_dir = Path.cwd().joinpath('sample_data')
 
@@ -109,17 +110,19 @@ class Template:
         :return: customdata, hovertemplate
         """
         names = list(name_dict.keys())
-        lists = list(name_dict.values())
-        list_len = len(lists[0])
-        custom_data = []
+        columns = [np.asarray(values) for values in name_dict.values()]
         hover_template_list = []
 
-        for i in range(list_len):
-            this_list = [param[i] for param in lists]
-            custom_data.append(this_list)
+        # one row per point; numeric columns stay a float array so they are sent as a typed array
+        if all(np.issubdtype(column.dtype, np.number) for column in columns):
+            custom_data = np.column_stack(columns).astype(float)
+        else:
+            custom_data = np.empty((len(columns[0]), len(columns)), dtype=object)
+            for i, column in enumerate(columns):
+                custom_data[:, i] = column
 
         for i, name in enumerate(names):
-            if type(custom_data[0][i]) is float:
+            if np.issubdtype(columns[i].dtype, np.floating):
                 hover_template_list.append(
                     f'<b>{name}: </b>%{{customdata[{i}]:.2f}}<br>'
                 )
@@ -133,14 +136,22 @@ class Template:
         return custom_data, hover_template
 
 
-template = Template()
+_template = None
+
+
+def get_template() -> Template:
+    """The shared Template, built on first use rather than on import"""
+    global _template
+    if _template is None:
+        _template = Template()
+    return _template
 
 
 class BaseFig(go.Figure):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.layout = template.layout
+        self.layout = get_template().layout
         self._config = {'scrollZoom': True}
 
     def show(self, renderer='browser', config=None, *args, **kwargs):
@@ -154,7 +165,7 @@ class Fig(BaseFig):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._subplot = None
-        self.update_layout(template.layout)
+        self.update_layout(get_template().layout)
 
     def subplot(self, *args, **kwargs):
         self._subplot = Subplot(*args, **kwargs)
@@ -300,28 +311,35 @@ class Subplot:
     def add_trace(self, *args, **kwargs):
         return self.fig.add_trace(*args, **kwargs)
 
+    def add_downsampled_trace(self, trace_type, x, y, row=1, col=1, max_points=lod.DEFAULT_MAX_POINTS,
+                              method='minmax', **kwargs):
+        """Adds a trace of x, y downsampled to about max_points. method is the downsampling of lod.downsample(),
+        'sum' for bars"""
+        x, y = lod.LevelOfDetail(x, y, max_points=max_points, method=method).get()
+        self.add_trace(trace_type(x=x, y=y, **kwargs), row=row, col=col)
+
     def show(self, renderer='browser'):
-        self.fig.show(config=template._config, renderer=renderer)
+        self.fig.show(config=get_template()._config, renderer=renderer)
 
     def apply_template_layout(self):
-        self.fig.update_layout(**template._template_update_args)
+        self.fig.update_layout(**get_template()._template_update_args)
 
-    def add_water_levels(self, df: pd.DataFrame = None, row=1, col=1, **kwargs):
+    def add_water_levels(self, df: pd.DataFrame = None, row=1, col=1, max_points=lod.DEFAULT_MAX_POINTS, **kwargs):
         trace_names = df.columns[1:]
-        trace_colors = template._get_colors_for_traces(trace_names)
+        trace_colors = get_template()._get_colors_for_traces(trace_names)
         for idx, loc in enumerate(trace_names):
-            self.add_trace(
-                go.Scattergl(
-                    x=list(df.iloc[:, 0]),
-                    y=list(df.iloc[:, idx + 1]),
-                    name=loc,
-                    line_width=self.trace_specs['water_levels_width'],
-                    line_color=trace_colors[loc],
-                    marker_color=trace_colors[loc],
-                    **kwargs
-                ),
+            self.add_downsampled_trace(
+                go.Scattergl,
+                x=df.iloc[:, 0].to_numpy(),
+                y=df.iloc[:, idx + 1].to_numpy(dtype=float, na_value=float('nan')),
                 row=row,
-                col=col
+                col=col,
+                max_points=max_points,
+                name=loc,
+                line_width=self.trace_specs['water_levels_width'],
+                line_color=trace_colors[loc],
+                marker_color=trace_colors[loc],
+                **kwargs
             )
         self.fig.update_yaxes(
             title_text="Elevation (ft)",
@@ -330,7 +348,16 @@ class Subplot:
             row=1,
             col=1)
 
-    def add_precip(self, df: pd.DataFrame = None, row=2, col=1, cols_to_plot=None, type='bars', **kwargs):
+    def add_precip(
+            self,
+            df: pd.DataFrame = None,
+            row=2,
+            col=1,
+            cols_to_plot=None,
+            type='bars',
+            max_points=lod.DEFAULT_MAX_POINTS,
+            **kwargs
+    ):
         if cols_to_plot is None:
             columns = df.columns[1:]
         else:
@@ -338,31 +365,35 @@ class Subplot:
         if len(columns) > 1:
             self.fig.update_layout(barmode='group')
         for loc in columns:
+            x = df.iloc[:, 0].to_numpy()
+            y = df.loc[:, loc].to_numpy(dtype=float, na_value=float('nan'))
             if type == 'bars':
-                self.add_trace(
-                    go.Bar(
-                        x=list(df.iloc[:, 0]),
-                        y=list(df.loc[:, loc]),
-                        marker_color=self.trace_specs['precip_color'],
-                        name=loc,
-                        **kwargs
-                    ),
+                self.add_downsampled_trace(
+                    go.Bar,
+                    x=x,
+                    y=y,
                     row=row,
-                    col=col
+                    col=col,
+                    max_points=max_points,
+                    # bars are totals, min/max downsampling would drop most of the rain
+                    method='sum',
+                    marker_color=self.trace_specs['precip_color'],
+                    name=loc,
+                    **kwargs
                 )
             if type == 'lines':
-                self.add_trace(
-                    go.Scattergl(
-                        x=list(df.iloc[:, 0]),
-                        y=list(df.loc[:, loc]),
-                        name=loc,
-                        mode='lines',
-                        line_color=self.trace_specs['precip_color'],
-                        line_width=self.trace_specs['precip_width'],
-                        **kwargs
-                    ),
+                self.add_downsampled_trace(
+                    go.Scattergl,
+                    x=x,
+                    y=y,
                     row=row,
-                    col=col
+                    col=col,
+                    max_points=max_points,
+                    name=loc,
+                    mode='lines',
+                    line_color=self.trace_specs['precip_color'],
+                    line_width=self.trace_specs['precip_width'],
+                    **kwargs
                 )
             self.fig.update_yaxes(
                 title_text="Rainfall (in)",
@@ -373,6 +404,8 @@ class Subplot:
             )
 
     def add_map(self, locs: Path, loc_name_field='ExploName', row=1, col=2):
+        import geopandas as gpd
+        import shapely as shp
         gdf_locs = gpd.read_file(locs)
         map_center = shp.MultiPoint(gdf_locs.geometry).centroid
         map_center = dict(
@@ -381,8 +414,8 @@ class Subplot:
         )
         self.add_trace(
             go.Scattermapbox(
-                lat=gdf_locs.geometry.y.to_list(),
-                lon=gdf_locs.geometry.x.to_list(),
+                lat=gdf_locs.geometry.y.to_numpy(),
+                lon=gdf_locs.geometry.x.to_numpy(),
                 mode='markers',
                 text=gdf_locs.loc[:, loc_name_field],
                 hovertemplate=gdf_locs.loc[:, loc_name_field] +
@@ -411,9 +444,8 @@ def get_fig():
     fig.add_water_levels(df=hand_data, mode='markers', marker_size=5)
     fig.add_precip(precip_data, cols_to_plot=3, type='lines')
 
-    # Save/pickle the fig
-    with open(data_dir.joinpath('Ten_Trails.fig'), 'wb') as f:
-        pickle.dump(fig.fig, f)
+    # Save the fig as plotly json, not a pickle, so it can be read with any plotly version
+    fig.fig.write_json(data_dir.joinpath('Ten_Trails.json'))
 
     return
 
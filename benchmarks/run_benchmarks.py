@@ -0,0 +1,316 @@
+"""Benchmarks of the cross-section hot paths, on synthetic data, compared against a stored baseline.
+
+Run headless, without QGIS: ``python benchmarks/run_benchmarks.py``. Each stage runs at growing sizes
+(boring layers of 10^2 to 10^6 features, profiles of 10^2 to 10^5 stations) and records its median wall time
+and, in a separate run, its peak memory traced by tracemalloc. ``--save-baseline`` stores the results;
+later runs are compared against them and the check fails if a stage got slower or bigger than the
+threshold allows. Baselines are only comparable on the same machine. Stages that need QGIS, plotly or
+bokeh are skipped when those are not installed.
+
+benchmarks/baseline.json is the baseline of the quick scale, stored from the machine the regression check runs
+on. When that machine changes, or a change is meant to be slower, store a new one with ``--save-baseline``
+and commit it with the change.
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+import synthetic
+from synthetic import engine
+
+BASELINE_PATH = Path(__file__).parent.joinpath('baseline.json')
+# relative increase of time or peak memory over the baseline that counts as a regression
+THRESHOLD = 0.25
+# times and peak memory under these are compared as these, differences below them are noise
+TIME_FLOOR_SECONDS = 0.01
+MEMORY_FLOOR_MB = 0.1
+# a stage is repeated until it has run this many times or for this long, the median run counts
+REPEATS = 15
+REPEAT_SECONDS = 3.0
+# offset of the explorations kept for a section, in map units
+TOLERANCE = 100.0
+FEATURE_SIZES = {'quick': [10 ** 2, 10 ** 3, 10 ** 4], 'full': [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]}
+STATION_SIZES = {'quick': [10 ** 2, 10 ** 3, 10 ** 4], 'full': [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5]}
+# vertical tolerance no midpoint is within, so the adaptive sampler refines every interval
+REFINE_EVERYWHERE = -1.0
+# one trace per exploration, larger figures are not realistic
+MAX_FIGURE_EXPLORATIONS = 10 ** 3
+
+
+@dataclass
+class Benchmark:
+    name: str
+    # 'features' or 'stations'
+    size_kind: str
+    # callable taking the size and the shared data, returning the state run() is given
+    setup: callable
+    # callable taking the state, the code that is measured
+    run: callable
+    requires: tuple = ()
+    max_size: int = None
+
+
+def has_modules(modules) -> bool:
+    for module in modules:
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except (ImportError, ValueError):
+            found = False
+        if not found:
+            return False
+    return True
+
+
+def setup_section(size: int, data: dict) -> engine.CrossSection:
+    return engine.build_cross_section(
+        data['line'], data['dem'], num_points=size, tolerance=TOLERANCE, **data['borings']
+    )
+
+
+def setup_adaptive_profile(size: int, data: dict) -> tuple:
+    """
+    Finest station spacing for size stations. The benchmark refines every interval down to that spacing, the worst
+    case of the adaptive sampler, see REFINE_EVERYWHERE. Intervals are split until they are no longer than the
+    spacing, so the profile has between one and two times size stations.
+    """
+    line_length = engine.sampling.cumulative_length(data['line'])[-1]
+    return data['line'], data['dem'], line_length / size
+
+
+def run_plotly_figure(section):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    engine.plotting.plot_cross_section(fig, section, renderer='plotly')
+    fig.to_json()
+
+
+def run_bokeh_figure(section):
+    from bokeh.embed import json_item
+    from bokeh_fig import BokehFig
+    fig = BokehFig()
+    engine.plotting.plot_cross_section(fig, section, renderer='bokeh')
+    json_item(fig.f)
+
+
+def run_plotly_explorations(explorations):
+    import plotly.graph_objects as go
+    engine.plotting.add_nearby_explo_lines(go.Figure(), explorations, renderer='plotly')
+
+
+def run_bokeh_explorations(explorations):
+    from bokeh_fig import BokehFig
+    engine.plotting.add_nearby_explo_lines(BokehFig(), explorations, renderer='bokeh')
+
+
+def setup_spatial_index(size: int, data: dict) -> dict:
+    points = synthetic.make_borings(data['dem'], size)['points']
+    return {'points': points, 'query': engine.corridor.get_envelope(data['line'], TOLERANCE)}
+
+
+def run_spatial_index(state: dict):
+    """QgsSpatialIndex build and a query with the envelope of a buffered line, like gis.SpatialIndexCache"""
+    import qgis.core as core
+    spatial_index = core.QgsSpatialIndex()
+    for fid, (x, y) in enumerate(state['points'].tolist()):
+        spatial_index.addFeature(fid, core.QgsRectangle(x, y, x, y))
+    spatial_index.intersects(core.QgsRectangle(*state['query']))
+
+
+BENCHMARKS = [
+    Benchmark(
+        'sample_profile', 'stations',
+        setup=lambda size, data: (data['line'], data['dem'], size),
+        run=lambda state: engine.sample_profile(state[0], state[1], num_points=state[2], interpolation='bilinear'),
+    ),
+    Benchmark(
+        'sample_profile_adaptive', 'stations',
+        setup=setup_adaptive_profile,
+        run=lambda state: engine.sample_profile_adaptive(
+            state[0], state[1], pixel_size=state[2], vertical_tolerance=REFINE_EVERYWHERE
+        ),
+    ),
+    Benchmark(
+        'project_points_to_line', 'features',
+        setup=lambda size, data: (data['line'], synthetic.make_borings(data['dem'], size)['points']),
+        run=lambda state: engine.project_points_to_line(*state),
+    ),
+    Benchmark(
+        'project_explorations', 'features',
+        setup=lambda size, data: (data['line'], data['dem'], synthetic.make_borings(data['dem'], size)),
+        run=lambda state: engine.project_explorations(state[0], dem=state[1], tolerance=TOLERANCE, **state[2]),
+    ),
+    Benchmark(
+        'corridor_sweep', 'features',
+        setup=lambda size, data: (data['lines'], synthetic.make_borings(data['dem'], size)['points']),
+        run=lambda state: engine.sweep_corridors(state[0], state[1], TOLERANCE),
+    ),
+    Benchmark(
+        'qgs_spatial_index', 'features',
+        setup=setup_spatial_index,
+        run=run_spatial_index,
+        requires=('qgis',),
+    ),
+    Benchmark(
+        'add_nearby_explo_lines_plotly', 'features',
+        setup=lambda size, data: synthetic.make_explorations(size),
+        run=run_plotly_explorations,
+        requires=('plotly',),
+        max_size=MAX_FIGURE_EXPLORATIONS,
+    ),
+    Benchmark(
+        'add_nearby_explo_lines_bokeh', 'features',
+        setup=lambda size, data: synthetic.make_explorations(size),
+        run=run_bokeh_explorations,
+        requires=('bokeh', 'pandas'),
+        max_size=MAX_FIGURE_EXPLORATIONS,
+    ),
+    Benchmark(
+        'figure_plotly', 'stations',
+        setup=setup_section,
+        run=run_plotly_figure,
+        requires=('plotly', 'pandas'),
+    ),
+    Benchmark(
+        'figure_bokeh', 'stations',
+        setup=setup_section,
+        run=run_bokeh_figure,
+        requires=('bokeh', 'pandas'),
+    ),
+]
+
+
+def measure(benchmark: Benchmark, state) -> dict:
+    """
+    Peak memory of one run, with tracemalloc only on for that run, which also warms up the stage, then the median
+    wall time of a few more runs
+    :return: dict with 'seconds', 'peak_mb' and 'runs'
+    """
+    tracemalloc.start()
+    try:
+        benchmark.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times = []
+    while len(times) < REPEATS and sum(times) < REPEAT_SECONDS:
+        start = time.perf_counter()
+        benchmark.run(state)
+        times.append(time.perf_counter() - start)
+    return {'seconds': float(np.median(times)), 'peak_mb': peak / 2 ** 20, 'runs': len(times)}
+
+
+def run_benchmarks(scale: str = 'quick', only: list = None, on_result=None) -> dict:
+    """
+    Runs the benchmarks
+    :param scale: 'quick' or 'full', see FEATURE_SIZES and STATION_SIZES
+    :param only: optional names of the benchmarks to run
+    :param on_result: optional callable called with (key, result) after each run
+    :return: dict with '<name>/<size>' keys and the results of measure() as values
+    """
+    data = {}
+    results = {}
+    for benchmark in BENCHMARKS:
+        if only and benchmark.name not in only:
+            continue
+        if not has_modules(benchmark.requires):
+            print(f"{benchmark.name}: skipped, needs {', '.join(benchmark.requires)}")
+            continue
+        if not data:
+            dem = synthetic.make_dem()
+            data = {
+                'dem': dem,
+                'line': synthetic.make_line(dem),
+                'lines': synthetic.make_lines(dem),
+                'borings': synthetic.make_borings(dem, 100),
+            }
+        sizes = (FEATURE_SIZES if benchmark.size_kind == 'features' else STATION_SIZES)[scale]
+        for size in sizes:
+            if benchmark.max_size is not None and size > benchmark.max_size:
+                continue
+            key = f'{benchmark.name}/{size}'
+            result = measure(benchmark, benchmark.setup(size, data))
+            result['size_kind'] = benchmark.size_kind
+            results[key] = result
+            if on_result is not None:
+                on_result(key, result)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """
+    :return: list of (key, measure, ratio) of the results more than threshold over their baseline
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for measure_name, floor in (('seconds', TIME_FLOOR_SECONDS), ('peak_mb', MEMORY_FLOOR_MB)):
+            ratio = max(result[measure_name], floor) / max(reference[measure_name], floor)
+            if ratio > 1 + threshold:
+                regressions.append((key, measure_name, ratio))
+    return regressions
+
+
+def format_result(key: str, result: dict, reference: dict = None) -> str:
+    line = f"{key:<42} {result['seconds'] * 1000:10.2f} ms {result['peak_mb']:9.1f} MB"
+    if reference is not None:
+        line += (f"   {result['seconds'] / max(reference['seconds'], 1e-9):5.2f}x time"
+                 f"  {result['peak_mb'] / max(reference['peak_mb'], 1e-9):5.2f}x memory")
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(FEATURE_SIZES), default='quick',
+                        help='sizes to run, full goes up to 10^6 features and 10^5 stations')
+    parser.add_argument('--only', nargs='+', choices=[benchmark.name for benchmark in BENCHMARKS],
+                        help='benchmarks to run, all by default')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help='baseline json file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative increase over the baseline that fails the check')
+    parser.add_argument('--output', type=Path, help='also write the results to this json file')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline.is_file() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())['results']
+
+    def on_result(key, result):
+        print(format_result(key, result, baseline.get(key)), flush=True)
+
+    results = run_benchmarks(scale=args.scale, only=args.only, on_result=on_result)
+    report = {
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        if args.baseline.is_file():
+            # keep the baseline of sizes and stages that were not run
+            report['results'] = dict(json.loads(args.baseline.read_text())['results'], **results)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f'baseline saved to {args.baseline}')
+        return
+    if not baseline:
+        print(f'no baseline at {args.baseline}, run with --save-baseline to store one')
+        return
+    regressions = compare(results, baseline, threshold=args.threshold)
+    for key, measure_name, ratio in regressions:
+        print(f'regression: {key} {measure_name} is {ratio:.2f}x the baseline')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Synthetic inputs for the benchmarks: DEMs, section lines and boring layers of any size.
+
+Everything is generated from a seed, so every run of a benchmark sees the same data.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+PLUGIN_DIR = Path(__file__).parent.parent
+if str(PLUGIN_DIR) not in sys.path:
+    sys.path.insert(0, str(PLUGIN_DIR))
+
+import engine  # noqa: E402
+
+SEED = 0
+# side of the synthetic DEM in cells, and its cell size in map units
+DEM_CELLS = 4000
+PIXEL_SIZE = 3.0
+
+
+def make_dem(cells: int = DEM_CELLS, pixel_size: float = PIXEL_SIZE, seed: int = SEED) -> engine.Dem:
+    """Rolling terrain with some noise, in memory"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:cells, 0:cells].astype(np.float32)
+    z = (
+        400.0
+        + 30.0 * np.sin(cols / 150.0) * np.cos(rows / 210.0)
+        + 0.02 * rows
+        + rng.normal(0.0, 0.3, (cells, cells)).astype(np.float32)
+    )
+    return engine.Dem(z.astype(np.float32), (0.0, pixel_size, 0.0, cells * pixel_size, 0.0, -pixel_size))
+
+
+def get_extent(dem: engine.Dem) -> tuple:
+    """(xmin, ymin, xmax, ymax) of a DEM"""
+    x0, pixel_width, _, y0, _, pixel_height = dem.geotransform
+    rows, cols = dem.shape
+    return x0, y0 + rows * pixel_height, x0 + cols * pixel_width, y0
+
+
+def make_line(dem: engine.Dem, num_vertices: int = 50, seed: int = SEED) -> np.ndarray:
+    """A wandering line across most of the DEM, as an (n, 2) vertex array"""
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = get_extent(dem)
+    margin = 0.05 * (xmax - xmin)
+    xs = np.linspace(xmin + margin, xmax - margin, num_vertices)
+    ys = np.linspace(ymin + margin, ymax - margin, num_vertices) + rng.normal(0.0, margin / 4, num_vertices)
+    return np.column_stack((xs, np.clip(ys, ymin + margin, ymax - margin)))
+
+
+def make_lines(dem: engine.Dem, num_lines: int = 20, seed: int = SEED) -> dict:
+    """Parallel and crossing section lines, as a dict of names and vertex arrays"""
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = get_extent(dem)
+    lines = {}
+    for i in range(num_lines):
+        start = rng.uniform((xmin, ymin), (xmax, ymax))
+        end = rng.uniform((xmin, ymin), (xmax, ymax))
+        lines[f'L{i}'] = np.linspace(start, end, 5)
+    return lines
+
+
+def make_borings(dem: engine.Dem, num_borings: int, seed: int = SEED) -> dict:
+    """
+    Boring layer scattered over the DEM
+    :return: dict with 'points', 'names' and 'depths', the exploration keyword arguments of
+        engine.build_cross_section(). A tenth of the borings have no depth.
+    """
+    rng = np.random.default_rng(seed)
+    xmin, ymin, xmax, ymax = get_extent(dem)
+    depths = rng.uniform(5.0, 60.0, num_borings)
+    return {
+        'points': rng.uniform((xmin, ymin), (xmax, ymax), (num_borings, 2)),
+        'names': [f'B-{i}' for i in range(num_borings)],
+        'depths': [None if i % 10 == 0 else float(depth) for i, depth in enumerate(depths)],
+    }
+
+
+def make_explorations(num_explorations: int, line_length: float = 10000.0, seed: int = SEED) -> dict:
+    """Projected explorations in the layout of CrossSection.explorations, without building a section"""
+    rng = np.random.default_rng(seed)
+    explorations = {}
+    for i in range(num_explorations):
+        depth = None if i % 10 == 0 else float(rng.uniform(5.0, 60.0))
+        x, y = rng.uniform(0.0, line_length, 2)
+        explorations[f'B-{i}'] = {
+            'distanceAlongLine': float(rng.uniform(0.0, line_length)),
+            'Dist': float(rng.uniform(0.0, 100.0)),
+            'minDistX': float(x),
+            'minDistY': float(y),
+            'nextVertexIndex': 1,
+            'leftOrRightOfSegment': 1,
+            'lidar': float(rng.uniform(380.0, 460.0)),
+            'ExploDepth': depth,
+            'projectNumber': None,
+            'intervals': None,
+        }
+    return explorations
@@ -7,6 +7,7 @@ from bokeh.models.tools import (
 )
 from bokeh.models import ColumnDataSource, Legend
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 
@@ -16,6 +17,7 @@ class BokehFig:
     def __init__(self, webgl=True, *args, **kwargs):
         #  Setup figure and data sources for drawn points and polys
         self.f = figure(*args, **kwargs)
+        self._legend_placed = False
         self.drawn_points_data = ColumnDataSource(data=dict(x=[], y=[]))
         self.drawn_points = self.f.scatter(x='x', y='y', source=self.drawn_points_data, size=10, color='blue')
         self.drawn_polys_data = ColumnDataSource(data=dict(xs=[], ys=[]))
@@ -68,13 +70,28 @@ class BokehFig:
         self.f.yaxis.update(**axis_props)
 
     def show(self):
+        self.place_legend()
+        return bkp.show(self.f)
+
+    def write_html(self, file_path, title='X-Section', **kwargs):
+        """Writes the figure to a standalone html file, like plotly's Figure.write_html()"""
+        self.place_legend()
+        return bkp.save(self.f, filename=file_path, title=title)
+
+    def place_legend(self):
+        if self._legend_placed:
+            return
         self.f.legend.click_policy = "hide"
         #  set legend location to left outside the plot
         legend = self.f.legend[0]
         self.f.add_layout(legend, place='left')
-        return bkp.show(self.f)
+        self._legend_placed = True
 
     def line(self, legend_label='None', *args, **kwargs):
+        # array data is kept as numpy arrays so bokeh sends it as binary, not as lists
+        for key in ('x', 'y'):
+            if key in kwargs and not isinstance(kwargs[key], str):
+                kwargs[key] = np.asarray(kwargs[key])
         return self.f.line(legend_label=legend_label, *args, **kwargs)
 
 
@@ -0,0 +1,44 @@
+"""Headless cross-section engine.
+
+Profile sampling, exploration projection and figure building on plain
+coordinates and arrays, so sections can be computed without a running QGIS.
+To use it outside QGIS, put the plugin folder on sys.path and ``import engine``.
+
+Only numpy is imported with the package. The modules that need pandas (plotting,
+the exploration database and store) are imported on first access, so loading the
+plugin does not load them.
+"""
+import importlib
+
+from .cache import ProfileCache
+from .corridor import sweep_corridors
+from .dem import Dem, GeoTiffDem, ReprojectedDem, open_dem
+from .projection import project_points_to_line
+from .sampling import sample_array, sample_points, sample_profile, sample_profile_adaptive, sample_profiles
+from .section import CrossSection, build_cross_section, project_explorations
+from .section_io import SectionFile, load_section, save_section
+from .trace import Tracer, tracer
+
+# attributes imported on first access, and their modules
+_LAZY_ATTRIBUTES = {
+    'batch': '.batch',
+    'export': '.export',
+    'live_plot': '.live_plot',
+    'lod': '.lod',
+    'plotting': '.plotting',
+    'ExplorationDatabase': '.explorations',
+    'ExplorationStore': '.store',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+    value = module if module.__name__.endswith(f'.{name}') else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -0,0 +1,363 @@
+"""Batch generation of cross-sections for every line of a layer, over a process pool.
+
+Each worker opens the DEM and loads the explorations once, then samples the profile, projects the
+explorations and exports the figure of each line it is given. The output folder gets one file per line
+and format, plus index.csv and index.html listing them. From the command line:
+
+    python -m engine.batch lines.gpkg dem.tif -o sections --explorations explorations.gpkg --formats html pdf
+"""
+import argparse
+import csv
+import html
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from .corridor import sweep_corridors
+from .dem import open_dem
+from .section import build_cross_section
+
+FORMATS = ('html', 'pdf', 'png', 'svg')
+INDEX_COLUMNS = ['name', 'length', 'explorations', 'seconds', 'export_seconds', 'files', 'error']
+
+# per process state, set by _init_worker()
+_worker = {}
+
+
+def get_python_executable() -> str:
+    """
+    Python interpreter for worker processes. Inside QGIS sys.executable is the QGIS application itself,
+    which must not be used to spawn workers.
+    """
+    executable = Path(sys.executable)
+    if executable.stem.lower().startswith('python'):
+        return str(executable)
+    for folder in (Path(sys.exec_prefix), Path(sys.exec_prefix).joinpath('bin')):
+        for name in ('python.exe', 'python3', 'python'):
+            if folder.joinpath(name).is_file():
+                return str(folder.joinpath(name))
+    return str(executable)
+
+
+def to_file_name(name) -> str:
+    """Line name usable as a file name"""
+    return re.sub(r'[^\w\-. ]+', '_', str(name)).strip() or 'line'
+
+
+def read_lines(path, name_field: str = None, layer: str = None) -> dict:
+    """
+    Reads the lines of a vector file with geopandas. Multi-part lines are reduced to their first part.
+    :param path: any file geopandas can read
+    :param name_field: attribute to name the lines by, defaults to their row number
+    :param layer: layer of multi-layer files, e.g. in a GeoPackage
+    :return: dict with line names as keys and (n, 2) vertex arrays as values, and the file's CRS
+    """
+    import geopandas as gpd
+    import shapely
+
+    gdf = gpd.read_file(path, layer=layer)
+    lines = {}
+    for i, (index, row) in enumerate(gdf.iterrows()):
+        geometry = row.geometry
+        if geometry is None or geometry.is_empty:
+            continue
+        if geometry.geom_type == 'MultiLineString':
+            geometry = geometry.geoms[0]
+        name = row[name_field] if name_field is not None else i
+        lines[str(name)] = shapely.get_coordinates(geometry)[:, :2]
+    return lines, gdf.crs
+
+
+def read_explorations(path, name_field: str = 'ExploName', depth_field: str = 'ExploDepth', crs=None) -> dict:
+    """
+    Reads exploration points (or the centroids of other geometries) of a vector file with geopandas
+    :param crs: CRS to reproject the explorations to, e.g. the lines' CRS
+    :return: dict with the keys 'points', 'names' and 'depths', see project_explorations()
+    """
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path)
+    if crs is not None and gdf.crs is not None and gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+    centroids = gdf.geometry.centroid
+    depths = None
+    if depth_field in gdf.columns:
+        depths = [None if depth != depth else float(depth) for depth in gdf[depth_field]]
+    return {
+        'points': np.column_stack((centroids.x.to_numpy(), centroids.y.to_numpy())),
+        'names': [str(name) for name in gdf[name_field]],
+        'depths': depths,
+    }
+
+
+def _init_worker(dem, explorations: dict, exploration_database, settings: dict):
+    """Opens the DEM and loads the exploration intervals once per worker process"""
+    _worker['dem'] = open_dem(dem)
+    _worker['explorations'] = explorations
+    _worker['intervals'] = None
+    if exploration_database is not None:
+        from .explorations import ExplorationDatabase
+        _worker['intervals'] = ExplorationDatabase(exploration_database).intervals_by_exploration
+    _worker['settings'] = settings
+    if any(file_format != 'html' for file_format in settings['formats']):
+        from .export import try_warm_up
+        try_warm_up()
+
+
+def make_figure(section, title: str, stratigraphy: bool = False):
+    """Plotly figure of a CrossSection, see plotting.plot_cross_section()"""
+    import plotly.graph_objects as go
+    from .plotting import plot_cross_section
+
+    fig = go.Figure()
+    plot_cross_section(fig, section, renderer='plotly', stratigraphy=stratigraphy)
+    fig.update_layout(
+        title=title,
+        xaxis_title='Distance Along Line (ft)',
+        yaxis_title='Elevation (ft)',
+        plot_bgcolor='white',
+    )
+    return fig
+
+
+def export_figure(fig, output_dir: Path, file_stem: str, formats) -> list:
+    """
+    Writes the figure once per format. Images are written by this process' renderer, started once per worker.
+    :return: list of the export stats of each file, see export.write_image_job()
+    """
+    from .export import write_image_job
+
+    exports = []
+    for file_format in formats:
+        file_path = output_dir.joinpath(f'{file_stem}.{file_format}')
+        if file_format == 'html':
+            start = time.perf_counter()
+            fig.write_html(file_path, include_plotlyjs='cdn', config={'scrollZoom': True})
+            exports.append({
+                'path': str(file_path),
+                'format': file_format,
+                'seconds': round(time.perf_counter() - start, 3),
+                'bytes': file_path.stat().st_size,
+                'error': None,
+            })
+        else:
+            exports.append(write_image_job(fig, file_path, format=file_format))
+    return exports
+
+
+def run_section_job(name: str, line, exploration_index=None) -> dict:
+    """
+    Builds and exports the cross-section of one line, in a worker process
+    :param exploration_index: optional indices of the explorations near the line, see corridor.sweep_corridors().
+        None projects all explorations.
+    :return: dict with the keys of INDEX_COLUMNS
+    """
+    settings = _worker['settings']
+    start = time.perf_counter()
+    result = {
+        'name': name, 'length': None, 'explorations': 0, 'seconds': None, 'export_seconds': None, 'files': [],
+        'error': None
+    }
+    try:
+        explorations = _worker['explorations'] or {}
+        if explorations and exploration_index is not None:
+            depths = explorations.get('depths')
+            explorations = {
+                'points': np.asarray(explorations['points'], dtype=float).reshape(-1, 2)[exploration_index],
+                'names': [explorations['names'][i] for i in exploration_index],
+                'depths': [depths[i] for i in exploration_index] if depths is not None else None,
+            }
+        section = build_cross_section(
+            line,
+            _worker['dem'],
+            points=explorations.get('points'),
+            names=explorations.get('names'),
+            depths=explorations.get('depths'),
+            tolerance=settings['tolerance'],
+            num_points=settings['num_points'],
+            interpolation=settings['interpolation'],
+            intervals=_worker['intervals'],
+        )
+        fig = make_figure(section, title=name, stratigraphy=_worker['intervals'] is not None)
+        exports = export_figure(fig, Path(settings['output_dir']), to_file_name(name), settings['formats'])
+        result['files'] = [Path(export['path']).name for export in exports if export['error'] is None]
+        result['export_seconds'] = round(sum(export['seconds'] for export in exports), 3)
+        errors = [export['error'] for export in exports if export['error'] is not None]
+        if errors:
+            result['error'] = '; '.join(errors)
+        result['length'] = round(section.length, 2)
+        result['explorations'] = len(section.explorations)
+    except Exception as e:
+        result['error'] = repr(e)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(
+        lines: dict,
+        dem,
+        output_dir,
+        explorations: dict = None,
+        exploration_database=None,
+        formats=('html',),
+        num_points: int = 1000,
+        interpolation: str = 'nearest',
+        tolerance: float = None,
+        max_workers: int = None,
+        on_progress=None,
+        is_canceled=None,
+) -> list:
+    """
+    Builds and exports the cross-section of every line over a pool of worker processes
+    :param lines: dict with line names as keys and (n, 2) vertex arrays as values, in the DEM's CRS
+    :param dem: path of the DEM, or a picklable DEM source such as engine.Dem
+    :param output_dir: folder for the figures and the index, created if needed
+    :param explorations: optional dict with 'points', 'names' and 'depths', see read_explorations()
+    :param exploration_database: optional path of the exploration database csv, to plot unit intervals
+    :param formats: any of FORMATS. Formats other than html need kaleido.
+    :param num_points: number of intervals along each line, None to space stations from the DEM resolution
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :param tolerance: optional max offset of explorations from a line. With a tolerance, the explorations are
+        assigned to the lines in one corridor sweep up front and each worker only projects its line's explorations
+    :param max_workers: number of processes, defaults to the number of cores
+    :param on_progress: optional callable called with (number done, number of lines, result) after each line
+    :param is_canceled: optional callable, lines not started yet are skipped once it returns True
+    :return: list of results, one dict per line in the order of lines, see run_section_job()
+    """
+    unknown_formats = set(formats) - set(FORMATS)
+    if unknown_formats:
+        raise ValueError(f'unknown formats: {", ".join(sorted(unknown_formats))}')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    settings = {
+        'output_dir': str(output_dir),
+        'formats': list(formats),
+        'num_points': num_points,
+        'interpolation': interpolation,
+        'tolerance': tolerance,
+    }
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(lines), 1))
+    # spawn, so workers do not inherit the state of a QGIS or Qt parent process
+    mp_context = multiprocessing.get_context('spawn')
+    mp_context.set_executable(get_python_executable())
+
+    exploration_indexes = dict.fromkeys(lines)
+    if explorations and tolerance is not None:
+        corridors = sweep_corridors(lines, explorations['points'], tolerance)
+        exploration_indexes = {name: corridor['index'] for name, corridor in corridors.items()}
+
+    results = {}
+    with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(dem, explorations, exploration_database, settings),
+    ) as executor:
+        futures = {
+            executor.submit(run_section_job, name, np.asarray(line), exploration_indexes[name]): name
+            for name, line in lines.items()
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_progress is not None:
+                on_progress(len(results), len(lines), result)
+            if is_canceled is not None and is_canceled():
+                for pending in futures:
+                    pending.cancel()
+                break
+    results = [results[name] for name in lines if name in results]
+    write_index(results, output_dir)
+    return results
+
+
+def write_index(results: list, output_dir: Path):
+    """Writes index.csv and index.html, listing each line's files, length, explorations, time and error"""
+    with open(output_dir.joinpath('index.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_COLUMNS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(dict(result, files=' '.join(result['files'])))
+
+    rows = []
+    for result in results:
+        links = ' '.join(f'<a href="{html.escape(file)}">{html.escape(Path(file).suffix[1:])}</a>'
+                         for file in result['files'])
+        rows.append(
+            '<tr>' + ''.join(f'<td>{cell}</td>' for cell in (
+                html.escape(result['name']),
+                '' if result['length'] is None else result['length'],
+                result['explorations'],
+                result['seconds'],
+                '' if result['export_seconds'] is None else result['export_seconds'],
+                links,
+                html.escape(result['error'] or ''),
+            )) + '</tr>'
+        )
+    header = ''.join(f'<th>{column}</th>' for column in INDEX_COLUMNS)
+    output_dir.joinpath('index.html').write_text(
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Cross-sections</title></head><body>\n'
+        f'<table border="1" cellspacing="0" cellpadding="4">\n<tr>{header}</tr>\n' + '\n'.join(rows) +
+        '\n</table>\n</body></html>\n'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds a cross-section for every line of a layer')
+    parser.add_argument('lines', help='vector file with the section lines')
+    parser.add_argument('dem', help='DEM GeoTIFF, in the lines\' CRS')
+    parser.add_argument('-o', '--output-dir', default='sections')
+    parser.add_argument('--layer', help='layer of the lines file')
+    parser.add_argument('--name-field', help='attribute to name the lines by')
+    parser.add_argument('--explorations', help='vector file with the exploration points')
+    parser.add_argument('--exploration-name-field', default='ExploName')
+    parser.add_argument('--exploration-depth-field', default='ExploDepth')
+    parser.add_argument('--exploration-database', help='exploration database csv, to plot unit intervals')
+    parser.add_argument('--formats', nargs='+', default=['html'], choices=FORMATS)
+    parser.add_argument('--num-points', type=int, default=1000)
+    parser.add_argument('--interpolation', default='nearest', choices=['nearest', 'bilinear', 'cubic'])
+    parser.add_argument('--tolerance', type=float, help='max offset of explorations from a line')
+    parser.add_argument('--workers', type=int, help='number of processes, defaults to the number of cores')
+    args = parser.parse_args()
+
+    lines, crs = read_lines(args.lines, name_field=args.name_field, layer=args.layer)
+    explorations = None
+    if args.explorations:
+        explorations = read_explorations(
+            args.explorations,
+            name_field=args.exploration_name_field,
+            depth_field=args.exploration_depth_field,
+            crs=crs
+        )
+
+    def on_progress(done, total, result):
+        status = result['error'] or ', '.join(result['files'])
+        print(f"[{done}/{total}] {result['name']}: {status} ({result['seconds']} s)")
+
+    start = time.perf_counter()
+    results = run_batch(
+        lines,
+        args.dem,
+        args.output_dir,
+        explorations=explorations,
+        exploration_database=args.exploration_database,
+        formats=args.formats,
+        num_points=args.num_points,
+        interpolation=args.interpolation,
+        tolerance=args.tolerance,
+        max_workers=args.workers,
+        on_progress=on_progress,
+    )
+    failed = sum(result['error'] is not None for result in results)
+    print(f'{len(results)} sections in {time.perf_counter() - start:.1f} s, {failed} failed')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
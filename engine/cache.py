@@ -0,0 +1,137 @@
+"""LRU cache of computed ground profiles."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class ProfileCache:
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, cache_dir: Path = None, max_disk_bytes: int = 2 ** 30):
+        """
+        Keeps recently computed (x, z) profiles in memory, least recently used first out. Safe to use
+        from background tasks. Cached arrays are read-only, they are shared by every get() of their profile.
+        :param max_bytes: memory limit of the cached arrays, in bytes
+        :param cache_dir: optional folder to also save profiles to, so they survive between sessions
+        :param max_disk_bytes: size limit of the cache folder, in bytes. The least recently used files are
+            deleted first.
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self._profiles = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(line_wkb: bytes, line_crs: str, dem_id: str, dem_timestamp, spacing, interpolation: str) -> str:
+        """
+        Cache key of a profile
+        :param line_wkb: WKB of the profile line, or any bytes that identify its geometry
+        :param line_crs: id of the line's CRS, e.g. its authid; the DEM is sampled in this CRS
+        :param dem_id: id of the DEM, e.g. the raster layer id or file path
+        :param dem_timestamp: anything that changes when the DEM's data changes, e.g. the provider's
+            data timestamp or the file's mtime
+        :param spacing: the sampling settings, e.g. num_points or the station spacing
+        :param interpolation: the interpolation mode
+        :return: hex digest
+        """
+        key = hashlib.sha1(bytes(line_wkb))
+        for part in (line_crs, dem_id, dem_timestamp, spacing, interpolation):
+            key.update(b'\0')
+            key.update(str(part).encode('utf-8'))
+        return key.hexdigest()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def __contains__(self, key):
+        return key in self._profiles or (self.cache_dir is not None and self.get_cache_file(key).is_file())
+
+    def get(self, key: str):
+        """
+        :return: the cached (x, z) tuple of read-only arrays, or None if the profile is not cached
+        """
+        with self._lock:
+            if key in self._profiles:
+                self._profiles.move_to_end(key)
+                return self._profiles[key]
+        if self.cache_dir is None:
+            return None
+        cache_file = self.get_cache_file(key)
+        try:
+            with np.load(cache_file) as saved:
+                profile = _read_only(saved['x']), _read_only(saved['z'])
+            # the modification time orders the files for pruning, see prune_disk()
+            os.utime(cache_file)
+        except FileNotFoundError:
+            # not cached, or pruned meanwhile by another task
+            return None
+        self._add(key, profile)
+        return profile
+
+    def put(self, key: str, x, z):
+        """Caches a copy of a profile, evicting the least recently used profiles over the memory and disk limits"""
+        profile = _read_only(np.array(x)), _read_only(np.array(z))
+        self._add(key, profile)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            np.savez(self.get_cache_file(key), x=profile[0], z=profile[1])
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Deletes the least recently used files of the cache folder until it is within max_disk_bytes"""
+        files = []
+        for cache_file in self.cache_dir.glob('*.npz'):
+            try:
+                stat = cache_file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, cache_file))
+        total = sum(size for _, size, _ in files)
+        for _, size, cache_file in sorted(files, key=lambda item: item[0]):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                cache_file.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self, disk: bool = False):
+        """Empties the memory cache, and the cache folder if 'disk' is True"""
+        with self._lock:
+            self._profiles.clear()
+            self._nbytes = 0
+        if disk and self.cache_dir is not None:
+            for cache_file in self.cache_dir.glob('*.npz'):
+                cache_file.unlink()
+
+    def get_cache_file(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f'{key}.npz')
+
+    def _add(self, key: str, profile: tuple):
+        nbytes = profile[0].nbytes + profile[1].nbytes
+        with self._lock:
+            if key in self._profiles:
+                old = self._profiles.pop(key)
+                self._nbytes -= old[0].nbytes + old[1].nbytes
+            if nbytes > self.max_bytes:
+                return
+            self._profiles[key] = profile
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._profiles.popitem(last=False)
+                self._nbytes -= evicted[0].nbytes + evicted[1].nbytes
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
@@ -0,0 +1,85 @@
+"""Corridor sweep: the points within a tolerance of each of many lines, in one pass.
+
+For fence diagrams many parallel and crossing lines are sectioned together. Instead of one buffer query per
+line, the points are sorted by x once; each line's corridor (its envelope grown by the tolerance) takes its
+candidates with a binary search on x and a mask on y, and only the candidates are projected onto the line. A
+point is assigned to every corridor it falls in, and the cost grows with the number of points near the lines
+rather than with points times lines.
+"""
+import numpy as np
+
+from .projection import project_points_to_line
+
+
+def get_envelope(line, tolerance: float = 0.0) -> tuple:
+    """
+    Bounding box of a line grown by the tolerance
+    :return: (xmin, ymin, xmax, ymax)
+    """
+    vertices = np.asarray(line, dtype=float)[:, :2]
+    xmin, ymin = vertices.min(axis=0) - tolerance
+    xmax, ymax = vertices.max(axis=0) + tolerance
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def get_union_envelope(lines: dict, tolerance: float = 0.0) -> tuple:
+    """
+    Bounding box of all corridors, to query a spatial index once for every line
+    :param lines: dict with line names as keys and (n, 2) vertex arrays as values
+    :return: (xmin, ymin, xmax, ymax)
+    """
+    envelopes = np.array([get_envelope(line, tolerance) for line in lines.values()]).reshape(-1, 4)
+    return (
+        float(envelopes[:, 0].min()), float(envelopes[:, 1].min()),
+        float(envelopes[:, 2].max()), float(envelopes[:, 3].max()),
+    )
+
+
+def sweep_corridors(lines: dict, points, tolerance: float) -> dict:
+    """
+    Assigns points to the corridor of every line they are within the tolerance of
+    :param lines: dict with line names as keys and (n, 2) vertex arrays as values
+    :param points: (m, 2) array-like of x, y point coordinates, in the lines' CRS
+    :param tolerance: max offset of a point from a line
+    :return: dict with line names as keys and dicts of arrays as values, ordered by distance along the line:
+        'index' - index of each point in points, and the keys of project_points_to_line()
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    order = np.argsort(points[:, 0], kind='stable')
+    sorted_x = points[order, 0]
+    sorted_y = points[order, 1]
+    corridors = {}
+    for name, line in lines.items():
+        xmin, ymin, xmax, ymax = get_envelope(line, tolerance)
+        start = np.searchsorted(sorted_x, xmin, side='left')
+        stop = np.searchsorted(sorted_x, xmax, side='right')
+        candidate_y = sorted_y[start:stop]
+        candidates = order[start:stop][(candidate_y >= ymin) & (candidate_y <= ymax)]
+        projection = project_points_to_line(line, points[candidates])
+        inside = projection['Dist'] <= tolerance
+        along = np.argsort(projection['distanceAlongLine'][inside], kind='stable')
+        corridor = {'index': candidates[inside][along]}
+        corridor.update({key: values[inside][along] for key, values in projection.items()})
+        corridors[name] = corridor
+    return corridors
+
+
+def corridors_to_rows(corridors: dict, names: list = None, attributes: dict = None) -> list:
+    """
+    Flattens a sweep_corridors() result into one row per line and point, e.g. to write a csv
+    :param corridors: result of sweep_corridors()
+    :param names: optional name of each point, by index in the swept points
+    :param attributes: optional dict of extra per-point values to add to the rows, e.g. {'layer': [...]}
+    :return: list of dicts with the keys 'line', 'index', 'name', the keys of project_points_to_line() and
+        the keys of attributes
+    """
+    attributes = attributes or {}
+    rows = []
+    for line_name, corridor in corridors.items():
+        keys = [key for key in corridor if key != 'index']
+        for j, i in enumerate(corridor['index'].tolist()):
+            row = {'line': line_name, 'index': i, 'name': names[i] if names is not None else None}
+            row.update({key: corridor[key][j].item() for key in keys})
+            row.update({key: values[i] for key, values in attributes.items()})
+            rows.append(row)
+    return rows
@@ -0,0 +1,154 @@
+"""DEM sources for the headless engine.
+
+Anything with a read_window(xmin, ymin, xmax, ymax, pad=0) method returning
+(array, geotransform) can be sampled. Dem wraps an in-memory array, GeoTiffDem
+reads windows from a GeoTIFF (or any GDAL raster) on demand. ReprojectedDem
+samples any of them with coordinates in another CRS.
+"""
+import math
+from pathlib import Path
+
+import numpy as np
+
+
+def get_window_indices(geotransform: tuple, shape: tuple, xmin, ymin, xmax, ymax, pad: int = 0) -> tuple:
+    """
+    Row and column range of the cells of a raster under a bounding box
+    :param geotransform: GDAL style geotransform of the full raster
+    :param shape: (rows, cols) of the full raster
+    :param pad: number of extra cells on every side
+    :return: a tuple of (row0, row1, col0, col1), end exclusive
+    """
+    x_origin, pixel_width, _, y_origin, _, pixel_height = geotransform
+    pixel_height = abs(pixel_height)
+    n_rows, n_cols = shape
+    col0 = max(math.floor((xmin - x_origin) / pixel_width) - pad, 0)
+    col1 = min(math.floor((xmax - x_origin) / pixel_width) + 1 + pad, n_cols)
+    row0 = max(math.floor((y_origin - ymax) / pixel_height) - pad, 0)
+    row1 = min(math.floor((y_origin - ymin) / pixel_height) + 1 + pad, n_rows)
+    return row0, row1, col0, col1
+
+
+def get_window_geotransform(geotransform: tuple, row0: int, col0: int) -> tuple:
+    """Geotransform of a window starting at row0, col0 of a raster"""
+    x_origin, pixel_width, _, y_origin, _, pixel_height = geotransform
+    return x_origin + col0 * pixel_width, pixel_width, 0.0, y_origin + row0 * pixel_height, 0.0, pixel_height
+
+
+class Dem:
+    """DEM held in memory as an array plus a GDAL style geotransform"""
+
+    def __init__(self, array, geotransform: tuple, nodata=None, crs: str = None):
+        """
+        :param array: 2d array of elevations, row 0 at the top
+        :param geotransform: (x_origin, pixel_width, 0, y_origin, 0, -pixel_height)
+        :param nodata: optional cell value to treat as missing
+        :param crs: optional CRS of the DEM, e.g. 'EPSG:2286'
+        """
+        array = np.asarray(array, dtype=float)
+        if nodata is not None:
+            array = np.where(array == nodata, np.nan, array)
+        self.array = array
+        self.geotransform = tuple(geotransform)
+        self.crs = crs
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def pixel_size(self) -> float:
+        return abs(self.geotransform[1])
+
+    def read_window(self, xmin, ymin, xmax, ymax, pad: int = 0) -> tuple:
+        row0, row1, col0, col1 = get_window_indices(self.geotransform, self.shape, xmin, ymin, xmax, ymax, pad)
+        window_geotransform = get_window_geotransform(self.geotransform, row0, col0)
+        if row1 <= row0 or col1 <= col0:
+            return np.empty((0, 0)), window_geotransform
+        return self.array[row0:row1, col0:col1], window_geotransform
+
+
+class GeoTiffDem:
+    """DEM read window by window from a GeoTIFF, or any other raster GDAL can open"""
+
+    def __init__(self, path, band: int = 1):
+        try:
+            from osgeo import gdal
+        except ImportError as e:
+            raise ImportError('GDAL (osgeo) is needed to read DEM files, or pass an array to Dem()') from e
+        self.path = Path(path)
+        self.dataset = gdal.Open(str(self.path))
+        if self.dataset is None:
+            raise FileNotFoundError(f'could not open DEM {self.path}')
+        self.band = self.dataset.GetRasterBand(band)
+        self.nodata = self.band.GetNoDataValue()
+        self.geotransform = self.dataset.GetGeoTransform()
+        self.crs = self.dataset.GetProjection() or None
+
+    @property
+    def shape(self):
+        return self.dataset.RasterYSize, self.dataset.RasterXSize
+
+    @property
+    def pixel_size(self) -> float:
+        return abs(self.geotransform[1])
+
+    def read_window(self, xmin, ymin, xmax, ymax, pad: int = 0) -> tuple:
+        row0, row1, col0, col1 = get_window_indices(self.geotransform, self.shape, xmin, ymin, xmax, ymax, pad)
+        window_geotransform = get_window_geotransform(self.geotransform, row0, col0)
+        if row1 <= row0 or col1 <= col0:
+            return np.empty((0, 0)), window_geotransform
+        array = self.band.ReadAsArray(col0, row0, col1 - col0, row1 - row0).astype(float)
+        if self.nodata is not None:
+            array[array == self.nodata] = np.nan
+        return array, window_geotransform
+
+
+class ReprojectedDem:
+    """DEM source sampled with coordinates in another CRS, e.g. the section line's"""
+
+    def __init__(self, dem, transform, pixel_size: float = None):
+        """
+        The samplers compute stations in the line's CRS and transform each station array to the DEM's CRS in
+        one call, see to_dem_crs(). Windows are still read in the DEM's CRS.
+        :param dem: DEM source or path of a GeoTIFF
+        :param transform: callable taking x and y arrays in the line's CRS and returning the x and y arrays in
+            the DEM's CRS
+        :param pixel_size: cell size in the line's units, defaults to the DEM's cell size
+        """
+        self.dem = open_dem(dem)
+        self.transform = transform
+        self._pixel_size = pixel_size
+
+    @property
+    def crs(self):
+        return getattr(self.dem, 'crs', None)
+
+    @property
+    def pixel_size(self) -> float:
+        return self._pixel_size if self._pixel_size is not None else self.dem.pixel_size
+
+    def read_window(self, xmin, ymin, xmax, ymax, pad: int = 0) -> tuple:
+        """Window of the DEM, the bounds are in the DEM's CRS"""
+        return self.dem.read_window(xmin, ymin, xmax, ymax, pad=pad)
+
+
+def to_dem_crs(dem, xs, ys) -> tuple:
+    """
+    Coordinates in the CRS the DEM's windows are read in: transformed in bulk for a ReprojectedDem, as is
+    for any other DEM source
+    :return: tuple of x and y arrays
+    """
+    if isinstance(dem, ReprojectedDem):
+        xs, ys = dem.transform(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+        return np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    return xs, ys
+
+
+def open_dem(dem):
+    """
+    Gets a DEM source from a path, or returns 'dem' as is if it can already read windows
+    """
+    if hasattr(dem, 'read_window'):
+        return dem
+    return GeoTiffDem(dem)
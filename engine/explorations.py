@@ -0,0 +1,196 @@
+"""Loader for the exploration database export (data/Exploration_Database.csv).
+
+The csv has a machine header row (e.g. 'Qvt_Dp_Up_ft') followed by a human header row
+(e.g. 'Qvt Depth Upper (ft)'), uses '--' for nulls and 'BBOH' (below bottom of hole) for unit
+bottoms below the total depth. Each geologic unit has four columns: upper and lower depth and
+upper and lower elevation. The loader turns those into a long table of unit intervals, and caches
+both tables as Parquet next to the source until the source file changes.
+"""
+import re
+from pathlib import Path
+
+import pandas as pd
+
+NULL_VALUES = ['--']
+BELOW_BOTTOM_OF_HOLE = 'BBOH'
+UNIT_COLUMN_PATTERN = re.compile(r'^(?P<unit>.+)_(?P<kind>Dp|El)_(?P<bound>Up|Lw)_ft$')
+INTERVAL_COLUMNS = {
+    ('Dp', 'Up'): 'depth_top',
+    ('Dp', 'Lw'): 'depth_bottom',
+    ('El', 'Up'): 'elev_top',
+    ('El', 'Lw'): 'elev_bottom',
+}
+# columns of the exploration table, and their names in the csv
+EXPLORATION_COLUMNS = {
+    'ExploGID': 'explo_gid',
+    'Exploration': 'exploration',
+    'Log_URL': 'log_url',
+    'Grnd_El_ft': 'ground_elev',
+    'TD_ft': 'total_depth',
+    'TD_El_ft': 'total_depth_elev',
+    'BOH_GeoUnit': 'boh_unit',
+}
+
+
+def read_unit_labels(path) -> dict:
+    """
+    Reads the display name of each unit from the human header row, e.g. {'QviQvt': 'Qvi-Qvt'}
+    """
+    headers = pd.read_csv(path, skiprows=1, nrows=1, header=None, dtype=str)
+    machine_header = pd.read_csv(path, nrows=0).columns
+    labels = {}
+    for column, human_name in zip(machine_header, headers.iloc[0]):
+        match = UNIT_COLUMN_PATTERN.match(column)
+        if match and isinstance(human_name, str):
+            labels[match['unit']] = human_name.split()[0]
+    return labels
+
+
+def read_exploration_database(path) -> pd.DataFrame:
+    """
+    Reads the exploration database csv, skipping the human header row and empty trailing rows
+    :return: DataFrame with the csv's columns, '--' as NaN
+    """
+    df = pd.read_csv(path, skiprows=[1], na_values=NULL_VALUES)
+    return df.dropna(subset=['Exploration']).reset_index(drop=True)
+
+
+def get_exploration_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Typed table of the explorations themselves, one row per exploration
+    """
+    explorations = df[list(EXPLORATION_COLUMNS)].rename(columns=EXPLORATION_COLUMNS)
+    for column in ('ground_elev', 'total_depth', 'total_depth_elev'):
+        explorations[column] = pd.to_numeric(explorations[column], errors='coerce')
+    for column in ('explo_gid', 'exploration', 'log_url', 'boh_unit'):
+        explorations[column] = explorations[column].astype('string')
+    return explorations
+
+
+def get_unit_intervals(df: pd.DataFrame, unit_labels: dict = None) -> pd.DataFrame:
+    """
+    Turns the four *_Dp_Up_ft, *_Dp_Lw_ft, *_El_Up_ft, *_El_Lw_ft columns of each unit into a long table
+    :param df: the exploration database, see read_exploration_database()
+    :param unit_labels: optional display names of the units, see read_unit_labels()
+    :return: DataFrame with columns exploration, unit, unit_label, depth_top, depth_bottom, elev_top,
+        elev_bottom and below_bottom_of_hole, one row per unit found in an exploration, sorted by
+        exploration and depth. Unit bottoms marked BBOH are set to the total depth of the exploration.
+    """
+    unit_columns = {}
+    for column in df.columns:
+        match = UNIT_COLUMN_PATTERN.match(column)
+        if match:
+            unit_columns.setdefault(match['unit'], {})[INTERVAL_COLUMNS[match['kind'], match['bound']]] = column
+    unit_labels = unit_labels or {}
+    total_depth = pd.to_numeric(df['TD_ft'], errors='coerce')
+    total_depth_elev = pd.to_numeric(df['TD_El_ft'], errors='coerce')
+
+    unit_frames = []
+    for unit, columns in unit_columns.items():
+        below_bottom = (df[columns['depth_bottom']] == BELOW_BOTTOM_OF_HOLE).to_numpy()
+        intervals = pd.DataFrame({
+            name: pd.to_numeric(df[column], errors='coerce') for name, column in columns.items()
+        })
+        intervals['depth_bottom'] = intervals['depth_bottom'].mask(below_bottom, total_depth)
+        intervals['elev_bottom'] = intervals['elev_bottom'].mask(below_bottom, total_depth_elev)
+        intervals['below_bottom_of_hole'] = below_bottom
+        intervals['exploration'] = df['Exploration'].to_numpy()
+        intervals['unit'] = unit
+        intervals['unit_label'] = unit_labels.get(unit, unit)
+        unit_frames.append(intervals[intervals[list(INTERVAL_COLUMNS.values())].notna().any(axis=1)])
+
+    intervals = pd.concat(unit_frames, ignore_index=True)
+    intervals = intervals[[
+        'exploration', 'unit', 'unit_label',
+        'depth_top', 'depth_bottom', 'elev_top', 'elev_bottom',
+        'below_bottom_of_hole'
+    ]]
+    for column in ('exploration', 'unit', 'unit_label'):
+        intervals[column] = intervals[column].astype('string')
+    intervals['below_bottom_of_hole'] = intervals['below_bottom_of_hole'].astype(bool)
+    return intervals.sort_values(['exploration', 'depth_top'], kind='stable').reset_index(drop=True)
+
+
+class ExplorationDatabase:
+
+    def __init__(self, path, cache_dir: Path = None):
+        """
+        Exploration database parsed once and cached as Parquet, invalidated by the source file's mtime.
+        Tables are loaded lazily on first access.
+        :param path: path of the exploration database csv
+        :param cache_dir: folder for the Parquet cache, defaults to a '.cache' folder next to the csv.
+            Caching is skipped if no Parquet engine (pyarrow) is installed.
+        """
+        self.path = Path(path)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else self.path.parent.joinpath('.cache')
+        self._explorations = None
+        self._intervals = None
+        self._intervals_by_exploration = None
+
+    @property
+    def explorations(self) -> pd.DataFrame:
+        """One row per exploration: explo_gid, exploration, log_url, ground_elev, total_depth, ..."""
+        if self._explorations is None:
+            self.load()
+        return self._explorations
+
+    @property
+    def intervals(self) -> pd.DataFrame:
+        """Long table of unit intervals, see get_unit_intervals()"""
+        if self._intervals is None:
+            self.load()
+        return self._intervals
+
+    @property
+    def intervals_by_exploration(self) -> dict:
+        """dict with exploration names as keys and their unit intervals (DataFrame) as values"""
+        if self._intervals_by_exploration is None:
+            self._intervals_by_exploration = {
+                name: group.reset_index(drop=True)
+                for name, group in self.intervals.groupby('exploration', sort=False)
+            }
+        return self._intervals_by_exploration
+
+    def get_intervals(self, name: str) -> pd.DataFrame:
+        """Unit intervals of one exploration, empty if the exploration has none"""
+        return self.intervals_by_exploration.get(name, self.intervals.iloc[:0])
+
+    def get_cache_files(self) -> dict:
+        mtime = self.path.stat().st_mtime_ns
+        return {
+            table: self.cache_dir.joinpath(f'{self.path.stem}.{mtime}.{table}.parquet')
+            for table in ('explorations', 'intervals')
+        }
+
+    def load(self):
+        """Loads the tables from the Parquet cache if it is current and readable, otherwise parses the csv"""
+        cache_files = self.get_cache_files()
+        if all(cache_file.is_file() for cache_file in cache_files.values()):
+            try:
+                self._explorations = pd.read_parquet(cache_files['explorations'])
+                self._intervals = pd.read_parquet(cache_files['intervals'])
+                self._intervals_by_exploration = None
+                return
+            except (ImportError, OSError):
+                pass
+        df = read_exploration_database(self.path)
+        self._explorations = get_exploration_table(df)
+        self._intervals = get_unit_intervals(df, unit_labels=read_unit_labels(self.path))
+        self._intervals_by_exploration = None
+        self.save_cache(cache_files)
+
+    def save_cache(self, cache_files: dict):
+        """Writes the tables to the Parquet cache. The database still loads without one, e.g. from a read-only
+        plugin folder, it is then parsed each session."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # caches of older versions of the source file
+            for old_cache_file in self.cache_dir.glob(f'{self.path.stem}.*.parquet'):
+                if old_cache_file not in cache_files.values():
+                    old_cache_file.unlink()
+            self._explorations.to_parquet(cache_files['explorations'], index=False)
+            self._intervals.to_parquet(cache_files['intervals'], index=False)
+        except ImportError:
+            print('no parquet engine installed, the exploration database will not be cached')
+        except OSError as error:
+            print(f'the exploration database will not be cached: {error}')
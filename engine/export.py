@@ -0,0 +1,209 @@
+"""Static image export of plotly figures through a warm pool of renderer processes.
+
+Starting plotly's image engine (Kaleido) costs seconds per call, longer than rendering a section. ImageExporter
+keeps worker processes whose renderer has been started once, takes a queue of figures and formats, writes them
+concurrently and records how long each job took.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+IMAGE_FORMATS = ('png', 'jpg', 'jpeg', 'webp', 'svg', 'pdf')
+DEFAULT_WIDTH = 1500
+DEFAULT_HEIGHT = 750
+
+_warm = False
+
+
+def warm_up():
+    """
+    Starts the image renderer of this process, so the following exports do not pay for it. With Kaleido 1.x a
+    sync server (one browser) is kept running, older Kaleido keeps its subprocess after the first render.
+    """
+    global _warm
+    if _warm:
+        return
+    import plotly.io as pio
+    try:
+        import kaleido
+        kaleido.start_sync_server(silence_warnings=True)
+    except (ImportError, AttributeError):
+        pass
+    pio.to_image({'data': [{'type': 'scatter', 'x': [0, 1], 'y': [0, 1]}]}, format='png', width=10, height=10)
+    _warm = True
+
+
+def write_image_job(fig, path, format: str = None, width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT,
+                    scale: float = None) -> dict:
+    """
+    Writes one figure, in the calling process
+    :param fig: plotly figure or figure dict
+    :return: dict with the job's path, format, seconds, bytes and error (None if it succeeded)
+    """
+    import plotly.io as pio
+
+    path = Path(path)
+    format = format or path.suffix[1:]
+    start = time.perf_counter()
+    stats = {'path': str(path), 'format': format, 'seconds': None, 'bytes': None, 'error': None}
+    try:
+        pio.write_image(fig, path, format=format, width=width, height=height, scale=scale)
+        stats['bytes'] = path.stat().st_size
+    except Exception as e:
+        stats['error'] = repr(e)
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def try_warm_up():
+    """warm_up() that only prints failures: a renderer that fails to start is reported by the export jobs, instead
+    of breaking the process pool"""
+    try:
+        warm_up()
+    except Exception as e:
+        print(f'image renderer did not start: {e!r}')
+
+
+def _export_in_worker(fig_dict: dict, path: str, format: str, width: int, height: int, scale: float) -> dict:
+    try_warm_up()
+    return write_image_job(fig_dict, path, format=format, width=width, height=height, scale=scale)
+
+
+@dataclass
+class ExportStats:
+    """Timing of the jobs an ImageExporter has run"""
+    jobs: list = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+    @property
+    def job_seconds(self) -> float:
+        return sum(job['seconds'] for job in self.jobs)
+
+    @property
+    def failed(self) -> list:
+        return [job for job in self.jobs if job['error'] is not None]
+
+    def summary(self) -> str:
+        if not self.jobs:
+            return 'no images exported'
+        return (f'{len(self.jobs)} images in {self.wall_seconds:.1f} s '
+                f'({self.job_seconds / len(self.jobs):.2f} s per image, {len(self.failed)} failed)')
+
+
+class ImageExporter:
+
+    def __init__(self, num_workers: int = None, width: int = DEFAULT_WIDTH, height: int = DEFAULT_HEIGHT,
+                 scale: float = None):
+        """
+        Pool of processes with a started image renderer each, writing figures concurrently. The pool is started on
+        the first export and kept until close().
+        :param num_workers: number of renderer processes, defaults to half the number of cores
+        :param width: default image width in pixels
+        :param height: default image height in pixels
+        :param scale: default scale factor of the images
+        """
+        self.num_workers = num_workers or max((os.cpu_count() or 2) // 2, 1)
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.stats = ExportStats()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                from .batch import get_python_executable
+                mp_context = multiprocessing.get_context('spawn')
+                mp_context.set_executable(get_python_executable())
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=mp_context,
+                    initializer=try_warm_up
+                )
+            return self._executor
+
+    def submit(self, fig, path, format: str = None, width: int = None, height: int = None, scale: float = None):
+        """
+        Queues one figure for export
+        :param fig: plotly figure or figure dict
+        :param path: image file, its suffix is the format unless format is given
+        :return: concurrent.futures.Future with the job's stats, see write_image_job()
+        """
+        format = format or Path(path).suffix[1:]
+        if format not in IMAGE_FORMATS:
+            raise ValueError(f'unknown image format: {format}')
+        fig_dict = fig if isinstance(fig, dict) else fig.to_dict()
+        future = self.executor.submit(
+            _export_in_worker,
+            fig_dict,
+            str(path),
+            format,
+            width or self.width,
+            height or self.height,
+            scale if scale is not None else self.scale,
+        )
+        future.add_done_callback(self._add_job_stats)
+        return future
+
+    def export(self, jobs) -> ExportStats:
+        """
+        Writes a queue of figures concurrently and waits for them
+        :param jobs: iterable of (fig, path) or (fig, path, format) tuples, or dicts of submit() arguments
+        :return: ExportStats of these jobs
+        """
+        start = time.perf_counter()
+        futures = []
+        for job in jobs:
+            if isinstance(job, dict):
+                futures.append(self.submit(**job))
+            else:
+                futures.append(self.submit(*job))
+        wait(futures)
+        stats = ExportStats(jobs=[future.result() for future in futures], wall_seconds=time.perf_counter() - start)
+        with self._lock:
+            self.stats.wall_seconds += stats.wall_seconds
+        return stats
+
+    def write_image(self, fig, path, **kwargs) -> dict:
+        """Writes one figure and waits for it, like plotly's Figure.write_image(), see submit()"""
+        stats = self.submit(fig, path, **kwargs).result()
+        if stats['error'] is not None:
+            raise RuntimeError(f"exporting {stats['path']} failed: {stats['error']}")
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def _add_job_stats(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            self.stats.jobs.append(future.result())
+
+
+_image_exporter = None
+
+
+def get_image_exporter(**kwargs) -> ImageExporter:
+    """The shared ImageExporter, created on first use and closed at exit"""
+    global _image_exporter
+    if _image_exporter is None:
+        _image_exporter = ImageExporter(**kwargs)
+        atexit.register(_image_exporter.close)
+    return _image_exporter
@@ -0,0 +1,190 @@
+"""Figure updates for a live plot view that loads plotly.js or BokehJS once.
+
+Opening every plot as a standalone html file re-ships the whole JS bundle with the data. A live view instead
+loads the page of a renderer once (see write_page()), which links the JS files of the installed plotly or bokeh
+package, and is then only sent figure updates (see get_plot_update() and get_update_script()):
+
+- plotly: the figure json, which Plotly.react() diffs against the figure shown
+- bokeh: the column data of each glyph renderer when the figure has the same glyphs as the one shown, set on the
+  shown ColumnDataSources, or the whole document (json_item) when the glyphs changed
+
+Nothing here needs Qt, the scripts are run by the view's page, e.g. QWebEnginePage.runJavaScript().
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .trace import tracer
+
+RENDERERS = ('plotly', 'bokeh')
+# id of the element the figure is drawn into
+PLOT_ELEMENT_ID = 'plot'
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>html, body, #{element} {{ width: 100%; height: 100%; margin: 0; overflow: hidden; }}</style>
+{scripts}
+</head>
+<body>
+<div id="{element}"></div>
+<script>
+{functions}
+</script>
+</body>
+</html>
+'''
+
+PLOTLY_FUNCTIONS = '''window.xsection = {
+    show: function (figure, config) {
+        return Plotly.react('%(element)s', figure.data, figure.layout, config);
+    }
+};''' % {'element': PLOT_ELEMENT_ID}
+
+BOKEH_FUNCTIONS = '''window.xsection = {
+    doc: null,
+    // embedding is asynchronous, updates are chained so data is only set once its document is shown
+    ready: Promise.resolve(),
+    show: function (item) {
+        this.ready = this.ready.then(() => {
+            if (this.doc !== null) {
+                this.doc.clear();
+                const index = Bokeh.documents.indexOf(this.doc);
+                if (index >= 0) {
+                    Bokeh.documents.splice(index, 1);
+                }
+            }
+            document.getElementById('%(element)s').innerHTML = '';
+            const count = Bokeh.documents.length;
+            return Bokeh.embed.embed_item(item, '%(element)s').then(() => {
+                this.doc = Bokeh.documents.length > count ? Bokeh.documents[Bokeh.documents.length - 1] : null;
+            });
+        });
+    },
+    setData: function (sources) {
+        this.ready = this.ready.then(() => {
+            const renderers = this.doc.roots()[0].renderers.filter((renderer) => 'data_source' in renderer);
+            sources.forEach((data, i) => { renderers[i].data_source.data = data; });
+        });
+    }
+};''' % {'element': PLOT_ELEMENT_ID}
+
+
+def _check_renderer(renderer: str):
+    if renderer not in RENDERERS:
+        raise ValueError(f'unknown renderer {renderer!r}, expected one of {RENDERERS}')
+
+
+def get_js_paths(renderer: str) -> list:
+    """Paths of the JS files of the installed plotly or bokeh package the page of a renderer links"""
+    _check_renderer(renderer)
+    if renderer == 'plotly':
+        import plotly
+        return [Path(plotly.__file__).parent.joinpath('package_data', 'plotly.min.js')]
+    from bokeh.resources import Resources
+    return [Path(path) for path in Resources(mode='absolute').js_files]
+
+
+def get_page_html(renderer: str) -> str:
+    """Html of the page a live view loads once per renderer, with an empty plot element"""
+    scripts = '\n'.join(
+        f'<script type="text/javascript" src="{path.as_uri()}"></script>' for path in get_js_paths(renderer)
+    )
+    functions = PLOTLY_FUNCTIONS if renderer == 'plotly' else BOKEH_FUNCTIONS
+    return PAGE_TEMPLATE.format(element=PLOT_ELEMENT_ID, scripts=scripts, functions=functions)
+
+
+def write_page(renderer: str, directory) -> Path:
+    """
+    Writes the page of a renderer to a directory, unless it is there already. The page links the JS files by
+    their file uri, so it has to be loaded from a file to be allowed to read them.
+    :return: path of the html file
+    """
+    html = get_page_html(renderer)
+    path = Path(directory).joinpath(f'xsection_{renderer}_view.html')
+    if not path.is_file() or path.read_text(encoding='utf-8') != html:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(html, encoding='utf-8')
+    return path
+
+
+def _to_js_value(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} cannot be sent to the plot view')
+
+
+def _dumps(value) -> str:
+    # NaN and Infinity are left as they are: they are not json but the scripts are javascript
+    return json.dumps(value, default=_to_js_value, separators=(',', ':'))
+
+
+def _get_bokeh_signature(model) -> str:
+    """What has to be equal for a bokeh figure to be shown by swapping the column data of the shown one"""
+    parts = [type(model).__name__, repr(model.title.text if model.title is not None else None)]
+    for legend in model.legend:
+        parts.extend(repr(item.label) for item in legend.items)
+    for renderer in model.renderers:
+        if not hasattr(renderer, 'data_source'):
+            parts.append(type(renderer).__name__)
+            continue
+        glyph = renderer.glyph
+        properties = glyph.properties_with_values(include_defaults=False)
+        parts.append(repr((
+            type(glyph).__name__,
+            sorted((key, repr(value)) for key, value in properties.items()),
+            sorted(renderer.data_source.data),
+        )))
+    return '\n'.join(parts)
+
+
+@tracer.traced()
+def get_plot_update(fig, renderer: str, config: dict = None, shown_signature: str = None) -> dict:
+    """
+    Serializes a figure for a live view. Can run in a worker thread, only the returned dict is needed to show it.
+    :param fig: plotly Figure (or Fig), or BokehFig or bokeh figure
+    :param renderer: 'plotly' or 'bokeh'
+    :param config: plotly config, defaults to the figure's own config if it has one
+    :param shown_signature: 'signature' of the bokeh update shown in the view. If the figure has the same one,
+        the document is not serialized, which is most of the cost.
+    :return: dict with 'renderer' and, for plotly, 'figure' and 'config' json, or, for bokeh, 'item' json (see
+        bokeh.embed.json_item, None if skipped), 'sources' json with the column data of each glyph renderer and
+        'signature'
+    """
+    _check_renderer(renderer)
+    if renderer == 'plotly':
+        if config is None:
+            config = getattr(fig, '_config', None) or {}
+        return {'renderer': renderer, 'figure': fig.to_json(), 'config': _dumps(dict(config, responsive=True))}
+    from bokeh.embed import json_item
+    if hasattr(fig, 'place_legend'):
+        fig.place_legend()
+    model = getattr(fig, 'f', fig)
+    sources = [
+        dict(renderer.data_source.data) for renderer in model.renderers if hasattr(renderer, 'data_source')
+    ]
+    signature = _get_bokeh_signature(model)
+    item = None
+    if signature != shown_signature:
+        item = json.dumps(json_item(model, PLOT_ELEMENT_ID))
+    return {'renderer': renderer, 'item': item, 'sources': _dumps(sources), 'signature': signature}
+
+
+def get_update_script(update: dict, shown_signature: str = None) -> str:
+    """
+    Script that shows an update of get_plot_update() on the page of its renderer
+    :param shown_signature: 'signature' of the bokeh update shown on the page, if any. If the update has the same
+        one, only its column data is sent.
+    :return: the script, or None if the update has no 'item' but the shown figure has other glyphs
+    """
+    if update['renderer'] == 'plotly':
+        return f"xsection.show({update['figure']}, {update['config']});"
+    if shown_signature is not None and update['signature'] == shown_signature:
+        return f"xsection.setData({update['sources']});"
+    if update['item'] is None:
+        return None
+    return f"xsection.show({update['item']});"
@@ -0,0 +1,181 @@
+"""Level-of-detail downsampling of line traces.
+
+Long series (ground profiles of long lines, logger records) are reduced to a few thousand points before
+traces are built, keeping their shape: min/max per x bucket (the default, keeps every peak) or
+largest-triangle-three-buckets (LTTB). Bar series (e.g. rainfall) are summed per x bucket instead, so the bars
+keep the totals of the records they stand for. LevelOfDetail keeps the full series, so an x range can be served
+at the detail of that range.
+"""
+import numpy as np
+
+# points per trace, about two per horizontal pixel of a wide screen
+DEFAULT_MAX_POINTS = 4000
+
+
+def is_datetime(x: np.ndarray) -> bool:
+    return np.issubdtype(x.dtype, np.datetime64) or (x.dtype == object and len(x) > 0 and hasattr(x[0], 'timestamp'))
+
+
+def to_numeric(x) -> np.ndarray:
+    """x values as float, datetimes as nanoseconds since the epoch"""
+    x = np.asarray(x)
+    if is_datetime(x):
+        return np.asarray(x, dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def to_numeric_range(x_range, like) -> tuple:
+    """
+    (start, end) of an axis range in the units of to_numeric(like). Date ranges can be given as strings
+    (plotly relayout events) or as milliseconds since the epoch (bokeh range events).
+    """
+    if not is_datetime(np.asarray(like)):
+        return float(x_range[0]), float(x_range[1])
+    bounds = []
+    for value in x_range:
+        if isinstance(value, (int, float)):
+            bounds.append(float(value) * 1e6)
+        else:
+            bounds.append(float(np.datetime64(str(value).replace(' ', 'T'), 'ns').astype(np.int64)))
+    return tuple(bounds)
+
+
+def min_max_indices(x: np.ndarray, y: np.ndarray, num_buckets: int) -> np.ndarray:
+    """
+    Indices of the first, last, lowest and highest point of each of num_buckets equal x intervals, in order
+    :param x: numeric, increasing x values
+    :param y: y values, NaN are skipped
+    """
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return valid
+    x_valid = x[valid]
+    y_valid = y[valid]
+    width = (x_valid[-1] - x_valid[0]) / num_buckets or 1.0
+    buckets = np.minimum(((x_valid - x_valid[0]) // width).astype(np.int64), num_buckets - 1)
+    # x is increasing, so each bucket is a contiguous run
+    starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+    counts = np.diff(np.r_[starts, len(buckets)])
+    indices = [starts, starts + counts - 1]
+    for extreme in (np.minimum, np.maximum):
+        is_extreme = np.flatnonzero(y_valid == np.repeat(extreme.reduceat(y_valid, starts), counts))
+        # first extreme of each bucket
+        _, first = np.unique(buckets[is_extreme], return_index=True)
+        indices.append(is_extreme[first])
+    indices = valid[np.concatenate(indices)]
+    return np.unique(indices)
+
+
+def sum_buckets(x: np.ndarray, y: np.ndarray, num_buckets: int) -> tuple:
+    """
+    Totals of y per equal x interval, e.g. daily rainfall from hourly records
+    :param x: numeric, increasing x values
+    :param y: y values, NaN are skipped. Buckets without values total NaN.
+    :return: a tuple of the indices of the first point of each bucket that has points, and the bucket totals
+    """
+    if len(x) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    width = (x[-1] - x[0]) / num_buckets or 1.0
+    buckets = np.minimum(((x - x[0]) // width).astype(np.int64), num_buckets - 1)
+    starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+    has_value = ~np.isnan(y)
+    totals = np.add.reduceat(np.where(has_value, y, 0.0), starts)
+    totals[np.add.reduceat(has_value.astype(np.int64), starts) == 0] = np.nan
+    return starts, totals
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, num_out: int) -> np.ndarray:
+    """
+    Indices of the points kept by largest-triangle-three-buckets downsampling
+    :param x: numeric, increasing x values
+    :param y: y values without NaN
+    :param num_out: number of points to keep, at least 3
+    """
+    n = len(x)
+    if num_out >= n or num_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, num_out - 1).astype(np.int64)
+    indices = np.empty(num_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for i in range(num_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket, or the last point
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+
+def downsample(x, y, max_points: int = DEFAULT_MAX_POINTS, method: str = 'minmax', x_range=None) -> tuple:
+    """
+    Reduces a series to about max_points points, keeping its shape
+    :param x: increasing x values, numeric or datetime
+    :param y: y values
+    :param max_points: max number of points returned, series that are shorter are returned as is
+    :param method: 'minmax' (lowest and highest point per bucket), 'lttb', or 'sum' (the total of each bucket at
+        its first x, for bars)
+    :param x_range: optional (start, end) to only return the points in, e.g. the visible x range
+    :return: x, y arrays, of the same types as the input
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    x_numeric = to_numeric(x)
+    if x_range is not None:
+        start, end = to_numeric_range(x_range, x)
+        # one point past each end so lines run to the plot's edges. Bars are not joined, and a point past the end
+        # would add to the total of the edge buckets
+        margin = 0 if method == 'sum' else 1
+        first = max(int(np.searchsorted(x_numeric, start, side='left')) - margin, 0)
+        last = min(int(np.searchsorted(x_numeric, end, side='right')) + margin, len(x))
+        x, y, x_numeric = x[first:last], y[first:last], x_numeric[first:last]
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    if method == 'sum':
+        starts, totals = sum_buckets(x_numeric, y, max_points)
+        return x[starts], totals
+    if method == 'minmax':
+        indices = min_max_indices(x_numeric, y, max(max_points // 4, 1))
+    elif method == 'lttb':
+        valid = np.flatnonzero(~np.isnan(y))
+        indices = valid[lttb_indices(x_numeric[valid], y[valid], max_points)]
+    else:
+        raise ValueError(f'unknown downsampling method: {method}')
+    return x[indices], y[indices]
+
+
+class LevelOfDetail:
+
+    def __init__(self, x, y, max_points: int = DEFAULT_MAX_POINTS, method: str = 'minmax'):
+        """
+        Full resolution series served at the detail of an x range
+        :param x: x values, numeric or datetime, sorted if they are not increasing
+        :param y: y values
+        :param max_points: max number of points per view
+        :param method: 'minmax', 'lttb' or 'sum', see downsample()
+        """
+        x = np.asarray(x)
+        y = np.asarray(y, dtype=float)
+        x_numeric = to_numeric(x)
+        if np.any(np.diff(x_numeric) < 0):
+            order = np.argsort(x_numeric, kind='stable')
+            x, y = x[order], y[order]
+        self.x = x
+        self.y = y
+        self.max_points = max_points
+        self.method = method
+
+    def __len__(self):
+        return len(self.x)
+
+    def get(self, x_range=None) -> tuple:
+        """Downsampled x, y of the whole series, or of x_range only"""
+        return downsample(self.x, self.y, max_points=self.max_points, method=self.method, x_range=x_range)
+
@@ -0,0 +1,374 @@
+"""Builds cross-section figures. Works with the plugin's Fig (plotly) and BokehFig figures, which are passed in.
+
+Data is handed to the figures as numpy arrays, never as lists: plotly (6+) writes them as base64 typed arrays
+and bokeh as binary ColumnDataSource columns, see to_array().
+"""
+import numpy as np
+import pandas as pd
+
+from .trace import tracer
+
+# line colors of additional surfaces, in order
+SURFACE_COLORS = ['darkorange', 'purple', 'teal', 'olive', 'gray', 'crimson']
+# colors of geologic units in the stratigraphic columns, in order of first appearance
+UNIT_COLORS = [
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b',
+    '#e377c2', '#7f7f7f', '#bcbd22', '#17becf', '#393b79', '#637939',
+]
+
+
+def to_array(values) -> np.ndarray:
+    """
+    Plot data as a numpy array, without copying if it already is one. pandas columns are converted with
+    to_numpy(), nullable numeric columns as float with NaN for missing values.
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    if isinstance(values, (pd.Series, pd.Index)):
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            return values.to_numpy(dtype=float, na_value=np.nan)
+        return values.to_numpy()
+    return np.asarray(values)
+
+
+def add_ground_line(fig, x, z, renderer: str = 'plotly'):
+    """
+    Adds the ground surface profile to the plot
+    :param fig: Fig (plotly) or BokehFig to add the line to
+    :param x: distances along the section line
+    :param z: ground elevations
+    :param renderer: 'plotly' or 'bokeh'
+    """
+    x, z = to_array(x), to_array(z)
+    if renderer == 'plotly':
+        fig.add_scattergl(
+            x=x, y=z,
+            hoverinfo='y',
+            name='Ground Surface Elevation',
+            mode='lines',
+            line_color='brown'
+        )
+    elif renderer == 'bokeh':
+        fig.line(x=x, y=z)
+
+
+def add_nearby_explo_lines(fig, explorations: dict, renderer: str = 'plotly', line_color='blue', line_width=2):
+    """
+    Adds vertical lines to the plot that represent the nearby explorations.
+    :param fig: Fig (plotly) or BokehFig to add the lines to
+    :param explorations: dict of exploration data, see CrossSection.explorations
+    :param renderer: 'plotly' or 'bokeh'
+    :param line_color: color of the exploration lines
+    :param line_width: width of the exploration lines
+    :return:
+    """
+    for feature_name, feature_data_dict in explorations.items():
+        distance_along_line = feature_data_dict['distanceAlongLine']
+        lidar_elevation = feature_data_dict['lidar']
+        total_depth = feature_data_dict['ExploDepth']
+        if type(total_depth) not in [float, int]:
+            bottom_elevation = lidar_elevation
+            total_depth = None
+        else:
+            bottom_elevation = lidar_elevation - total_depth
+
+        if renderer == 'plotly':
+            if total_depth is None:
+                fig.add_scattergl(
+                    x=(distance_along_line,),
+                    y=(lidar_elevation,),
+                    name=feature_name
+                )
+            else:
+                fig.add_scattergl(
+                    mode='lines',
+                    line_width=line_width,
+                    line_color=line_color,
+                    marker_symbol=1,
+                    name=feature_name,
+                    x=(distance_along_line, distance_along_line),
+                    y=(lidar_elevation, bottom_elevation)
+                )
+            """if feature_data_dict['screenTopBotElev'] is not None:
+                screen_top, screen_bot = feature_data_dict['screenTopBotElev']
+                fig.add_scattergl()"""
+        elif renderer == 'bokeh':
+            if total_depth is None:
+                fig.f.scatter(
+                    x=(distance_along_line,),
+                    y=(lidar_elevation,),
+                    name=feature_name
+                )
+            else:
+                fig.f.line(
+                    name=feature_name,
+                    x=(distance_along_line, distance_along_line),
+                    y=(lidar_elevation, bottom_elevation)
+                )
+
+
+def get_unit_segments(explorations: dict) -> dict:
+    """
+    Gathers the unit intervals of all explorations into one set of vertical segments per geologic unit.
+    Interval elevations are taken from the exploration's ground elevation ('lidar') minus the interval
+    depths, so the columns line up with the ground line, or from the database elevations if 'lidar' is NaN.
+    :param explorations: dict of exploration data with 'intervals', see CrossSection.explorations
+    :return: dict with units as keys and dicts with the keys 'label', 'x', 'top', 'bottom' and 'names'
+        (arrays with one value per interval) as values, in order of first appearance
+    """
+    frames = []
+    for name, d in explorations.items():
+        intervals = d.get('intervals')
+        if intervals is None or len(intervals) == 0:
+            continue
+        ground = d['lidar']
+        frame = intervals[['unit', 'unit_label']].copy()
+        if ground is not None and np.isfinite(ground):
+            frame['top'] = ground - intervals['depth_top']
+            frame['bottom'] = ground - intervals['depth_bottom']
+        else:
+            frame['top'] = intervals['elev_top']
+            frame['bottom'] = intervals['elev_bottom']
+        frame['x'] = d['distanceAlongLine']
+        frame['name'] = name
+        frames.append(frame)
+    if not frames:
+        return {}
+    intervals = pd.concat(frames, ignore_index=True).dropna(subset=['top', 'bottom'])
+    return {
+        unit: {
+            'label': group['unit_label'].iloc[0],
+            'x': group['x'].to_numpy(dtype=float),
+            'top': group['top'].to_numpy(dtype=float),
+            'bottom': group['bottom'].to_numpy(dtype=float),
+            'names': group['name'].to_numpy(dtype=object),
+        }
+        for unit, group in intervals.groupby('unit', sort=False)
+    }
+
+
+def to_nan_separated(x, top, bottom, names=None) -> tuple:
+    """
+    Interleaves vertical segments into single x, y arrays separated by NaN, for one plotly line trace
+    :return: x, y (and the names repeated per vertex if given), each of length 3 * number of segments
+    """
+    n = len(x)
+    xs = np.full(3 * n, np.nan)
+    ys = np.full(3 * n, np.nan)
+    xs[0::3] = x
+    xs[1::3] = x
+    ys[0::3] = top
+    ys[1::3] = bottom
+    if names is None:
+        return xs, ys
+    text = np.empty(3 * n, dtype=object)
+    text[0::3] = names
+    text[1::3] = names
+    text[2::3] = None
+    return xs, ys, text
+
+
+def add_unit_columns(
+        fig,
+        explorations: dict,
+        renderer: str = 'plotly',
+        line_color='blue',
+        line_width=2,
+        unit_line_width=8,
+        unit_colors: dict = None
+):
+    """
+    Adds the explorations as stratigraphic columns with one trace per geologic unit, however many explorations
+    there are: NaN separated segments in one line trace (plotly) or one segment glyph on a single
+    ColumnDataSource (bokeh) per unit. Explorations without unit intervals are merged into one 'Explorations'
+    trace, and ones without a depth into one marker trace.
+    :param fig: Fig (plotly) or BokehFig to add the traces to
+    :param explorations: dict of exploration data, see CrossSection.explorations
+    :param renderer: 'plotly' or 'bokeh'
+    :param line_color: color of the explorations without unit intervals
+    :param line_width: width of the explorations without unit intervals
+    :param unit_line_width: width of the unit columns
+    :param unit_colors: optional dict of unit colors, defaults to UNIT_COLORS in order of first appearance
+    """
+    segments = get_unit_segments(explorations)
+    unit_colors = unit_colors or {}
+    for i, (unit, unit_segments) in enumerate(segments.items()):
+        color = unit_colors.get(unit, UNIT_COLORS[i % len(UNIT_COLORS)])
+        if renderer == 'plotly':
+            x, y, text = to_nan_separated(
+                unit_segments['x'], unit_segments['top'], unit_segments['bottom'], unit_segments['names']
+            )
+            fig.add_scattergl(
+                x=x, y=y,
+                text=text,
+                hovertemplate='%{text}<br>%{y:.1f}',
+                mode='lines',
+                connectgaps=False,
+                line_width=unit_line_width,
+                line_color=color,
+                name=unit_segments['label'],
+                legendgroup=unit
+            )
+        elif renderer == 'bokeh':
+            from bokeh.models import ColumnDataSource
+            # flat columns rather than multi_line's ragged lists, so they are sent as binary arrays
+            source = ColumnDataSource(data={
+                'x': unit_segments['x'],
+                'top': unit_segments['top'],
+                'bottom': unit_segments['bottom'],
+                'name': unit_segments['names'],
+            })
+            fig.f.segment(
+                x0='x', y0='top', x1='x', y1='bottom',
+                source=source,
+                line_width=unit_line_width,
+                color=color,
+                legend_label=unit_segments['label']
+            )
+
+    # explorations without unit intervals, with and without a total depth
+    plain = {
+        name: d for name, d in explorations.items()
+        if d.get('intervals') is None or len(d['intervals']) == 0
+    }
+    x = np.array([d['distanceAlongLine'] for d in plain.values()], dtype=float)
+    ground = np.array([d['lidar'] for d in plain.values()], dtype=float)
+    depth = np.array([
+        d['ExploDepth'] if type(d['ExploDepth']) in [float, int] else np.nan for d in plain.values()
+    ], dtype=float)
+    names = np.array(list(plain), dtype=object)
+    has_depth = ~np.isnan(depth)
+    if has_depth.any():
+        if renderer == 'plotly':
+            xs, ys, text = to_nan_separated(
+                x[has_depth], ground[has_depth], ground[has_depth] - depth[has_depth], names[has_depth]
+            )
+            fig.add_scattergl(
+                x=xs, y=ys,
+                text=text,
+                hovertemplate='%{text}<br>%{y:.1f}',
+                mode='lines',
+                connectgaps=False,
+                line_width=line_width,
+                line_color=line_color,
+                name='Explorations'
+            )
+        elif renderer == 'bokeh':
+            fig.f.segment(
+                x0=x[has_depth], y0=ground[has_depth],
+                x1=x[has_depth], y1=ground[has_depth] - depth[has_depth],
+                line_width=line_width,
+                color=line_color,
+                legend_label='Explorations'
+            )
+    if (~has_depth).any():
+        if renderer == 'plotly':
+            fig.add_scattergl(
+                x=x[~has_depth], y=ground[~has_depth],
+                text=names[~has_depth],
+                hovertemplate='%{text}<br>%{y:.1f}',
+                mode='markers',
+                marker_color=line_color,
+                name='Explorations (no depth)'
+            )
+        elif renderer == 'bokeh':
+            fig.f.scatter(
+                x=x[~has_depth], y=ground[~has_depth],
+                color=line_color,
+                legend_label='Explorations (no depth)'
+            )
+
+
+def add_surface_lines(fig, x, surfaces: dict, renderer: str = 'plotly'):
+    """
+    Adds lines of other surfaces sampled at the same stations, e.g. other lidar years or geologic surfaces
+    :param fig: Fig (plotly) or BokehFig to add the lines to
+    :param x: distances along the section line
+    :param surfaces: dict with surface names as keys and elevation arrays as values
+    :param renderer: 'plotly' or 'bokeh'
+    """
+    x = to_array(x)
+    for i, (name, z) in enumerate(surfaces.items()):
+        z = to_array(z)
+        color = SURFACE_COLORS[i % len(SURFACE_COLORS)]
+        if renderer == 'plotly':
+            fig.add_scattergl(
+                x=x, y=z,
+                hoverinfo='y',
+                name=name,
+                mode='lines',
+                line_color=color
+            )
+        elif renderer == 'bokeh':
+            fig.line(x=x, y=z, legend_label=name, color=color)
+
+
+def add_difference_lines(fig, x, differences: dict, renderer: str = 'plotly'):
+    """
+    Adds cut (negative, red) and fill (positive, green) areas of surface differences on a secondary y-axis
+    :param fig: Fig (plotly) or BokehFig to add the areas to
+    :param x: distances along the section line
+    :param differences: dict with surface names as keys and arrays of differences as values, see
+        CrossSection.get_differences()
+    :param renderer: 'plotly' or 'bokeh'
+    """
+    if renderer == 'plotly':
+        fig.update_layout(yaxis2=dict(title='Cut (-) / Fill (+)', overlaying='y', side='right', showgrid=False))
+    elif renderer == 'bokeh':
+        from bokeh.models import DataRange1d, LinearAxis
+        fig.f.extra_y_ranges = {'difference': DataRange1d()}
+        fig.f.add_layout(LinearAxis(y_range_name='difference', axis_label='Cut (-) / Fill (+)'), 'right')
+    for name, difference in differences.items():
+        # no data (NaN) is neither cut nor fill
+        fill = np.where(difference > 0, difference, 0.0)
+        cut = np.where(difference < 0, difference, 0.0)
+        for label, values, color in ((f'{name} fill', fill, 'green'), (f'{name} cut', cut, 'red')):
+            if renderer == 'plotly':
+                fig.add_scattergl(
+                    x=x, y=values,
+                    yaxis='y2',
+                    name=label,
+                    mode='lines',
+                    fill='tozeroy',
+                    line_color=color,
+                    line_width=0.5
+                )
+            elif renderer == 'bokeh':
+                fig.f.varea(
+                    x=x, y1=0, y2=values,
+                    y_range_name='difference',
+                    legend_label=label,
+                    color=color,
+                    alpha=0.4
+                )
+
+
+@tracer.traced()
+def plot_cross_section(
+        fig,
+        section,
+        renderer: str = 'plotly',
+        show_difference: bool = False,
+        stratigraphy: bool = False,
+        **kwargs
+):
+    """
+    Adds the ground line, other surfaces and the explorations of a CrossSection to a figure
+    :param fig: Fig (plotly) or BokehFig to add the traces to
+    :param section: CrossSection
+    :param renderer: 'plotly' or 'bokeh'
+    :param show_difference: also plot the cut and fill of each surface relative to the ground
+    :param stratigraphy: plot the explorations as stratigraphic columns, one trace per unit, see add_unit_columns()
+    :param kwargs: passed to add_nearby_explo_lines() or add_unit_columns()
+    :return: fig
+    """
+    add_ground_line(fig, section.x, section.z, renderer=renderer)
+    if section.surfaces:
+        add_surface_lines(fig, section.surfaces_x, section.surfaces, renderer=renderer)
+        if show_difference:
+            add_difference_lines(fig, section.surfaces_x, section.get_differences(), renderer=renderer)
+    if stratigraphy:
+        add_unit_columns(fig, section.explorations, renderer=renderer, **kwargs)
+    else:
+        add_nearby_explo_lines(fig, section.explorations, renderer=renderer, **kwargs)
+    return fig
@@ -0,0 +1,64 @@
+"""Vectorized projection of points onto a polyline.
+
+The kernel works on plain NumPy arrays and gives the same results as
+QgsGeometry.closestSegmentWithContext() plus lineLocatePoint(), for many points at once.
+"""
+import numpy as np
+
+from .trace import tracer
+
+# max number of point-segment pairs evaluated at once, bounds the kernel's memory use
+MAX_PAIRS_PER_CHUNK = 2 ** 20
+
+
+@tracer.traced(items=lambda projection: len(projection['Dist']))
+def project_points_to_line(vertices, points) -> dict:
+    """
+    Projects points onto a polyline with a segment projection kernel
+    :param vertices: (n, 2) array-like of the line's x, y vertices
+    :param points: (m, 2) array-like of x, y point coordinates
+    :return: dict of (m,) arrays with keys: 'Dist' - perpendicular offset of each point from the line,
+    'minDistX', 'minDistY' - the closest point on the line, 'nextVertexIndex' - index of the vertex after
+    the closest segment, 'leftOrRightOfSegment' - side of the line (< 0 means left, > 0 means right, 0 means
+    on the line), 'distanceAlongLine' - distance along the line to the closest point.
+    """
+    vertices = np.asarray(vertices, dtype=float)[:, :2]
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    starts = vertices[:-1]
+    deltas = np.diff(vertices, axis=0)
+    segment_lengths_sqr = np.einsum('ij,ij->i', deltas, deltas)
+    segment_lengths = np.sqrt(segment_lengths_sqr)
+    chainage = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+    # zero length segments project everything onto their start vertex
+    safe_lengths_sqr = np.where(segment_lengths_sqr > 0, segment_lengths_sqr, 1.0)
+
+    n_points = len(points)
+    segment_index = np.empty(n_points, dtype=int)
+    t_closest = np.empty(n_points)
+    dist_sqr = np.empty(n_points)
+    chunk_size = max(1, MAX_PAIRS_PER_CHUNK // max(len(starts), 1))
+    for chunk_start in range(0, n_points, chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        offsets = points[chunk, None, :] - starts[None, :, :]
+        t = np.einsum('psk,sk->ps', offsets, deltas) / safe_lengths_sqr
+        t = np.clip(t, 0.0, 1.0)
+        residuals = offsets - t[:, :, None] * deltas[None, :, :]
+        residual_sqr = np.einsum('psk,psk->ps', residuals, residuals)
+        nearest = np.argmin(residual_sqr, axis=1)
+        rows = np.arange(len(nearest))
+        segment_index[chunk] = nearest
+        t_closest[chunk] = t[rows, nearest]
+        dist_sqr[chunk] = residual_sqr[rows, nearest]
+
+    closest = starts[segment_index] + t_closest[:, None] * deltas[segment_index]
+    point_offsets = points - starts[segment_index]
+    cross = deltas[segment_index, 0] * point_offsets[:, 1] - deltas[segment_index, 1] * point_offsets[:, 0]
+    return {
+        'Dist': np.sqrt(dist_sqr),
+        'minDistX': closest[:, 0],
+        'minDistY': closest[:, 1],
+        'nextVertexIndex': segment_index + 1,
+        # positive cross products are left of the segment, QGIS reports left as negative
+        'leftOrRightOfSegment': -np.sign(cross).astype(int),
+        'distanceAlongLine': chainage[segment_index] + t_closest * segment_lengths[segment_index],
+    }
@@ -0,0 +1,552 @@
+"""Vectorized DEM profile sampling.
+
+Everything in here works on plain NumPy arrays so it can be used with any raster
+source that can hand back a window of cells plus a GDAL style geotransform
+``(x_origin, pixel_width, 0, y_origin, 0, -pixel_height)``.
+
+DEMs in another CRS than the line are wrapped in a dem.ReprojectedDem: stations are computed in the
+line's CRS, so distances along the line are in its units, and transformed to the DEM's CRS one array
+at a time right before sampling.
+"""
+import numpy as np
+
+from .dem import ReprojectedDem, to_dem_crs
+from .trace import tracer
+
+# number of extra cells each interpolation kernel needs around a station
+KERNEL_PADDING = {
+    'nearest': 0,
+    'bilinear': 1,
+    'cubic': 2,
+}
+# largest raster window read at once, in cells. Longer lines are streamed in chunks.
+MAX_WINDOW_CELLS = 2 ** 22
+# length of the streamed chunks, in cells
+CHUNK_CELLS = 1024
+
+
+def cumulative_length(vertices: np.ndarray) -> np.ndarray:
+    """
+    Distance along a polyline at each of its vertices
+    :param vertices: (n, 2) array of x, y vertex coordinates
+    :return: (n,) array of chainages, starting at 0
+    """
+    segment_lengths = np.hypot(*np.diff(vertices, axis=0).T)
+    return np.concatenate(([0.0], np.cumsum(segment_lengths)))
+
+
+def interpolate_stations(vertices: np.ndarray, chainage: np.ndarray, distances: np.ndarray) -> tuple:
+    """
+    Coordinates of the stations located at 'distances' along a polyline, in one vectorized step
+    :param vertices: (n, 2) array of x, y vertex coordinates
+    :param chainage: (n,) chainage of each vertex, see cumulative_length()
+    :param distances: distances along the line of the stations
+    :return: a tuple with an x-coordinate array and a y-coordinate array
+    """
+    xs = np.interp(distances, chainage, vertices[:, 0])
+    ys = np.interp(distances, chainage, vertices[:, 1])
+    return xs, ys
+
+
+def world_to_pixel(xs: np.ndarray, ys: np.ndarray, geotransform: tuple) -> tuple:
+    """
+    Converts map coordinates to fractional column, row coordinates of a raster window
+    :return: a tuple with a column array and a row array. Integer values are cell edges.
+    """
+    x_origin, pixel_width, _, y_origin, _, pixel_height = geotransform
+    cols = (xs - x_origin) / pixel_width
+    rows = (ys - y_origin) / pixel_height
+    return cols, rows
+
+
+def _cubic_weights(t: np.ndarray) -> np.ndarray:
+    """Keys cubic convolution (a = -0.5) weights of the 4 cells around fractional offset t"""
+    a = -0.5
+    distances = np.stack((1 + t, t, 1 - t, 2 - t))
+    near = distances <= 1
+    weights = np.where(
+        near,
+        (a + 2) * distances ** 3 - (a + 3) * distances ** 2 + 1,
+        a * distances ** 3 - 5 * a * distances ** 2 + 8 * a * distances - 4 * a
+    )
+    return weights
+
+
+def sample_array(
+        array: np.ndarray,
+        geotransform: tuple,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        interpolation: str = 'nearest',
+        nodata=None
+) -> np.ndarray:
+    """
+    Samples a raster window at many points at once by array indexing.
+    :param array: 2d array of cell values, row 0 at the top
+    :param geotransform: GDAL style geotransform of the window
+    :param xs: x-coordinates of the points to sample
+    :param ys: y-coordinates of the points to sample
+    :param interpolation: 'nearest' (same value dataProvider().sample() returns), 'bilinear' or 'cubic'
+    :param nodata: optional cell value to treat as missing
+    :return: array of sampled values, NaN where the raster has no data
+    """
+    if interpolation not in KERNEL_PADDING:
+        raise ValueError(f'interpolation must be one of {tuple(KERNEL_PADDING)}, not {interpolation!r}')
+    array = np.asarray(array, dtype=float)
+    if nodata is not None:
+        array = np.where(array == nodata, np.nan, array)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    z = np.full(xs.shape, np.nan)
+    if array.size == 0:
+        return z
+    n_rows, n_cols = array.shape
+    cols, rows = world_to_pixel(xs, ys, geotransform)
+    inside = (cols >= 0) & (cols <= n_cols) & (rows >= 0) & (rows <= n_rows)
+
+    if interpolation == 'nearest':
+        col_idx = np.clip(np.floor(cols[inside]).astype(int), 0, n_cols - 1)
+        row_idx = np.clip(np.floor(rows[inside]).astype(int), 0, n_rows - 1)
+        z[inside] = array[row_idx, col_idx]
+        return z
+
+    # interpolating kernels work on cell centres
+    cols = cols[inside] - 0.5
+    rows = rows[inside] - 0.5
+    col0 = np.floor(cols).astype(int)
+    row0 = np.floor(rows).astype(int)
+    t_col = cols - col0
+    t_row = rows - row0
+
+    if interpolation == 'bilinear':
+        offsets = np.arange(2)
+        col_weights = np.stack((1 - t_col, t_col))
+        row_weights = np.stack((1 - t_row, t_row))
+    else:
+        offsets = np.arange(-1, 3)
+        col_weights = _cubic_weights(t_col)
+        row_weights = _cubic_weights(t_row)
+
+    values = np.zeros(cols.shape)
+    for i, row_offset in enumerate(offsets):
+        row_idx = np.clip(row0 + row_offset, 0, n_rows - 1)
+        for j, col_offset in enumerate(offsets):
+            col_idx = np.clip(col0 + col_offset, 0, n_cols - 1)
+            values += row_weights[i] * col_weights[j] * array[row_idx, col_idx]
+    z[inside] = values
+    return z
+
+
+def sample_points(dem, xs, ys, interpolation: str = 'nearest') -> np.ndarray:
+    """
+    Samples a DEM at many points with a single window read
+    :param dem: DEM source with a read_window() method, see engine.dem
+    :param xs: x-coordinates of the points, in the DEM's CRS, or the line's CRS for a ReprojectedDem
+    :param ys: y-coordinates of the points, in the DEM's CRS, or the line's CRS for a ReprojectedDem
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :return: array of elevations, NaN where the DEM has no data
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if xs.size == 0:
+        return np.empty(0)
+    xs, ys = to_dem_crs(dem, xs, ys)
+    array, geotransform = dem.read_window(
+        xs.min(), ys.min(), xs.max(), ys.max(),
+        pad=KERNEL_PADDING.get(interpolation, 0)
+    )
+    return sample_array(array, geotransform, xs, ys, interpolation=interpolation)
+
+
+def get_adaptive_station_distances(
+        chainage: np.ndarray,
+        pixel_size: float,
+        spacing_factor: float = 1.0,
+        include_vertices: bool = True
+) -> np.ndarray:
+    """
+    Station distances spaced from the DEM resolution instead of a fixed number of points
+    :param chainage: chainage of the line's vertices, see cumulative_length()
+    :param pixel_size: DEM cell size, in line units
+    :param spacing_factor: station spacing as a multiple of the cell size
+    :param include_vertices: also put a station on every vertex of the line
+    :return: sorted array of unique distances along the line, always including both ends
+    """
+    line_length = chainage[-1]
+    spacing = pixel_size * spacing_factor
+    num_intervals = max(int(np.ceil(line_length / spacing)), 1)
+    distances = np.linspace(0.0, line_length, num_intervals + 1)
+    if include_vertices:
+        distances = np.union1d(distances, chainage)
+    return distances
+
+
+def get_initial_station_distances(
+        chainage: np.ndarray,
+        pixel_size: float,
+        spacing_factor: float = 1.0,
+        include_vertices: bool = True,
+        refine: bool = True,
+        coarse_factor: int = 8
+) -> np.ndarray:
+    """
+    Stations the adaptive sampler starts from: every spacing, or every coarse spacing when they are refined.
+    Refinement only splits the intervals between these stations, so the line can be cut at any of them and
+    each part refined on its own, see iter_profile_chunks().
+    """
+    if refine:
+        spacing_factor = spacing_factor * coarse_factor
+    return get_adaptive_station_distances(chainage, pixel_size, spacing_factor, include_vertices)
+
+
+def refine_stations(
+        vertices: np.ndarray,
+        chainage: np.ndarray,
+        dem,
+        distances: np.ndarray,
+        min_spacing: float,
+        refine: bool = True,
+        vertical_tolerance: float = 0.5,
+        interpolation: str = 'nearest'
+) -> tuple:
+    """
+    Samples the stations at 'distances' along a line and, with 'refine', splits the intervals between them in half
+    where the ground curves, see sample_profile_adaptive(). Reads one raster window, under the part of the line
+    from the first to the last station.
+    :return: a tuple with the distances and the elevations of all stations, NaN where the DEM has no data
+    """
+    # bounds of the line between the first and last station. In another CRS the line may bend between its
+    # vertices and stations, so the window gets an extra cell
+    inner = (chainage > distances[0]) & (chainage < distances[-1])
+    station_xs, station_ys = interpolate_stations(vertices, chainage, distances)
+    bounds_xs, bounds_ys = to_dem_crs(
+        dem, np.concatenate((station_xs, vertices[inner, 0])), np.concatenate((station_ys, vertices[inner, 1]))
+    )
+    pad = KERNEL_PADDING.get(interpolation, 0)
+    if isinstance(dem, ReprojectedDem):
+        pad += 1
+    array, geotransform = dem.read_window(
+        bounds_xs.min(), bounds_ys.min(), bounds_xs.max(), bounds_ys.max(),
+        pad=pad
+    )
+
+    def sample_at(distances):
+        xs, ys = to_dem_crs(dem, *interpolate_stations(vertices, chainage, distances))
+        return sample_array(array, geotransform, xs, ys, interpolation=interpolation)
+
+    z = sample_at(distances)
+    if not refine:
+        return distances, z
+    starts = np.arange(len(distances) - 1)
+    while starts.size:
+        # split the active intervals that are still longer than the finest spacing, so they end up between half
+        # and one spacing long
+        starts = starts[distances[starts + 1] - distances[starts] > min_spacing]
+        if not starts.size:
+            break
+        midpoints = (distances[starts] + distances[starts + 1]) / 2
+        z_mid = sample_at(midpoints)
+        z_linear = (z[starts] + z[starts + 1]) / 2
+        # NaN ends (no data) are always refined so data edges stay sharp
+        keep = ~(np.abs(z_mid - z_linear) <= vertical_tolerance)
+        midpoints = midpoints[keep]
+        z_mid = z_mid[keep]
+        if not midpoints.size:
+            break
+        order = np.argsort(np.concatenate((distances, midpoints)), kind='stable')
+        distances = np.concatenate((distances, midpoints))[order]
+        z = np.concatenate((z, z_mid))[order]
+        # new intervals are the ones on either side of each kept midpoint
+        new_positions = np.flatnonzero(order >= len(order) - len(midpoints))
+        starts = np.unique(np.concatenate((new_positions - 1, new_positions)))
+    return distances, z
+
+
+@tracer.traced(items=lambda profile: len(profile[0]))
+def sample_profile_adaptive(
+        vertices,
+        dem,
+        pixel_size: float = None,
+        spacing_factor: float = 1.0,
+        include_vertices: bool = True,
+        refine: bool = True,
+        coarse_factor: int = 8,
+        vertical_tolerance: float = 0.5,
+        interpolation: str = 'nearest'
+) -> tuple:
+    """
+    Samples a DEM along a polyline with stations spaced from the DEM resolution and the line length.
+    With 'refine', the line is first sampled every coarse_factor cells and intervals are split in half
+    only where the midpoint elevation is more than vertical_tolerance off the straight line between its
+    ends, until intervals are no longer than the cell size: stations are dense where the ground curves and sparse on flats and
+    even slopes.
+    :param vertices: (n, 2) array-like of the line's x, y vertices, in the DEM's CRS
+    :param dem: DEM source with a read_window() method, see engine.dem
+    :param pixel_size: DEM cell size, defaults to dem.pixel_size
+    :param spacing_factor: finest station spacing as a multiple of the cell size
+    :param include_vertices: also put a station on every vertex of the line
+    :param refine: refine a coarse profile by curvature, instead of sampling every spacing
+    :param coarse_factor: spacing of the coarse profile, as a multiple of the finest spacing
+    :param vertical_tolerance: max elevation error of the linear profile between stations, in z units
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :return: a tuple with an x (distance along line) array and a z (elevation) array. Stations
+        without elevation data are dropped.
+    """
+    vertices = np.asarray(vertices, dtype=float)[:, :2]
+    if pixel_size is None:
+        pixel_size = dem.pixel_size
+    chainage = cumulative_length(vertices)
+    distances = get_initial_station_distances(
+        chainage, pixel_size, spacing_factor, include_vertices, refine=refine, coarse_factor=coarse_factor
+    )
+    distances, z = refine_stations(
+        vertices, chainage, dem, distances,
+        min_spacing=pixel_size * spacing_factor,
+        refine=refine,
+        vertical_tolerance=vertical_tolerance,
+        interpolation=interpolation
+    )
+    valid = ~np.isnan(z)
+    if not valid.all():
+        print(f'Elevation data not available at {np.count_nonzero(~valid)} of {valid.size} stations')
+    return distances[valid], z[valid]
+
+
+def iter_adaptive_profile_chunks(
+        vertices: np.ndarray,
+        chainage: np.ndarray,
+        dem,
+        chunk_length: float,
+        interpolation: str = 'nearest',
+        pixel_size: float = None,
+        spacing_factor: float = 1.0,
+        include_vertices: bool = True,
+        refine: bool = True,
+        coarse_factor: int = 8,
+        vertical_tolerance: float = 0.5
+):
+    """
+    Adaptive profile of a whole line, chunk by chunk, see iter_profile_chunks(). The initial stations are
+    computed once for the whole line and chunks end on one of them, so every interval is refined in a single
+    chunk and the stations do not depend on the chunk length.
+    """
+    if pixel_size is None:
+        pixel_size = dem.pixel_size
+    distances = get_initial_station_distances(
+        chainage, pixel_size, spacing_factor, include_vertices, refine=refine, coarse_factor=coarse_factor
+    )
+    num_chunks = max(int(np.ceil(chainage[-1] / chunk_length)), 1)
+    chunk_ends = np.linspace(0.0, chainage[-1], num_chunks + 1)[1:]
+    # index of the first initial station at or past the end of each chunk
+    end_indices = np.unique(np.minimum(np.searchsorted(distances, chunk_ends), len(distances) - 1))
+    start_index = 0
+    for end_index in end_indices.tolist():
+        if end_index <= start_index:
+            continue
+        x, z = refine_stations(
+            vertices, chainage, dem, distances[start_index:end_index + 1],
+            min_spacing=pixel_size * spacing_factor,
+            refine=refine,
+            vertical_tolerance=vertical_tolerance,
+            interpolation=interpolation
+        )
+        if start_index > 0:
+            # the first station of a chunk is the last station of the previous one
+            x, z = x[1:], z[1:]
+        valid = ~np.isnan(z)
+        yield x[valid], z[valid]
+        start_index = end_index
+
+
+def iter_profile_chunks(
+        vertices,
+        dem,
+        num_points: int = 1000,
+        interpolation: str = 'nearest',
+        chunk_length: float = None,
+        **adaptive_kwargs
+):
+    """
+    Samples a DEM along a polyline chunk by chunk. Each chunk only reads the raster window under its own
+    stations, so peak memory depends on the chunk length and not on the length of the line.
+    :param vertices: (n, 2) array-like of the line's x, y vertices, in the DEM's CRS
+    :param dem: DEM source with a read_window() method, see engine.dem
+    :param num_points: number of intervals along the whole line, None to space stations from the DEM
+        resolution, see sample_profile_adaptive()
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :param chunk_length: length of line sampled per chunk, defaults to CHUNK_CELLS cells of the DEM. Adaptive
+        chunks end on the next coarse station, see iter_adaptive_profile_chunks().
+    :param adaptive_kwargs: passed to sample_profile_adaptive() when num_points is None
+    :return: generator of (x, z) tuples, x is the distance along the whole line. Concatenated, the chunks
+        give the same stations as sampling the line in one go, for fixed and adaptive spacing alike.
+    """
+    vertices = np.asarray(vertices, dtype=float)[:, :2]
+    chainage = cumulative_length(vertices)
+    line_length = chainage[-1]
+    if chunk_length is None:
+        chunk_length = dem.pixel_size * CHUNK_CELLS
+    if num_points is None:
+        yield from iter_adaptive_profile_chunks(
+            vertices, chainage, dem, chunk_length, interpolation=interpolation, **adaptive_kwargs
+        )
+        return
+    num_chunks = max(int(np.ceil(line_length / chunk_length)), 1)
+    chunk_bounds = np.linspace(0.0, line_length, num_chunks + 1)
+    spacing = line_length / num_points
+    for i in range(num_chunks):
+        start, end = chunk_bounds[i], chunk_bounds[i + 1]
+        last_chunk = i == num_chunks - 1
+        first_station = int(np.ceil(start / spacing - 1e-9))
+        end_station = num_points + 1 if last_chunk else int(np.ceil(end / spacing - 1e-9))
+        distances = np.minimum(np.arange(first_station, end_station) * spacing, line_length)
+        if not distances.size:
+            continue
+        xs, ys = interpolate_stations(vertices, chainage, distances)
+        z = sample_points(dem, xs, ys, interpolation=interpolation)
+        valid = ~np.isnan(z)
+        yield distances[valid], z[valid]
+
+
+def needs_streaming(vertices: np.ndarray, dem) -> bool:
+    """True if the raster window under the whole line would be larger than MAX_WINDOW_CELLS"""
+    pixel_size = getattr(dem, 'pixel_size', None)
+    if not pixel_size:
+        return False
+    span = vertices.max(axis=0) - vertices.min(axis=0)
+    return np.prod(span / pixel_size + 1) > MAX_WINDOW_CELLS
+
+
+@tracer.traced(items=lambda profile: len(profile[0]))
+def sample_profile(
+        vertices,
+        dem,
+        num_points: int = 1000,
+        interpolation: str = 'nearest',
+        chunk_length: float = None
+) -> tuple:
+    """
+    Samples a DEM along a polyline. The raster window under the stations is read once, all
+    station coordinates are computed in one step and elevations are looked up by array indexing.
+    :param vertices: (n, 2) array-like of the line's x, y vertices, in the DEM's CRS
+    :param dem: DEM source with a read_window(xmin, ymin, xmax, ymax, pad=0) method returning a tuple
+        of (array, geotransform) for the raster window covering the bounds, see engine.dem
+    :param num_points: number of intervals along the line, the profile has num_points + 1 stations.
+        None spaces the stations from the DEM resolution, see sample_profile_adaptive()
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :param chunk_length: stream the line in chunks of this length, see iter_profile_chunks(). By default
+        lines are only streamed when the raster window under them is larger than MAX_WINDOW_CELLS.
+    :return: a tuple with an x (distance along line) array and a z (elevation) array. Stations
+        without elevation data are dropped.
+    """
+    vertices = np.asarray(vertices, dtype=float)[:, :2]
+    if chunk_length is not None or needs_streaming(vertices, dem):
+        chunks = list(iter_profile_chunks(
+            vertices, dem,
+            num_points=num_points,
+            interpolation=interpolation,
+            chunk_length=chunk_length
+        ))
+        return np.concatenate([x for x, _ in chunks]), np.concatenate([z for _, z in chunks])
+    if num_points is None:
+        return sample_profile_adaptive(vertices, dem, interpolation=interpolation)
+    chainage = cumulative_length(vertices)
+    distances = np.linspace(0.0, chainage[-1], num_points + 1)
+    xs, ys = interpolate_stations(vertices, chainage, distances)
+    z = sample_points(dem, xs, ys, interpolation=interpolation)
+    valid = ~np.isnan(z)
+    if not valid.all():
+        print(f'Elevation data not available at {np.count_nonzero(~valid)} of {valid.size} stations')
+    return distances[valid], z[valid]
+
+
+def sample_stations(
+        dem,
+        distances: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        interpolation: str = 'nearest',
+        dem_xs: np.ndarray = None,
+        dem_ys: np.ndarray = None
+):
+    """
+    Samples a DEM at stations ordered along a line, in chunks of CHUNK_CELLS cells of line when the window
+    under all stations would be larger than MAX_WINDOW_CELLS
+    :param dem_xs: optional x-coordinates of the stations already in the DEM's CRS, see to_dem_crs(), so DEMs in
+        the same CRS share one transform. xs and ys are then only used to chunk the stations.
+    :param dem_ys: y-coordinates of the stations in the DEM's CRS, with dem_xs
+    :return: array of elevations, NaN where the DEM has no data
+    """
+    sampled = dem
+    if dem_xs is None:
+        dem_xs, dem_ys = xs, ys
+    elif isinstance(dem, ReprojectedDem):
+        sampled = dem.dem
+    if not needs_streaming(np.column_stack((xs, ys)), dem):
+        return sample_points(sampled, dem_xs, dem_ys, interpolation=interpolation)
+    chunk_ids = np.floor(distances / (dem.pixel_size * CHUNK_CELLS)).astype(int)
+    chunk_starts = np.flatnonzero(np.diff(chunk_ids, prepend=-1))
+    chunk_ends = np.append(chunk_starts[1:], len(distances))
+    z = np.empty(len(distances))
+    for start, end in zip(chunk_starts, chunk_ends):
+        z[start:end] = sample_points(sampled, dem_xs[start:end], dem_ys[start:end], interpolation=interpolation)
+    return z
+
+
+@tracer.traced(items=len)
+def sample_points_along_line(dem, distances, xs, ys, interpolation: str = 'nearest') -> np.ndarray:
+    """
+    Samples a DEM at points near a line, e.g. explorations, in the order of their distance along the line and
+    streamed like the stations of a profile, see sample_stations(). Points near a long line are then not sampled
+    from the one window under all of them.
+    :param distances: distance along the line of each point
+    :return: array of elevations in the order of the points, NaN where the DEM has no data
+    """
+    distances = np.asarray(distances, dtype=float)
+    order = np.argsort(distances, kind='stable')
+    xs = np.asarray(xs, dtype=float)[order]
+    ys = np.asarray(ys, dtype=float)[order]
+    z = np.empty(len(distances))
+    z[order] = sample_stations(dem, distances[order], xs, ys, interpolation=interpolation)
+    return z
+
+
+@tracer.traced(items=lambda profiles: profiles[1].size)
+def sample_profiles(
+        vertices,
+        dems: list,
+        num_points: int = 1000,
+        interpolation: str = 'nearest'
+) -> tuple:
+    """
+    Samples several DEMs at the same stations in one pass, e.g. pre- and post-grading lidar or geologic
+    surface rasters. The stations are computed once and shared by all DEMs, and transformed once per CRS for
+    DEMs in another CRS than the line.
+    :param vertices: (n, 2) array-like of the line's x, y vertices, in the DEMs' CRS
+    :param dems: list of DEM sources, see engine.dem
+    :param num_points: number of intervals along the line, None to space the stations from the finest
+        DEM resolution (without curvature refinement, which differs per surface)
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :return: a tuple with an x (distance along line) array and a (len(dems), len(x)) array of elevations.
+        Stations are kept where a DEM has no data, with NaN elevations.
+    """
+    vertices = np.asarray(vertices, dtype=float)[:, :2]
+    chainage = cumulative_length(vertices)
+    if num_points is None:
+        pixel_size = min(dem.pixel_size for dem in dems)
+        distances = get_adaptive_station_distances(chainage, pixel_size)
+    else:
+        distances = np.linspace(0.0, chainage[-1], num_points + 1)
+    xs, ys = interpolate_stations(vertices, chainage, distances)
+    z = np.empty((len(dems), len(distances)))
+    # station coordinates in the CRS of each reprojected DEM, by CRS
+    transformed = {}
+    for i, dem in enumerate(dems):
+        if not isinstance(dem, ReprojectedDem):
+            z[i] = sample_stations(dem, distances, xs, ys, interpolation=interpolation)
+            continue
+        key = dem.crs if dem.crs is not None else id(dem.transform)
+        if key not in transformed:
+            transformed[key] = to_dem_crs(dem, xs, ys)
+        dem_xs, dem_ys = transformed[key]
+        z[i] = sample_stations(dem, distances, xs, ys, interpolation=interpolation, dem_xs=dem_xs, dem_ys=dem_ys)
+    return distances, z
@@ -0,0 +1,165 @@
+"""Cross-section results, computed from plain coordinates without QGIS."""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .dem import open_dem
+from .projection import project_points_to_line
+from .sampling import sample_points_along_line, sample_profile, sample_profiles
+from .trace import tracer
+
+
+@dataclass
+class CrossSection:
+    """
+    Result of a cross-section computation.
+    x, z are the ground profile (distance along line, elevation). explorations has the exploration
+    names as keys and dicts with the projection of each exploration onto the line ('distanceAlongLine',
+    'Dist', 'leftOrRightOfSegment', ...), its ground elevation ('lidar') and depth ('ExploDepth') as values,
+    the same layout as XSectionPlugin.nearby_features_dict.
+    surfaces has the names of other surfaces sampled at the stations surfaces_x as keys (e.g. other lidar
+    years or geologic surface rasters) and their elevations as values, NaN where a surface has no data.
+    """
+    x: np.ndarray
+    z: np.ndarray
+    line: np.ndarray
+    explorations: dict = field(default_factory=dict)
+    num_points: int = 1000
+    interpolation: str = 'nearest'
+    surfaces_x: np.ndarray = None
+    surfaces: dict = field(default_factory=dict)
+
+    def get_differences(self) -> dict:
+        """
+        Elevation differences of each surface relative to the ground profile, positive is fill
+        :return: dict with surface names as keys and arrays of differences at surfaces_x as values
+        """
+        ground = np.interp(self.surfaces_x, self.x, self.z, left=np.nan, right=np.nan)
+        return {name: z - ground for name, z in self.surfaces.items()}
+
+    @property
+    def length(self) -> float:
+        return float(np.hypot(*np.diff(self.line, axis=0).T).sum())
+
+
+@tracer.traced(items=len)
+def project_explorations(
+        line,
+        points,
+        names: list,
+        depths: list = None,
+        dem=None,
+        attributes: dict = None,
+        tolerance: float = None,
+        interpolation: str = 'nearest',
+        intervals: dict = None
+) -> dict:
+    """
+    Projects explorations onto a section line and looks up their ground elevation
+    :param line: (n, 2) array-like of the section line's vertices
+    :param points: (m, 2) array-like of the explorations' x, y coordinates
+    :param names: exploration names, used as keys of the result
+    :param depths: optional total depth of each exploration, None where unknown
+    :param dem: optional DEM source or DEM file path to sample the ground elevation ('lidar') from
+    :param attributes: optional dict of extra per-exploration values to copy to the result, e.g.
+        {'projectNumber': [...]}
+    :param tolerance: optional max offset from the line, explorations further away are left out
+    :param interpolation: interpolation used to sample the DEM
+    :param intervals: optional dict of exploration names and their unit intervals, e.g.
+        ExplorationDatabase.intervals_by_exploration. Added to the result as 'intervals', None if missing.
+    :return: dict with exploration names as keys and dicts of exploration data as values
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if depths is None:
+        depths = [None] * len(points)
+    attributes = attributes or {}
+    distances = project_points_to_line(line, points)
+    if tolerance is not None:
+        kept = np.flatnonzero(distances['Dist'] <= tolerance)
+    else:
+        kept = np.arange(len(points))
+    # only the kept explorations are sampled, along the line, so the DEM windows are the ones under the section
+    if dem is not None:
+        elevations = sample_points_along_line(
+            open_dem(dem), distances['distanceAlongLine'][kept], points[kept, 0], points[kept, 1],
+            interpolation=interpolation
+        )
+    else:
+        elevations = np.full(len(kept), np.nan)
+
+    explorations = {}
+    for j, i in enumerate(kept.tolist()):
+        name = names[i]
+        d = {key: values[i].item() for key, values in distances.items()}
+        d['lidar'] = elevations[j].item()
+        d['ExploDepth'] = depths[i]
+        for key, values in attributes.items():
+            d[key] = values[i]
+        if intervals is not None:
+            d['intervals'] = intervals.get(name)
+        explorations[name] = d
+    return explorations
+
+
+def build_cross_section(
+        line,
+        dem,
+        points=None,
+        names: list = None,
+        depths: list = None,
+        attributes: dict = None,
+        tolerance: float = None,
+        num_points: int = 1000,
+        interpolation: str = 'nearest',
+        surfaces: dict = None,
+        intervals: dict = None
+) -> CrossSection:
+    """
+    Computes a cross-section: the ground profile along the line and the explorations projected onto it
+    :param line: (n, 2) array-like of the section line's vertices, in the DEM's CRS
+    :param dem: DEM source (engine.Dem, engine.GeoTiffDem, ...) or path of a GeoTIFF
+    :param points: optional (m, 2) array-like of exploration coordinates
+    :param names: exploration names, required with points
+    :param depths: optional total depth of each exploration
+    :param attributes: optional dict of extra per-exploration values, see project_explorations()
+    :param tolerance: optional max offset of explorations from the line
+    :param num_points: number of intervals along the line, None to space stations from the DEM resolution
+    :param interpolation: 'nearest', 'bilinear' or 'cubic'
+    :param surfaces: optional dict of surface names and DEM sources (or paths) to sample at the same
+        stations as the ground, in the same pass
+    :param intervals: optional dict of exploration names and their unit intervals, see project_explorations()
+    :return: CrossSection
+    """
+    dem = open_dem(dem)
+    line = np.asarray(line, dtype=float)[:, :2]
+    surfaces_x = None
+    surfaces_z = {}
+    if surfaces:
+        dems = [dem] + [open_dem(surface) for surface in surfaces.values()]
+        surfaces_x, z_stack = sample_profiles(line, dems, num_points=num_points, interpolation=interpolation)
+        valid = ~np.isnan(z_stack[0])
+        x, z = surfaces_x[valid], z_stack[0][valid]
+        surfaces_z = dict(zip(surfaces.keys(), z_stack[1:]))
+    else:
+        x, z = sample_profile(line, dem, num_points=num_points, interpolation=interpolation)
+    explorations = {}
+    if points is not None:
+        explorations = project_explorations(
+            line, points, names,
+            depths=depths,
+            dem=dem,
+            attributes=attributes,
+            tolerance=tolerance,
+            interpolation=interpolation,
+            intervals=intervals
+        )
+    return CrossSection(
+        x=x,
+        z=z,
+        line=line,
+        explorations=explorations,
+        num_points=num_points,
+        interpolation=interpolation,
+        surfaces_x=surfaces_x,
+        surfaces=surfaces_z
+    )
@@ -0,0 +1,274 @@
+"""Compact, versioned file format for cross-section results.
+
+A section file (.xsec) is an uncompressed npz archive: one .npy member per array (profile, line, surfaces,
+explorations and their unit intervals as columns) and a meta.json member with the format version, settings and
+style. Nothing is pickled, so files are safe to share and do not depend on library versions. Arrays are read
+lazily and memory-mapped straight from the archive, and the figure is rebuilt from the data on demand.
+"""
+import json
+import numbers
+import os
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from .section import CrossSection
+
+FORMAT_NAME = 'xsection'
+FORMAT_VERSION = 1
+SUFFIX = '.xsec'
+META_MEMBER = 'meta.json'
+# numeric exploration values stored as columns, None and other non-numbers (blank or text depths) are stored as NaN
+EXPLORATION_COLUMNS = [
+    'distanceAlongLine', 'Dist', 'minDistX', 'minDistY', 'nextVertexIndex', 'leftOrRightOfSegment', 'lidar',
+    'ExploDepth',
+]
+INTERVAL_COLUMNS = {
+    'unit': str,
+    'unit_label': str,
+    'depth_top': float,
+    'depth_bottom': float,
+    'elev_top': float,
+    'elev_bottom': float,
+    'below_bottom_of_hole': bool,
+}
+
+
+def _to_float(value) -> float:
+    # values come straight from feature attributes, e.g. a NULL QVariant or a text depth
+    return float(value) if isinstance(value, numbers.Real) else np.nan
+
+
+def _from_float(value: float):
+    return None if np.isnan(value) else float(value)
+
+
+def get_section_arrays(section: CrossSection) -> tuple:
+    """
+    Splits a CrossSection into arrays and json metadata
+    :return: dict of member names and arrays, dict of json serializable metadata
+    """
+    arrays = {'x': section.x, 'z': section.z, 'line': section.line}
+    if section.surfaces_x is not None:
+        arrays['surfaces_x'] = section.surfaces_x
+    for i, z in enumerate(section.surfaces.values()):
+        arrays[f'surfaces/{i}'] = z
+
+    names = list(section.explorations)
+    arrays['explorations/name'] = np.array(names, dtype=str)
+    for column in EXPLORATION_COLUMNS:
+        arrays[f'explorations/{column}'] = np.array(
+            [_to_float(d.get(column)) for d in section.explorations.values()], dtype=float
+        )
+    # other per-exploration values (e.g. projectNumber) are few, they go to the metadata
+    known = set(EXPLORATION_COLUMNS) | {'intervals', 'minDistPoint'}
+    attributes = {
+        name: {key: value for key, value in d.items() if key not in known}
+        for name, d in section.explorations.items()
+    }
+
+    frames = [(name, d['intervals']) for name, d in section.explorations.items() if d.get('intervals') is not None]
+    arrays['intervals/exploration'] = np.array(
+        [name for name, intervals in frames for _ in range(len(intervals))], dtype=str
+    )
+    for column, dtype in INTERVAL_COLUMNS.items():
+        values = [intervals[column].to_numpy(dtype=object) for _, intervals in frames]
+        values = np.concatenate(values) if values else np.array([], dtype=object)
+        if dtype is float:
+            arrays[f'intervals/{column}'] = np.array([_to_float(v) for v in values], dtype=float)
+        else:
+            arrays[f'intervals/{column}'] = np.array(values, dtype=dtype)
+
+    meta = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'num_points': section.num_points,
+        'interpolation': section.interpolation,
+        'surfaces': list(section.surfaces),
+        'attributes': attributes,
+        'has_intervals': bool(frames),
+    }
+    return arrays, meta
+
+
+def save_section(section: CrossSection, path, style: dict = None) -> Path:
+    """
+    Writes a CrossSection to a section file
+    :param section: CrossSection
+    :param path: file to write, SUFFIX is added if it has no suffix
+    :param style: optional json serializable figure settings, e.g. {'renderer': 'plotly', 'stratigraphy': True},
+        passed to plotting.plot_cross_section() when the figure is rebuilt
+    :return: path of the written file
+    """
+    path = Path(path)
+    if not path.suffix:
+        path = path.with_suffix(SUFFIX)
+    arrays, meta = get_section_arrays(section)
+    meta['style'] = style or {}
+    # written next to the file and moved over it once complete: the section may have been read from the file it
+    # is saved to, with its arrays memory-mapped from it, and truncating the file would pull the data from under
+    # them
+    temp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        # stored uncompressed so the arrays can be memory-mapped
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr(META_MEMBER, json.dumps(meta, default=str))
+            for name, array in arrays.items():
+                with zf.open(f'{name}.npy', 'w', force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return path
+
+
+class SectionFile:
+
+    def __init__(self, path, mmap: bool = True):
+        """
+        Section file opened lazily: only the metadata is read, arrays are read on first access
+        :param path: section file written by save_section()
+        :param mmap: memory-map the arrays from the file instead of reading them into memory
+        """
+        self.path = Path(path)
+        self.mmap = mmap
+        self._arrays = {}
+        with zipfile.ZipFile(self.path) as zf:
+            self.meta = json.loads(zf.read(META_MEMBER))
+            self._members = {
+                info.filename[:-len('.npy')]: info for info in zf.infolist() if info.filename.endswith('.npy')
+            }
+        if self.meta.get('format') != FORMAT_NAME:
+            raise ValueError(f'{self.path} is not a cross-section file')
+        if self.meta['version'] > FORMAT_VERSION:
+            raise ValueError(
+                f"{self.path} has format version {self.meta['version']}, this version reads up to {FORMAT_VERSION}"
+            )
+
+    @property
+    def version(self) -> int:
+        return self.meta['version']
+
+    @property
+    def style(self) -> dict:
+        return self.meta.get('style', {})
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Array of a member, e.g. 'x' or 'explorations/lidar', read on first access"""
+        if name not in self._arrays:
+            self._arrays[name] = self._read_array(name)
+        return self._arrays[name]
+
+    def __contains__(self, name: str):
+        return name in self._members
+
+    @property
+    def x(self) -> np.ndarray:
+        return self['x']
+
+    @property
+    def z(self) -> np.ndarray:
+        return self['z']
+
+    @property
+    def line(self) -> np.ndarray:
+        return self['line']
+
+    def _read_array(self, name: str) -> np.ndarray:
+        info = self._members[name]
+        with open(self.path, 'rb') as f:
+            # the member's data starts after its local file header
+            f.seek(info.header_offset)
+            local_header = f.read(zipfile.sizeFileHeader)
+            name_length, extra_length = np.frombuffer(local_header[26:30], dtype='<u2')
+            f.seek(info.header_offset + zipfile.sizeFileHeader + int(name_length) + int(extra_length))
+            major, minor = np.lib.format.read_magic(f)
+            if (major, minor) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            if not self.mmap or int(np.prod(shape)) == 0:
+                return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(
+                    shape, order='F' if fortran_order else 'C'
+                )
+        return np.memmap(
+            self.path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C'
+        )
+
+    def get_explorations(self) -> dict:
+        """Explorations in the layout of CrossSection.explorations, with their unit intervals as DataFrames"""
+        names = self['explorations/name']
+        columns = {column: self[f'explorations/{column}'] for column in EXPLORATION_COLUMNS}
+        intervals = self.get_intervals() if self.meta.get('has_intervals') else None
+        explorations = {}
+        for i, name in enumerate(names.tolist()):
+            d = {column: _from_float(values[i]) for column, values in columns.items()}
+            for column in ('nextVertexIndex', 'leftOrRightOfSegment'):
+                if d[column] is not None:
+                    d[column] = int(d[column])
+            if d['lidar'] is None:
+                d['lidar'] = np.nan
+            d.update(self.meta['attributes'].get(name, {}))
+            if intervals is not None:
+                d['intervals'] = intervals.get(name)
+            explorations[name] = d
+        return explorations
+
+    def get_intervals(self) -> dict:
+        """dict with exploration names as keys and their unit intervals (DataFrame) as values"""
+        import pandas as pd
+
+        table = pd.DataFrame({'exploration': self['intervals/exploration']})
+        for column in INTERVAL_COLUMNS:
+            table[column] = np.asarray(self[f'intervals/{column}'])
+        for column in ('exploration', 'unit', 'unit_label'):
+            table[column] = table[column].astype('string')
+        return {
+            name: group.reset_index(drop=True)
+            for name, group in table.groupby('exploration', sort=False)
+        }
+
+    def to_cross_section(self) -> CrossSection:
+        surfaces = {name: self[f'surfaces/{i}'] for i, name in enumerate(self.meta['surfaces'])}
+        return CrossSection(
+            x=self.x,
+            z=self.z,
+            line=self.line,
+            explorations=self.get_explorations(),
+            num_points=self.meta['num_points'],
+            interpolation=self.meta['interpolation'],
+            surfaces_x=self['surfaces_x'] if 'surfaces_x' in self else None,
+            surfaces=surfaces,
+        )
+
+    def to_figure(self, fig_factory=None, **kwargs):
+        """
+        Rebuilds the figure of the section with its stored style
+        :param fig_factory: callable returning an empty figure of the style's renderer (Fig, BokehFig, ...),
+            defaults to a plotly Figure for the 'plotly' renderer
+        :param kwargs: override the stored style, see plotting.plot_cross_section()
+        :return: the figure
+        """
+        from .plotting import plot_cross_section
+
+        style = dict(self.style, **kwargs)
+        if fig_factory is None:
+            if style.get('renderer', 'plotly') != 'plotly':
+                raise ValueError(f"a fig_factory is needed for the {style['renderer']} renderer")
+            import plotly.graph_objects as go
+            fig_factory = go.Figure
+        fig = fig_factory()
+        plot_cross_section(fig, self.to_cross_section(), **style)
+        return fig
+
+
+def load_section(path, mmap: bool = False) -> CrossSection:
+    """
+    Reads a section file written by save_section()
+    :param mmap: memory-map the arrays instead of reading them into memory. The file then stays open while the
+        section is used: on Windows it cannot be overwritten, e.g. by saving the section back to it.
+    """
+    return SectionFile(path, mmap=mmap).to_cross_section()
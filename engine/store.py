@@ -0,0 +1,230 @@
+"""Embedded DuckDB store of the exploration database, the survey database and exploration coordinates.
+
+Sources are only re-ingested when their file changes, and a section's explorations with their
+unit intervals come back from a single SQL query, see ExplorationStore.explorations_near_line().
+"""
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .explorations import ExplorationDatabase, NULL_VALUES
+from .sampling import sample_points_along_line
+
+SURVEY_COORDINATE_COLUMNS = ['latitude', 'longitude', 'northing', 'easting']
+
+# exploration coordinates from the survey database, preferring the ground shot and the latest survey
+POINTS_VIEW_SQL = """
+CREATE OR REPLACE VIEW points AS
+SELECT exploration, easting AS x, northing AS y, elevation AS survey_elev
+FROM survey
+WHERE exploration IS NOT NULL AND easting IS NOT NULL AND northing IS NOT NULL
+QUALIFY row_number() OVER (
+    PARTITION BY exploration
+    ORDER BY measuring_point <> 'Ground', plan_date DESC NULLS LAST
+) = 1
+"""
+
+# explorations within a distance of the line registered as 'segments', with their unit intervals
+NEAR_LINE_SQL = """
+WITH candidates AS (
+    SELECT * FROM points
+    WHERE x BETWEEN ? AND ? AND y BETWEEN ? AND ?
+), pairs AS (
+    SELECT c.*, s.*,
+        coalesce(greatest(0.0, least(1.0,
+            ((c.x - s.x0) * s.dx + (c.y - s.y0) * s.dy) / nullif(s.length_sqr, 0)
+        )), 0.0) AS t
+    FROM candidates c CROSS JOIN segments s
+), projected AS (
+    SELECT
+        exploration, x, y, survey_elev,
+        segment_index + 1 AS next_vertex_index,
+        chainage + t * length AS distance_along_line,
+        x0 + t * dx AS min_dist_x,
+        y0 + t * dy AS min_dist_y,
+        sqrt(pow(x - (x0 + t * dx), 2) + pow(y - (y0 + t * dy), 2)) AS dist,
+        -sign(dx * (y - y0) - dy * (x - x0)) AS side
+    FROM pairs
+    QUALIFY row_number() OVER (PARTITION BY exploration ORDER BY dist, segment_index) = 1
+)
+SELECT
+    p.*,
+    e.ground_elev, e.total_depth, e.total_depth_elev, e.boh_unit,
+    i.unit, i.unit_label, i.depth_top, i.depth_bottom, i.elev_top, i.elev_bottom, i.below_bottom_of_hole
+FROM projected p
+LEFT JOIN explorations e USING (exploration)
+LEFT JOIN intervals i USING (exploration)
+WHERE p.dist <= ?
+ORDER BY p.distance_along_line, p.exploration, i.depth_top
+"""
+
+
+def to_snake_case(column: str) -> str:
+    """'Northing (WA83-SF)' -> 'northing', 'Measuring Point' -> 'measuring_point'"""
+    column = re.sub(r'\s*\(.*?\)', '', column).strip().lower()
+    return re.sub(r'\W+', '_', column)
+
+
+def read_survey_database(path) -> pd.DataFrame:
+    """
+    Reads the survey database spreadsheet, with snake case column names and typed coordinates
+    """
+    survey = pd.read_excel(path, na_values=NULL_VALUES)
+    survey.columns = [to_snake_case(column) for column in survey.columns]
+    for column in SURVEY_COORDINATE_COLUMNS + ['elevation']:
+        if column in survey.columns:
+            survey[column] = pd.to_numeric(survey[column], errors='coerce')
+    for column in survey.columns:
+        if survey[column].dtype == object:
+            survey[column] = survey[column].astype('string')
+    return survey
+
+
+class ExplorationStore:
+
+    def __init__(self, db_path, exploration_database_path=None, survey_path=None):
+        """
+        Local DuckDB file with the tables explorations, intervals (see engine.explorations), survey and
+        the view points (exploration coordinates from the survey).
+        :param db_path: path of the DuckDB database file, created if it does not exist
+        :param exploration_database_path: path of the exploration database csv
+        :param survey_path: path of the survey database spreadsheet
+        """
+        self.db_path = Path(db_path)
+        self.sources = {}
+        if exploration_database_path is not None:
+            self.sources['exploration_database'] = Path(exploration_database_path)
+        if survey_path is not None:
+            self.sources['survey'] = Path(survey_path)
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            try:
+                import duckdb
+            except ImportError as e:
+                raise ImportError('duckdb is needed for the exploration store') from e
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = duckdb.connect(str(self.db_path))
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS sources '
+                '(name VARCHAR PRIMARY KEY, path VARCHAR, mtime_ns BIGINT, size BIGINT)'
+            )
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def is_current(self, name: str) -> bool:
+        """True if the source 'name' has been ingested and its file has not changed since"""
+        path = self.sources[name]
+        stat = path.stat()
+        row = self.connection.execute(
+            'SELECT path, mtime_ns, size FROM sources WHERE name = ?', [name]
+        ).fetchone()
+        return row == (str(path), stat.st_mtime_ns, stat.st_size)
+
+    def ingest(self, force: bool = False) -> list:
+        """
+        Re-ingests the sources whose files changed since they were last ingested
+        :param force: re-ingest all sources
+        :return: names of the re-ingested sources
+        """
+        ingested = []
+        for name, path in self.sources.items():
+            if not force and self.is_current(name):
+                continue
+            if name == 'exploration_database':
+                database = ExplorationDatabase(path)
+                self.write_table('explorations', database.explorations)
+                self.write_table('intervals', database.intervals)
+            elif name == 'survey':
+                self.write_table('survey', read_survey_database(path))
+                self.connection.execute(POINTS_VIEW_SQL)
+            stat = path.stat()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)',
+                [name, str(path), stat.st_mtime_ns, stat.st_size]
+            )
+            ingested.append(name)
+        return ingested
+
+    def write_table(self, table: str, df: pd.DataFrame):
+        self.connection.register('_ingest', df)
+        self.connection.execute(f'CREATE OR REPLACE TABLE {table} AS SELECT * FROM _ingest')
+        self.connection.unregister('_ingest')
+
+    def query(self, sql: str, parameters: list = None) -> pd.DataFrame:
+        return self.connection.execute(sql, parameters or []).df()
+
+    def explorations_near_line(self, line, distance: float) -> pd.DataFrame:
+        """
+        Explorations within 'distance' of a line, projected onto it, with their unit intervals, in one query
+        :param line: (n, 2) array-like of the line's vertices, in the survey's coordinates
+        :param distance: max offset from the line
+        :return: DataFrame with one row per exploration unit interval (one row with empty unit columns for
+            explorations without intervals): exploration, x, y, survey_elev, next_vertex_index,
+            distance_along_line, min_dist_x, min_dist_y, dist, side, ground_elev, total_depth, ...,
+            unit, depth_top, elev_top, ...
+        """
+        line = np.asarray(line, dtype=float)[:, :2]
+        starts = line[:-1]
+        deltas = np.diff(line, axis=0)
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        segments = pd.DataFrame({
+            'segment_index': np.arange(len(starts)),
+            'x0': starts[:, 0],
+            'y0': starts[:, 1],
+            'dx': deltas[:, 0],
+            'dy': deltas[:, 1],
+            'length': lengths,
+            'length_sqr': lengths ** 2,
+            'chainage': np.concatenate(([0.0], np.cumsum(lengths)[:-1])),
+        })
+        (xmin, ymin), (xmax, ymax) = line.min(axis=0) - distance, line.max(axis=0) + distance
+        self.connection.register('segments', segments)
+        try:
+            return self.query(NEAR_LINE_SQL, [xmin, xmax, ymin, ymax, distance])
+        finally:
+            self.connection.unregister('segments')
+
+    def get_explorations_dict(self, line, distance: float, dem=None, interpolation: str = 'nearest') -> dict:
+        """
+        explorations_near_line() in the layout of engine.project_explorations(), for plotting
+        :param dem: optional DEM source to sample the ground elevation ('lidar') from. Defaults to the
+            database's ground elevation, or the survey elevation.
+        :return: dict with exploration names as keys and dicts of exploration data as values
+        """
+        rows = self.explorations_near_line(line, distance)
+        explorations = {}
+        for name, group in rows.groupby('exploration', sort=False):
+            first = group.iloc[0]
+            ground_elev = first['ground_elev'] if pd.notna(first['ground_elev']) else first['survey_elev']
+            total_depth = first['total_depth']
+            intervals = group.dropna(subset=['unit'])
+            explorations[name] = {
+                'Dist': float(first['dist']),
+                'minDistX': float(first['min_dist_x']),
+                'minDistY': float(first['min_dist_y']),
+                'nextVertexIndex': int(first['next_vertex_index']),
+                'leftOrRightOfSegment': int(first['side']),
+                'distanceAlongLine': float(first['distance_along_line']),
+                'lidar': float(ground_elev) if pd.notna(ground_elev) else np.nan,
+                'ExploDepth': float(total_depth) if pd.notna(total_depth) else None,
+                'x': float(first['x']),
+                'y': float(first['y']),
+                'intervals': intervals.reset_index(drop=True) if len(intervals) else None,
+            }
+        if dem is not None and explorations:
+            distances = np.array([d['distanceAlongLine'] for d in explorations.values()])
+            xs = np.array([d['x'] for d in explorations.values()])
+            ys = np.array([d['y'] for d in explorations.values()])
+            elevations = sample_points_along_line(dem, distances, xs, ys, interpolation=interpolation)
+            for d, elevation in zip(explorations.values(), elevations):
+                d['lidar'] = float(elevation)
+        return explorations
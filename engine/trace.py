@@ -0,0 +1,177 @@
+"""Lightweight tracing of the pipeline stages.
+
+A Tracer records how long each stage took, how often it ran and how many items it handled, and can
+write the spans as a Chrome trace (chrome://tracing, or https://ui.perfetto.dev). Tracing is off by
+default: a disabled tracer's stage() hands back a shared no-op context and traced() functions only pay
+for one attribute check, so the instrumentation can stay in the hot paths.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _Span:
+    """Context of one running stage, set_items() records how many items it handled"""
+    __slots__ = ('items',)
+
+    def __init__(self):
+        self.items = None
+
+    def set_items(self, items):
+        self.items = items
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set_items(self, items):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def count_items(value) -> int:
+    """Number of items in a stage's result: its length, or the summed lengths of a dict of sequences"""
+    if value is None:
+        return 0
+    if isinstance(value, dict) and value and all(hasattr(v, '__len__') for v in value.values()):
+        return sum(len(v) for v in value.values())
+    if hasattr(value, '__len__'):
+        return len(value)
+    return None
+
+
+class Tracer:
+
+    def __init__(self, enabled: bool = False, max_events: int = 100000):
+        """
+        :param enabled: record stages, a disabled tracer records nothing
+        :param max_events: spans kept for the Chrome trace, the oldest are dropped first. Stage statistics
+            are kept for every span.
+        """
+        self.enabled = enabled
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.reset()
+
+    def reset(self):
+        """Drops all recorded spans and statistics"""
+        with self._lock:
+            self.events = deque(maxlen=self.max_events)
+            self.stats = {}
+            # changes with every recorded span, e.g. to refresh a view only when there is something new
+            self.revision = 0
+
+    def stage(self, name: str, items: int = None):
+        """
+        Context manager timing a stage, e.g. ``with tracer.stage('sample_profile') as span: ...``. Call
+        span.set_items() inside to record the number of items handled, if not passed here.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._stage(name, items)
+
+    @contextmanager
+    def _stage(self, name: str, items: int = None):
+        span = _Span()
+        span.items = items
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record(name, start, time.perf_counter(), span.items)
+
+    def traced(self, name: str = None, items=None):
+        """
+        Decorator timing every call of a function as a stage
+        :param name: stage name, defaults to the function's name
+        :param items: optional callable taking the function's result and returning the number of items, e.g.
+            count_items
+        """
+        def decorator(function):
+            stage_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    result = function(*args, **kwargs)
+                except BaseException:
+                    # failed calls are timed too, but have no result to count, and the error is raised as is
+                    self.record(stage_name, start, time.perf_counter())
+                    raise
+                self.record(stage_name, start, time.perf_counter(), items(result) if items is not None else None)
+                return result
+            return wrapper
+        return decorator
+
+    def record(self, name: str, start: float, end: float, items: int = None):
+        """Adds a span, start and end are time.perf_counter() values"""
+        seconds = end - start
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'items': 0}
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if items is not None:
+                stats['items'] += items
+            self.events.append((name, start, seconds, threading.get_ident(), items))
+            self.revision += 1
+
+    def summary(self) -> list:
+        """
+        Statistics per stage, slowest total first
+        :return: list of dicts with the keys 'stage', 'calls', 'seconds', 'mean_seconds', 'max_seconds', 'items'
+        """
+        with self._lock:
+            rows = [
+                dict(stats, stage=name, mean_seconds=stats['seconds'] / stats['calls'])
+                for name, stats in self.stats.items()
+            ]
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def to_chrome_trace(self) -> dict:
+        """Spans as Chrome trace events ('X' complete events, times in microseconds)"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        trace_events = []
+        for name, start, seconds, thread_id, items in events:
+            event = {
+                'name': name,
+                'cat': 'xsection',
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': seconds * 1e6,
+                'pid': pid,
+                'tid': thread_id,
+            }
+            if items is not None:
+                event['args'] = {'items': items}
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """Writes the spans to a json file that chrome://tracing and Perfetto can open"""
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+# tracer shared by the plugin and the engine, disabled until a user turns timing on
+tracer = Tracer()
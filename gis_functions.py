@@ -1,62 +1,573 @@
-import geopandas.sindex
-import shapely as shp
-import geopandas as gpd
-import pandas as pd
-import qgis.gui as gui
+import hashlib
+import math
+from pathlib import Path
+import numpy as np
 import qgis.core as core
-import qgis.PyQt.QtWidgets as w
+from qgis.PyQt.QtCore import QVariant
 
 
-class SpatialIndex:
+class SpatialIndexCache:
 
-    def __init__(
-            self,
-            iface,
-            layers: list = None,
-    ):
+    def __init__(self, cache_dir: Path = None):
         """
-        Create a QgsSpatialIndex for the selected QgsVectorLayers.
-        :param layers: list of QgsVectorLayers. A spatial index will be created for all layers
+        Keeps one QgsSpatialIndex per vector layer, keyed by layer id, so indexes are only built once
+        per session. Indexes are updated incrementally when features are added, deleted or moved and are
+        invalidated when edits are committed or rolled back.
+        :param cache_dir: optional folder to save indexes to, so a large layer is not re-indexed each
+        session. Only indexes of file based layers are saved, and only reused while the file is unchanged.
         """
-        self.iface = iface
-        self.layers = layers
-        self.reference_geometry = None
-        self.spatial_indexes = None
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._indexes = {}
+        self._bounds = {}
+        self._connections = {}
+        # number of changes to each layer's index, so users of an index can tell their results are stale
+        self._revisions = {}
 
-    @property
-    def spatial_indexes(self):
-        return self._spatial_indexes
+    def get(self, layer: core.QgsVectorLayer) -> core.QgsSpatialIndex:
+        """
+        Gets the spatial index of a layer, loading or building it if it is not cached yet
+        """
+        layer_id = layer.id()
+        if layer_id not in self._indexes:
+            bounds = self.load(layer)
+            if bounds is None:
+                bounds = self.get_feature_bounds(layer)
+                self.save(layer, bounds)
+            spatial_index = core.QgsSpatialIndex()
+            for fid, rect in bounds.items():
+                spatial_index.addFeature(fid, rect)
+            self._indexes[layer_id] = spatial_index
+            self._bounds[layer_id] = bounds
+            self.connect_layer(layer)
+        return self._indexes[layer_id]
+
+    def revision(self, layer_id: str) -> int:
+        """Counter that changes whenever the cached index of the layer is updated or dropped"""
+        return self._revisions.get(layer_id, 0)
+
+    def invalidate(self, layer_id: str):
+        """Drops the cached index of a layer, it will be rebuilt on the next get()"""
+        self._revisions[layer_id] = self.revision(layer_id) + 1
+        self._indexes.pop(layer_id, None)
+        self._bounds.pop(layer_id, None)
+        self.disconnect_layer(layer_id)
+
+    def clear(self):
+        """Drops all cached indexes and disconnects from all layer signals"""
+        for layer_id in list(self._indexes.keys()):
+            self.invalidate(layer_id)
+
+    @staticmethod
+    def get_feature_bounds(layer: core.QgsVectorLayer) -> dict:
+        """
+        Reads the bounding box of every feature of a layer, without fetching attributes
+        :return: dict with feature ids as keys and QgsRectangles as values
+        """
+        request = core.QgsFeatureRequest().setNoAttributes()
+        bounds = {}
+        for feature in layer.getFeatures(request):
+            if feature.hasGeometry():
+                bounds[feature.id()] = feature.geometry().boundingBox()
+        return bounds
+
+    def connect_layer(self, layer: core.QgsVectorLayer):
+        """Connects the layer's edit signals to incremental updates of its cached index"""
+        layer_id = layer.id()
+        connections = [
+            (layer.featureAdded, lambda fid: self.on_feature_added(layer, fid)),
+            (layer.featuresDeleted, lambda fids: self.on_features_deleted(layer_id, fids)),
+            (layer.geometryChanged, lambda fid, geometry: self.on_geometry_changed(layer_id, fid, geometry)),
+            (layer.afterCommitChanges, lambda: self.invalidate(layer_id)),
+            (layer.afterRollBack, lambda: self.invalidate(layer_id)),
+            (layer.willBeDeleted, lambda: self.invalidate(layer_id)),
+        ]
+        for signal, slot in connections:
+            signal.connect(slot)
+        self._connections[layer_id] = connections
+
+    def disconnect_layer(self, layer_id: str):
+        for signal, slot in self._connections.pop(layer_id, []):
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                # the layer has already been deleted
+                pass
+
+    def on_feature_added(self, layer: core.QgsVectorLayer, fid: int):
+        geometry = layer.getFeature(fid).geometry()
+        if geometry.isNull():
+            return
+        rect = geometry.boundingBox()
+        self._indexes[layer.id()].addFeature(fid, rect)
+        self._bounds[layer.id()][fid] = rect
+        self._revisions[layer.id()] = self.revision(layer.id()) + 1
+
+    def on_features_deleted(self, layer_id: str, fids: list):
+        for fid in fids:
+            self.remove_feature(layer_id, fid)
+
+    def on_geometry_changed(self, layer_id: str, fid: int, geometry: core.QgsGeometry):
+        self.remove_feature(layer_id, fid)
+        rect = geometry.boundingBox()
+        self._indexes[layer_id].addFeature(fid, rect)
+        self._bounds[layer_id][fid] = rect
+        self._revisions[layer_id] = self.revision(layer_id) + 1
+
+    def remove_feature(self, layer_id: str, fid: int):
+        rect = self._bounds[layer_id].pop(fid, None)
+        if rect is None:
+            return
+        # QgsSpatialIndex finds the entry to delete by the feature's id and bounding box
+        feature = core.QgsFeature(fid)
+        feature.setGeometry(core.QgsGeometry.fromRect(rect))
+        self._indexes[layer_id].deleteFeature(feature)
+        self._revisions[layer_id] = self.revision(layer_id) + 1
+
+    @staticmethod
+    def get_source_signature(layer: core.QgsVectorLayer) -> str:
+        """
+        String that changes whenever a file based layer's data changes: the source uri, the feature count and
+        the file's modification time
+        :return: the signature, or None if the layer is not read from a file, e.g. a database table, whose
+        changes cannot be told from its source
+        """
+        source = layer.source()
+        source_path = Path(source.split('|')[0])
+        if not source_path.is_file():
+            return None
+        return '|'.join([source, str(layer.featureCount()), str(source_path.stat().st_mtime_ns)])
 
-    @spatial_indexes.setter
-    def spatial_indexes(self, value):
-        spatial_indexes = self.create_spatial_indexes(value)
-        self._spatial_indexes = spatial_indexes
+    def get_cache_file(self, layer: core.QgsVectorLayer) -> Path:
+        source_hash = hashlib.sha1(layer.source().encode('utf-8')).hexdigest()
+        return self.cache_dir.joinpath(f'{source_hash}.npz')
 
-    def create_spatial_indexes(
+    def save(self, layer: core.QgsVectorLayer, bounds: dict):
+        """Saves the feature bounding boxes of a file based layer to the cache folder, if one is set"""
+        if self.cache_dir is None or layer.isEditable():
+            return
+        signature = self.get_source_signature(layer)
+        if signature is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fids = np.fromiter(bounds.keys(), dtype=np.int64, count=len(bounds))
+        rects = np.array(
+            [(r.xMinimum(), r.yMinimum(), r.xMaximum(), r.yMaximum()) for r in bounds.values()],
+            dtype=float
+        ).reshape(-1, 4)
+        np.savez(
+            self.get_cache_file(layer),
+            fids=fids,
+            rects=rects,
+            signature=np.array(signature)
+        )
+
+    def load(self, layer: core.QgsVectorLayer):
+        """
+        Loads the feature bounding boxes of a layer saved by save()
+        :return: dict with feature ids as keys and QgsRectangles as values, or None if there is no
+        saved index or the layer's source has changed since it was saved
+        """
+        if self.cache_dir is None or layer.isEditable():
+            return None
+        signature = self.get_source_signature(layer)
+        cache_file = self.get_cache_file(layer)
+        if signature is None or not cache_file.is_file():
+            return None
+        with np.load(cache_file) as saved:
+            if str(saved['signature']) != signature:
+                return None
+            return {
+                int(fid): core.QgsRectangle(*rect)
+                for fid, rect in zip(saved['fids'], saved['rects'])
+            }
+
+
+class CoordinateTransformCache:
+
+    def __init__(self, transform_context: core.QgsCoordinateTransformContext = None):
+        """
+        Keeps one QgsCoordinateTransform per (source CRS, destination CRS) pair, so transforms are only set up
+        once, and transforms coordinate arrays with one call each
+        :param transform_context: context with the datum transformations to use, defaults to the project's
+        """
+        self.transform_context = transform_context
+        self._transforms = {}
+
+    @staticmethod
+    def get_crs_key(crs: core.QgsCoordinateReferenceSystem) -> str:
+        return crs.authid() or crs.toWkt()
+
+    def get(
+            self,
+            source_crs: core.QgsCoordinateReferenceSystem,
+            destination_crs: core.QgsCoordinateReferenceSystem
+    ) -> core.QgsCoordinateTransform:
+        key = (self.get_crs_key(source_crs), self.get_crs_key(destination_crs))
+        if key not in self._transforms:
+            transform_context = self.transform_context or core.QgsProject.instance().transformContext()
+            self._transforms[key] = core.QgsCoordinateTransform(source_crs, destination_crs, transform_context)
+        return self._transforms[key]
+
+    def needs_transform(
             self,
-            _
+            source_crs: core.QgsCoordinateReferenceSystem,
+            destination_crs: core.QgsCoordinateReferenceSystem
+    ) -> bool:
+        return (
+            source_crs.isValid() and destination_crs.isValid()
+            and self.get_crs_key(source_crs) != self.get_crs_key(destination_crs)
+        )
+
+    def get_array_transform(
+            self,
+            source_crs: core.QgsCoordinateReferenceSystem,
+            destination_crs: core.QgsCoordinateReferenceSystem
     ):
-        try:
-            spatial_indexes = {layer: core.QgsSpatialIndex(layer.getFeatures()) for layer in self.layers}
-        except ValueError:
-            print('layers provided are not valid QgsVectorLayers')
-            spatial_indexes = None
-        return spatial_indexes
+        """
+        Callable transforming x and y arrays between two CRSs, e.g. for engine.ReprojectedDem. It transforms a
+        copy of the cached transform, so it can be called from a QgsTask.
+        :return: callable taking x and y arrays and returning the transformed arrays, None if the CRSs are the same
+        """
+        if not self.needs_transform(source_crs, destination_crs):
+            return None
+        transform = self.get(source_crs, destination_crs)
+        return lambda xs, ys: transform_arrays(core.QgsCoordinateTransform(transform), xs, ys)
 
-    def get_nearby_features_ids(self, reference_geometry=None):
+    def transform_points(
+            self,
+            source_crs: core.QgsCoordinateReferenceSystem,
+            destination_crs: core.QgsCoordinateReferenceSystem,
+            points
+    ) -> np.ndarray:
         """
-        Function to get the feature ids of features that intersect the
-        :return:
+        Transforms an (n, 2) array-like of x, y coordinates in one call
+        :return: (n, 2) array, the points as they are if the CRSs are the same
         """
-        ids = {}
-        if reference_geometry is None:
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not self.needs_transform(source_crs, destination_crs) or not len(points):
+            return points
+        xs, ys = transform_arrays(self.get(source_crs, destination_crs), points[:, 0], points[:, 1])
+        return np.column_stack((xs, ys))
+
+    def clear(self):
+        """Drops the cached transforms, e.g. when the project's transform context changes"""
+        self._transforms = {}
+
+
+def transform_arrays(transform: core.QgsCoordinateTransform, xs, ys) -> tuple:
+    """
+    Transforms x and y arrays with one call into QGIS, instead of one call per point: the coordinates are
+    transformed as the vertices of a single QgsLineString
+    :return: tuple of x and y arrays
+    """
+    xs = np.asarray(xs, dtype=float)
+    if xs.size == 0:
+        return xs, np.asarray(ys, dtype=float)
+    line = core.QgsLineString(xs.tolist(), np.asarray(ys, dtype=float).tolist())
+    line.transform(transform)
+    return np.array(line.xVector(), dtype=float), np.array(line.yVector(), dtype=float)
+
+
+class NearbyFeatureQuery:
+
+    def __init__(self, cache: SpatialIndexCache, attributes: list = None,
+                 transform_cache: CoordinateTransformCache = None):
+        """
+        Incremental search for the features within a tolerance of a line. Every candidate fetched for a layer is
+        kept with its offset (distance to the line), so:
+        - shrinking the tolerance only filters the kept offsets, nothing is read from the layer
+        - growing it only fetches the candidates in the bounding box of the larger buffer that were not
+          fetched yet, i.e. the ring between the old and the new buffer
+        - a layer added to the query is the only one searched
+        Results are dropped when the line changes or a layer's spatial index is edited. Layers in another CRS
+        than the line are searched with the transformed bounding box, and offsets are measured in the line's CRS.
+        :param cache: SpatialIndexCache the indexes of the layers are taken from
+        :param attributes: optional list of field names to fetch. None fetches all attributes.
+        :param transform_cache: CoordinateTransformCache for layers in another CRS than the line
+        """
+        self.cache = cache
+        self.attributes = attributes
+        self.transform_cache = transform_cache or CoordinateTransformCache()
+        self.line_geometry: core.QgsGeometry = None
+        self.line_crs = core.QgsCoordinateReferenceSystem()
+        self._line_engine = None
+        # per layer id: tolerance searched, index revision, fetched features and their offsets by feature id
+        self._layers = {}
+
+    def set_line(self, line_geometry: core.QgsGeometry, crs: core.QgsCoordinateReferenceSystem = None):
+        """Sets the line to search around and its CRS, results for the previous line are dropped"""
+        self.line_geometry = line_geometry
+        self.line_crs = crs if crs is not None else core.QgsCoordinateReferenceSystem()
+        self._line_engine = core.QgsGeometry.createGeometryEngine(line_geometry.constGet())
+        self._line_engine.prepareGeometry()
+        self._layers = {}
+
+    def covers(self, layers: list, tolerance: float) -> bool:
+        """True if the features within the tolerance are known for all layers, without reading them"""
+        return all(
+            layer.id() in self._layers
+            and self._layers[layer.id()]['tolerance'] >= tolerance
+            and self._layers[layer.id()]['revision'] == self.cache.revision(layer.id())
+            for layer in layers
+        )
+
+    def get_nearby_features(self, layers: list, tolerance: float) -> dict:
+        """
+        Gets the features within the tolerance of the line, fetching only what earlier queries have not
+        :param layers: list of QgsVectorLayers to search
+        :param tolerance: max distance of a feature to the line, in map units
+        :return: dict with layer names as keys and lists of QgsFeatures, sorted by feature id, as values
+        """
+        if self.line_geometry is None:
+            return
+        features = {}
+        for layer in layers:
+            state = self._layers.get(layer.id())
+            if state is None or state['revision'] != self.cache.revision(layer.id()):
+                state = self._layers[layer.id()] = {
+                    'tolerance': -1.0,
+                    'revision': None,
+                    'features': {},
+                    'offsets': {},
+                }
+            if tolerance > state['tolerance']:
+                self.fetch_ring(layer, state, tolerance)
+            features[layer.name()] = [
+                state['features'][fid] for fid, offset in sorted(state['offsets'].items()) if offset <= tolerance
+            ]
+        return features
+
+    def get_nearby_features_ids(self, layers: list, tolerance: float) -> dict:
+        """
+        Feature ids of the features within the tolerance of the line, see get_nearby_features()
+        :return: dict with layer names as keys and lists of feature ids as values
+        """
+        features = self.get_nearby_features(layers, tolerance)
+        if features is None:
             return
-        for layer, spatial_index in self.spatial_indexes.items():
-            ids[layer.name()] = []
-            ids_in_bounding_box = spatial_index.intersects(reference_geometry.boundingBox())
-            for fid in ids_in_bounding_box:
-                feature = layer.getFeature(fid)
-                if feature.geometry().intersects(reference_geometry):
-                    ids[layer.name()].append(fid)
-            core.QgsProject.instance().mapLayersByName(layer.name())[0].selectByIds(ids[layer.name()])
-        return ids
+        return {layer_name: [feature.id() for feature in layer_features]
+                for layer_name, layer_features in features.items()}
+
+    def fetch_ring(self, layer: core.QgsVectorLayer, state: dict, tolerance: float):
+        """Fetches the candidates of the layer within the tolerance's bounding box that were not fetched yet"""
+        spatial_index = self.cache.get(layer)
+        state['revision'] = self.cache.revision(layer.id())
+        bounding_box = self.line_geometry.boundingBox().buffered(tolerance)
+        to_line_crs = None
+        if self.transform_cache.needs_transform(layer.crs(), self.line_crs):
+            bounding_box = self.transform_cache.get(self.line_crs, layer.crs()).transformBoundingBox(bounding_box)
+            to_line_crs = self.transform_cache.get(layer.crs(), self.line_crs)
+        new_fids = [fid for fid in spatial_index.intersects(bounding_box) if fid not in state['offsets']]
+        if new_fids:
+            request = core.QgsFeatureRequest().setFilterFids(new_fids)
+            if self.attributes is not None:
+                field_names = [name for name in self.attributes if name in layer.fields().names()]
+                request.setSubsetOfAttributes(field_names, layer.fields())
+            for feature in layer.getFeatures(request):
+                if not feature.hasGeometry():
+                    continue
+                geometry = feature.geometry()
+                if to_line_crs is not None:
+                    geometry = core.QgsGeometry(geometry)
+                    geometry.transform(to_line_crs)
+                state['features'][feature.id()] = feature
+                state['offsets'][feature.id()] = self._line_engine.distance(geometry.constGet())
+        state['tolerance'] = tolerance
+
+
+# numpy dtypes of the QGIS raster data types that can be read as a plain array
+RASTER_DTYPES = {
+    'Byte': np.uint8,
+    'Int8': np.int8,
+    'UInt16': np.uint16,
+    'Int16': np.int16,
+    'UInt32': np.uint32,
+    'Int32': np.int32,
+    'Float32': np.float32,
+    'Float64': np.float64,
+}
+
+
+def raster_block_to_array(block: core.QgsRasterBlock) -> np.ndarray:
+    """
+    Converts a QgsRasterBlock to a 2d float array, with no data cells set to NaN
+    :param block: the block returned by QgsRasterDataProvider.block()
+    :return: np.ndarray of shape (block.height(), block.width())
+    """
+    dtype = None
+    for type_name, numpy_dtype in RASTER_DTYPES.items():
+        if hasattr(core.Qgis, type_name) and block.dataType() == getattr(core.Qgis, type_name):
+            dtype = numpy_dtype
+            break
+    if dtype is None:
+        raise ValueError(f'raster data type {block.dataType()} cannot be converted to an array')
+    array = np.frombuffer(bytes(block.data()), dtype=dtype).reshape(block.height(), block.width())
+    array = array.astype(float)
+    if block.hasNoDataValue():
+        array[array == block.noDataValue()] = np.nan
+    return array
+
+
+def get_raster_grid(layer: core.QgsRasterLayer) -> dict:
+    """
+    Grid of a raster layer: its top left corner, cell size and size in cells. QgsMapLayer is not thread safe,
+    so the grid is read on the main thread and windows are then read with it from any thread.
+    :return: dict with 'x_min', 'y_max', 'pixel_width', 'pixel_height', 'width' and 'height'
+    """
+    extent = layer.extent()
+    return {
+        'x_min': extent.xMinimum(),
+        'y_max': extent.yMaximum(),
+        'pixel_width': layer.rasterUnitsPerPixelX(),
+        'pixel_height': layer.rasterUnitsPerPixelY(),
+        'width': layer.width(),
+        'height': layer.height(),
+    }
+
+
+def read_raster_window(
+        provider: core.QgsRasterDataProvider,
+        grid: dict,
+        xmin: float,
+        ymin: float,
+        xmax: float,
+        ymax: float,
+        pad: int = 0,
+        band: int = 1
+) -> tuple:
+    """
+    Reads the cells of a raster under a bounding box with a single provider.block() call.
+    The window is snapped to the raster grid so cells are read at native resolution.
+    :param provider: the raster layer's data provider, or a clone of it for reading from a background thread
+    :param grid: grid of the raster, see get_raster_grid()
+    :param pad: number of extra cells to read on every side, e.g. for interpolation kernels
+    :param band: raster band number
+    :return: a tuple of (array, geotransform), geotransform is GDAL style
+    """
+    x_min = grid['x_min']
+    y_max = grid['y_max']
+    pixel_width = grid['pixel_width']
+    pixel_height = grid['pixel_height']
+    col0 = max(math.floor((xmin - x_min) / pixel_width) - pad, 0)
+    col1 = min(math.floor((xmax - x_min) / pixel_width) + 1 + pad, grid['width'])
+    row0 = max(math.floor((y_max - ymax) / pixel_height) - pad, 0)
+    row1 = min(math.floor((y_max - ymin) / pixel_height) + 1 + pad, grid['height'])
+    x_origin = x_min + col0 * pixel_width
+    y_origin = y_max - row0 * pixel_height
+    geotransform = (x_origin, pixel_width, 0.0, y_origin, 0.0, -pixel_height)
+    if col1 <= col0 or row1 <= row0:
+        return np.empty((0, 0)), geotransform
+    block_extent = core.QgsRectangle(
+        x_origin,
+        y_max - row1 * pixel_height,
+        x_min + col1 * pixel_width,
+        y_origin
+    )
+    block = provider.block(band, block_extent, col1 - col0, row1 - row0)
+    return raster_block_to_array(block), geotransform
+
+
+class RasterLayerDem:
+
+    def __init__(self, layer: core.QgsRasterLayer, band: int = 1, thread_safe: bool = False):
+        """
+        Adapter that lets the headless engine sample a QgsRasterLayer like any other DEM source
+        :param layer: the dem raster layer
+        :param band: raster band number
+        :param thread_safe: read from a clone of the layer's data provider, so the DEM can be sampled
+        from a QgsTask. Must be created on the main thread, the layer itself is not used after that.
+        """
+        self.band = band
+        self.crs = layer.crs().authid()
+        self.grid = get_raster_grid(layer)
+        self.provider = layer.dataProvider().clone() if thread_safe else layer.dataProvider()
+
+    @property
+    def pixel_size(self) -> float:
+        return self.grid['pixel_width']
+
+    def read_window(self, xmin, ymin, xmax, ymax, pad: int = 0) -> tuple:
+        return read_raster_window(self.provider, self.grid, xmin, ymin, xmax, ymax, pad=pad, band=self.band)
+
+
+def attribute_to_str(value, default: str = None) -> str:
+    """
+    A feature attribute as a plain str, e.g. to send it to worker processes, which cannot rely on unpickling
+    QVariants without a QGIS session
+    :return: the value as a str, default if it is NULL
+    """
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return default
+    return str(value)
+
+
+def attribute_to_float(value) -> float:
+    """
+    A numeric feature attribute as a plain float, see attribute_to_str()
+    :return: the value as a float, None if it is NULL, blank or not a number
+    """
+    if value is None or isinstance(value, QVariant):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def line_to_array(line: core.QgsLineString) -> np.ndarray:
+    """
+    Gets the vertices of a QgsLineString as an (n, 2) array of x, y coordinates
+    """
+    return np.column_stack((line.xVector(), line.yVector())).astype(float)
+
+
+def geometry_to_line_string(geometry: core.QgsGeometry) -> core.QgsLineString:
+    """
+    Gets a line geometry as a QgsLineString. For multi line geometries only the first part is used,
+    like the profile.
+    """
+    if geometry.isMultipart():
+        polyline = geometry.asMultiPolyline()[0]
+    else:
+        polyline = geometry.asPolyline()
+    return core.QgsLineString(polyline)
+
+
+def geometry_to_line_array(geometry: core.QgsGeometry) -> np.ndarray:
+    """
+    Gets the vertices of a line geometry as an (n, 2) array of x, y coordinates, see geometry_to_line_string()
+    """
+    return line_to_array(geometry_to_line_string(geometry))
+
+
+def get_features_in_envelope(
+        cache: SpatialIndexCache,
+        layers: list,
+        envelope: tuple,
+        attributes: list = None,
+        crs: core.QgsCoordinateReferenceSystem = None,
+        transform_cache: CoordinateTransformCache = None
+) -> dict:
+    """
+    Fetches the features of each layer whose bounding box intersects an envelope, with one index query and one
+    QgsFeatureRequest per layer
+    :param cache: SpatialIndexCache the indexes of the layers are taken from
+    :param layers: list of QgsVectorLayers
+    :param envelope: (xmin, ymin, xmax, ymax), e.g. engine.corridor.get_union_envelope()
+    :param attributes: optional list of field names to fetch. None fetches all attributes.
+    :param crs: optional CRS of the envelope, it is transformed to the CRS of layers in another CRS
+    :param transform_cache: optional CoordinateTransformCache for the envelope transforms
+    :return: dict with layer names as keys and lists of QgsFeatures as values
+    """
+    transform_cache = transform_cache or CoordinateTransformCache()
+    features = {}
+    for layer in layers:
+        rectangle = core.QgsRectangle(*envelope)
+        if crs is not None and transform_cache.needs_transform(crs, layer.crs()):
+            rectangle = transform_cache.get(crs, layer.crs()).transformBoundingBox(rectangle)
+        request = core.QgsFeatureRequest().setFilterFids(cache.get(layer).intersects(rectangle))
+        if attributes is not None:
+            field_names = [name for name in attributes if name in layer.fields().names()]
+            request.setSubsetOfAttributes(field_names, layer.fields())
+        features[layer.name()] = [feature for feature in layer.getFeatures(request) if feature.hasGeometry()]
+    return features
@@ -0,0 +1,109 @@
+"""Measures what loading the plugin costs QGIS at startup, against a time budget.
+
+Run it with the python of the QGIS install: ``python import_budget.py``. Each run imports the plugin package
+and the module classFactory() loads in a fresh interpreter, after the qgis modules QGIS has already loaded.
+The check fails if the fastest run is over the budget, or if a heavy library (plotly, bokeh, pandas, ...)
+was imported, those must only be loaded on first use. Without qgis, only the engine package is measured.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).parent
+# milliseconds the plugin may add to QGIS startup
+BUDGET_MS = 150
+# libraries that must not be imported when the plugin loads
+HEAVY_MODULES = ['plotly', 'bokeh', 'pandas', 'geopandas', 'shapely', 'psycopg2', 'duckdb', 'osgeo']
+# modules QGIS has imported before it loads plugins, not counted
+PRELOADED_MODULES = ['qgis.core', 'qgis.gui', 'qgis.PyQt.QtWidgets']
+MARKER = '--- plugin import ---'
+
+CHILD_CODE = '''
+import json, sys, time
+sys.path.insert(0, {parent!r})
+try:
+    for module in {preloaded!r}:
+        __import__(module)
+    targets = [{package!r}, {package!r} + '.xsection_plugin_main']
+except ImportError:
+    sys.path.insert(0, {plugin_dir!r})
+    targets = ['engine']
+before = set(sys.modules)
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+for target in targets:
+    __import__(target)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'targets': targets,
+    'elapsed_ms': elapsed * 1000,
+    'new_modules': sorted(set(sys.modules) - before),
+}}))
+'''
+
+
+def parse_import_times(stderr: str) -> list:
+    """
+    Top level entries of python -X importtime output after the marker
+    :return: list of (cumulative microseconds, module name), slowest first
+    """
+    entries = []
+    for line in stderr.split(MARKER, 1)[-1].splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented below their parent
+        if not name[1:].startswith(' '):
+            entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)
+
+
+def measure() -> tuple:
+    """Imports the plugin in a fresh interpreter, returns its result and the slowest top level imports"""
+    code = CHILD_CODE.format(
+        parent=str(PLUGIN_DIR.parent),
+        plugin_dir=str(PLUGIN_DIR),
+        package=PLUGIN_DIR.name,
+        preloaded=PRELOADED_MODULES,
+        marker=MARKER,
+    )
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), parse_import_times(completed.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='max plugin import time')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to import in, the fastest counts')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    result, import_times = min(runs, key=lambda run: run[0]['elapsed_ms'])
+    heavy = sorted({
+        module.split('.')[0] for module in result['new_modules'] if module.split('.')[0] in HEAVY_MODULES
+    })
+
+    print(f"imported {', '.join(result['targets'])} in {result['elapsed_ms']:.1f} ms "
+          f"(budget {args.budget_ms:.0f} ms, fastest of {args.runs} runs)")
+    for cumulative, name in import_times[:args.top]:
+        print(f'{cumulative / 1000:8.1f} ms  {name}')
+    failed = False
+    if result['elapsed_ms'] > args.budget_ms:
+        print('over budget')
+        failed = True
+    if heavy:
+        print(f"heavy libraries imported at load: {', '.join(heavy)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import tempfile
+from pathlib import Path
+
+import qgis.PyQt.QtWidgets as w
+import qgis.gui as gui
+from qgis.PyQt.QtCore import QUrl
+
+try:
+    from . import engine
+except ImportError:
+    import engine
+
+# folder the view pages are written to, they link the plotly and bokeh JS files of the installed packages
+PAGE_DIR = Path(tempfile.gettempdir()).joinpath('xsection_plot_view')
+MINIMUM_HEIGHT = 400
+
+
+def get_web_view_class():
+    """QWebEngineView, imported on first use as it loads Chromium, or None if QtWebEngine is not installed"""
+    try:
+        from qgis.PyQt.QtWebEngineWidgets import QWebEngineView
+    except ImportError:
+        try:
+            from PyQt5.QtWebEngineWidgets import QWebEngineView
+        except ImportError:
+            return None
+    return QWebEngineView
+
+
+class PlotView(gui.QgsCollapsibleGroupBox):
+
+    def __init__(self, parent=None):
+        """
+        Collapsible dock panel showing the figures in place. The page of a renderer, with plotly.js or BokehJS, is
+        loaded once and every figure after that is sent as an update, see engine.live_plot. Without QtWebEngine
+        the panel stays hidden and available is False, the figures are then opened in the browser.
+        """
+        super().__init__('Plot', parent)
+        self.web_view = None
+        self._available = None
+        # renderer of the page loaded, or loading, and whether it has finished loading
+        self._page_renderer = None
+        self._page_ready = False
+        # latest update sent before the page was ready, and the figure it came from
+        self._pending = None
+        # 'signature' of the bokeh update shown, see engine.live_plot.get_update_script()
+        self.shown_signature = None
+        self.view_layout = w.QVBoxLayout(self)
+        self.setVisible(False)
+
+    @property
+    def available(self) -> bool:
+        """Whether figures can be shown in the panel, creates the web view on first access"""
+        if self._available is None:
+            web_view_class = get_web_view_class()
+            self._available = web_view_class is not None
+            if self._available:
+                self.web_view = web_view_class()
+                self.web_view.setMinimumHeight(MINIMUM_HEIGHT)
+                self.web_view.loadFinished.connect(self.on_load_finished)
+                self.view_layout.addWidget(self.web_view)
+        return self._available
+
+    def get_shown_signature(self, renderer: str) -> str:
+        """'signature' of the shown figure if the page of the renderer is loaded, to skip serializing a figure
+        with the same glyphs, see engine.live_plot.get_plot_update()"""
+        return self.shown_signature if self._page_renderer == renderer else None
+
+    def show_figure(self, fig, renderer: str = 'plotly') -> bool:
+        """Shows a figure in the panel, see show_update(). :return: False if the panel is not available"""
+        if not self.available:
+            return False
+        update = engine.live_plot.get_plot_update(
+            fig, renderer, shown_signature=self.get_shown_signature(renderer)
+        )
+        return self.show_update(update, fig=fig)
+
+    def show_update(self, update: dict, fig=None) -> bool:
+        """
+        Shows an update of engine.live_plot.get_plot_update(), loading the page of its renderer first if needed
+        :param fig: the figure of the update, serialized again if the update was made for another shown figure
+        :return: False if the panel is not available
+        """
+        if not self.available:
+            return False
+        self.setVisible(True)
+        renderer = update['renderer']
+        if renderer != self._page_renderer:
+            self.load_page(renderer)
+        if not self._page_ready:
+            self._pending = update, fig
+            return True
+        script = engine.live_plot.get_update_script(update, self.shown_signature)
+        if script is None:
+            update = engine.live_plot.get_plot_update(fig, renderer)
+            script = engine.live_plot.get_update_script(update)
+        self.web_view.page().runJavaScript(script)
+        self.shown_signature = update.get('signature')
+        return True
+
+    def load_page(self, renderer: str):
+        self._page_renderer = renderer
+        self._page_ready = False
+        self.shown_signature = None
+        page_path = engine.live_plot.write_page(renderer, PAGE_DIR)
+        self.web_view.setUrl(QUrl.fromLocalFile(str(page_path)))
+
+    def on_load_finished(self, ok: bool):
+        if not ok:
+            print(f'the {self._page_renderer} plot view failed to load')
+            return
+        self._page_ready = True
+        if self._pending is not None:
+            update, fig = self._pending
+            self._pending = None
+            self.show_update(update, fig=fig)
@@ -0,0 +1,216 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import qgis.core as core
+
+try:
+    from . import engine
+except ImportError:
+    import engine
+
+
+class CrossSectionTask(core.QgsTask):
+
+    def __init__(
+            self,
+            line,
+            dem,
+            explorations_input: dict = None,
+            explorations: dict = None,
+            fig_factory=None,
+            renderer: str = 'plotly',
+            num_points: int = 1000,
+            interpolation: str = 'nearest',
+            html_path: Path = None,
+            on_finished=None,
+            profile_cache: engine.ProfileCache = None,
+            profile_cache_key: str = None,
+            surfaces: dict = None,
+            show_difference: bool = False,
+            stratigraphy: bool = False,
+            live_plot: bool = False,
+            shown_signature: str = None,
+    ):
+        """
+        Background task that samples the profile, projects the explorations, builds the figure and writes
+        it to html, or serializes it for the plot view, so the QGIS GUI thread stays responsive. Everything QGIS
+        related must be read on the main thread beforehand; the task only works on arrays and a thread safe DEM
+        source.
+        :param line: (n, 2) array of the section line's vertices
+        :param dem: DEM source to sample, e.g. gis.RasterLayerDem(layer, thread_safe=True)
+        :param explorations_input: keyword arguments for engine.project_explorations(): points, names,
+        depths and attributes. None to plot the ground line only.
+        :param explorations: optional explorations already projected onto the line, e.g. from
+        engine.ExplorationStore.get_explorations_dict(), used instead of explorations_input
+        :param fig_factory: callable returning a new, empty Fig or BokehFig
+        :param renderer: 'plotly' or 'bokeh'
+        :param num_points: number of intervals along the line, None to space stations from the DEM resolution
+        :param interpolation: 'nearest', 'bilinear' or 'cubic'
+        :param html_path: html file the figure is written to, defaults to a temporary file
+        :param profile_cache: optional cache to take the profile from, or add it to once sampled
+        :param profile_cache_key: key of the profile in the cache, see ProfileCache.make_key()
+        :param surfaces: optional dict of surface names and thread safe DEM sources to sample at the same
+        stations as the ground, in one pass
+        :param show_difference: plot the cut and fill of each surface relative to the ground
+        :param stratigraphy: plot the explorations as stratigraphic columns, one trace per geologic unit
+        :param live_plot: serialize the figure as plot_update, see engine.live_plot.get_plot_update(), instead of
+        writing the html file
+        :param shown_signature: signature of the figure shown in the plot view, see PlotView.get_shown_signature()
+        :param on_finished: callable called on the main thread with the task and its result (True if it
+        succeeded) when the task finishes, is cancelled or fails
+        """
+        super().__init__('X-sect: cross section', core.QgsTask.CanCancel)
+        self.line = line
+        self.dem = dem
+        self.explorations_input = explorations_input
+        self.explorations = explorations
+        self.fig_factory = fig_factory
+        self.renderer = renderer
+        self.num_points = num_points
+        self.interpolation = interpolation
+        if html_path is None:
+            html_path = Path(tempfile.gettempdir()).joinpath(f'xsection_{id(self)}.html')
+        self.html_path = html_path
+        self.on_finished = on_finished
+        self.profile_cache = profile_cache
+        self.profile_cache_key = profile_cache_key
+        self.surfaces = surfaces or {}
+        self.show_difference = show_difference
+        self.stratigraphy = stratigraphy
+        self.live_plot = live_plot
+        self.shown_signature = shown_signature
+        self.plot_update = None
+        self.section = None
+        self.fig = None
+        self.exception = None
+
+    def run(self):
+        try:
+            with engine.tracer.stage('task.sample_profile') as span:
+                profile = None
+                surfaces_x = None
+                surfaces_z = {}
+                if self.surfaces:
+                    surfaces_x, z_stack = engine.sample_profiles(
+                        self.line,
+                        [self.dem] + list(self.surfaces.values()),
+                        num_points=self.num_points,
+                        interpolation=self.interpolation
+                    )
+                    valid = ~np.isnan(z_stack[0])
+                    profile = surfaces_x[valid], z_stack[0][valid]
+                    surfaces_z = dict(zip(self.surfaces.keys(), z_stack[1:]))
+                elif self.profile_cache is not None:
+                    profile = self.profile_cache.get(self.profile_cache_key)
+                if profile is None:
+                    profile = engine.sample_profile(
+                        self.line,
+                        self.dem,
+                        num_points=self.num_points,
+                        interpolation=self.interpolation
+                    )
+                    if self.profile_cache is not None:
+                        self.profile_cache.put(self.profile_cache_key, *profile)
+                x, z = profile
+                span.set_items(len(x))
+            self.setProgress(40)
+            if self.isCanceled():
+                return False
+            explorations = self.explorations or {}
+            if self.explorations is None and self.explorations_input is not None:
+                with engine.tracer.stage('task.project_explorations') as span:
+                    explorations = engine.project_explorations(
+                        self.line,
+                        dem=self.dem,
+                        interpolation=self.interpolation,
+                        **self.explorations_input
+                    )
+                    span.set_items(len(explorations))
+            self.section = engine.CrossSection(
+                x=x,
+                z=z,
+                line=self.line,
+                explorations=explorations,
+                num_points=self.num_points,
+                interpolation=self.interpolation,
+                surfaces_x=surfaces_x,
+                surfaces=surfaces_z
+            )
+            self.setProgress(60)
+            if self.isCanceled():
+                return False
+            with engine.tracer.stage('task.plot_cross_section'):
+                self.fig = self.fig_factory()
+                engine.plotting.plot_cross_section(
+                    self.fig,
+                    self.section,
+                    renderer=self.renderer,
+                    show_difference=self.show_difference,
+                    stratigraphy=self.stratigraphy
+                )
+            self.setProgress(80)
+            if self.isCanceled():
+                return False
+            if self.live_plot:
+                with engine.tracer.stage('task.plot_update'):
+                    self.plot_update = engine.live_plot.get_plot_update(
+                        self.fig, self.renderer, shown_signature=self.shown_signature
+                    )
+            else:
+                with engine.tracer.stage('task.write_html'):
+                    self.fig.write_html(self.html_path, config={'scrollZoom': True})
+            self.setProgress(100)
+            return True
+        except Exception as e:
+            self.exception = e
+            return False
+
+    def finished(self, result):
+        if self.exception is not None:
+            print(f'cross section task failed: {self.exception!r}')
+        if self.on_finished is not None:
+            self.on_finished(self, result)
+
+
+class BatchSectionsTask(core.QgsTask):
+
+    def __init__(self, lines: dict, dem, output_dir: Path, on_finished=None, **batch_kwargs):
+        """
+        Background task that builds a cross-section for every line with engine.batch.run_batch(), which fans the
+        lines out over a pool of worker processes.
+        :param lines: dict with line names as keys and (n, 2) vertex arrays as values
+        :param dem: path of the DEM file
+        :param output_dir: folder for the figures and index.html
+        :param on_finished: callable called on the main thread with the task and its result when the task ends
+        :param batch_kwargs: other keyword arguments of engine.batch.run_batch(), e.g. explorations and formats
+        """
+        super().__init__(f'X-sect: {len(lines)} cross sections', core.QgsTask.CanCancel)
+        self.lines = lines
+        self.dem = dem
+        self.output_dir = Path(output_dir)
+        self.on_finished = on_finished
+        self.batch_kwargs = batch_kwargs
+        self.results = None
+        self.exception = None
+
+    def run(self):
+        try:
+            self.results = engine.batch.run_batch(
+                self.lines,
+                self.dem,
+                self.output_dir,
+                on_progress=lambda done, total, result: self.setProgress(100 * done / total),
+                is_canceled=self.isCanceled,
+                **self.batch_kwargs
+            )
+            return not self.isCanceled()
+        except Exception as e:
+            self.exception = e
+            return False
+
+    def finished(self, result):
+        if self.exception is not None:
+            print(f'batch cross section task failed: {self.exception!r}')
+        if self.on_finished is not None:
+            self.on_finished(self, result)
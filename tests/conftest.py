@@ -0,0 +1,46 @@
+"""Shared fixtures of the engine tests. The engine runs without QGIS, the plugin folder is put on sys.path
+so it can be imported as ``engine``, the same way the benchmarks do."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PLUGIN_DIR = Path(__file__).parent.parent
+if str(PLUGIN_DIR) not in sys.path:
+    sys.path.insert(0, str(PLUGIN_DIR))
+
+import engine  # noqa: E402
+
+# the plane the analytic DEM is sampled from, z = Z0 + SLOPE_X * x + SLOPE_Y * y
+Z0 = 100.0
+SLOPE_X = 0.02
+SLOPE_Y = -0.01
+PIXEL_SIZE = 2.0
+CELLS = 200
+
+
+def plane(xs, ys):
+    return Z0 + SLOPE_X * np.asarray(xs) + SLOPE_Y * np.asarray(ys)
+
+
+@pytest.fixture
+def plane_dem() -> engine.Dem:
+    """DEM of a tilted plane, the value of each cell is the plane at the cell's centre"""
+    centres = (np.arange(CELLS) + 0.5) * PIXEL_SIZE
+    xs, ys = np.meshgrid(centres, CELLS * PIXEL_SIZE - centres)
+    return engine.Dem(plane(xs, ys), (0.0, PIXEL_SIZE, 0.0, CELLS * PIXEL_SIZE, 0.0, -PIXEL_SIZE))
+
+
+@pytest.fixture
+def wavy_dem() -> engine.Dem:
+    """DEM with curved terrain, for the adaptive sampler"""
+    rows, cols = np.mgrid[0:CELLS, 0:CELLS].astype(float)
+    z = 50.0 + 10.0 * np.sin(cols / 7.0) * np.cos(rows / 11.0)
+    return engine.Dem(z, (0.0, PIXEL_SIZE, 0.0, CELLS * PIXEL_SIZE, 0.0, -PIXEL_SIZE))
+
+
+@pytest.fixture
+def line() -> np.ndarray:
+    """A bent line well inside the DEMs"""
+    return np.array([[20.0, 30.0], [150.0, 200.0], [300.0, 180.0], [370.0, 350.0]])
@@ -0,0 +1,18 @@
+import numpy as np
+
+import engine
+
+
+def test_adaptive_profile_is_denser_where_the_ground_curves(wavy_dem, plane_dem, line):
+    x_flat, _ = engine.sample_profile_adaptive(line, plane_dem, interpolation='bilinear')
+    x_wavy, _ = engine.sample_profile_adaptive(line, wavy_dem, interpolation='bilinear')
+    x_fine, _ = engine.sample_profile_adaptive(line, wavy_dem, refine=False, interpolation='bilinear')
+    assert len(x_flat) < len(x_wavy) < len(x_fine)
+    np.testing.assert_array_equal(np.unique(x_wavy), x_wavy)
+
+
+def test_refinement_goes_down_to_the_cell_size(wavy_dem, line):
+    # no midpoint is within a negative tolerance, so every interval is refined as far as it goes
+    x, _ = engine.sample_profile_adaptive(line, wavy_dem, vertical_tolerance=-1.0, interpolation='bilinear')
+    intervals = np.diff(x)
+    assert intervals.max() <= wavy_dem.pixel_size and np.median(intervals) > wavy_dem.pixel_size / 2
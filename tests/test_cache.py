@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+import engine
+
+
+def make_profile(n: int, value: float = 0.0):
+    return np.arange(n, dtype=float), np.full(n, value)
+
+
+def test_least_recently_used_is_evicted():
+    # three profiles of 2 * 100 float64 fit
+    cache = engine.ProfileCache(max_bytes=3 * 1600)
+    for key in 'abc':
+        cache.put(key, *make_profile(100))
+    assert cache.get('a') is not None
+    cache.put('d', *make_profile(100))
+    assert cache.get('b') is None
+    assert [key for key in 'acd' if cache.get(key) is not None] == ['a', 'c', 'd']
+    assert cache.nbytes == 3 * 1600
+
+
+def test_too_large_profiles_are_not_cached():
+    cache = engine.ProfileCache(max_bytes=1000)
+    cache.put('a', *make_profile(100))
+    assert cache.get('a') is None and cache.nbytes == 0
+
+
+def test_replacing_a_key_updates_the_size():
+    cache = engine.ProfileCache(max_bytes=10 ** 6)
+    cache.put('a', *make_profile(100))
+    cache.put('a', *make_profile(10, value=1.0))
+    assert len(cache) == 1 and cache.nbytes == 160
+    assert cache.get('a')[1][0] == 1.0
+
+
+def test_profiles_are_read_back_from_disk(tmp_path):
+    cache = engine.ProfileCache(max_bytes=10 ** 6, cache_dir=tmp_path)
+    x, z = make_profile(50, value=3.0)
+    cache.put('a', x, z)
+    reopened = engine.ProfileCache(max_bytes=10 ** 6, cache_dir=tmp_path)
+    assert 'a' in reopened
+    np.testing.assert_array_equal(reopened.get('a')[1], z)
+
+
+def test_keys_change_with_every_part():
+    key = engine.ProfileCache.make_key(b'line', 'EPSG:2927', 'dem', 1, 1000, 'nearest')
+    assert key == engine.ProfileCache.make_key(b'line', 'EPSG:2927', 'dem', 1, 1000, 'nearest')
+    for changed in [
+        (b'other', 'EPSG:2927', 'dem', 1, 1000, 'nearest'),
+        (b'line', 'EPSG:32610', 'dem', 1, 1000, 'nearest'),
+        (b'line', 'EPSG:2927', 'other', 1, 1000, 'nearest'),
+        (b'line', 'EPSG:2927', 'dem', 2, 1000, 'nearest'),
+        (b'line', 'EPSG:2927', 'dem', 1, None, 'nearest'),
+        (b'line', 'EPSG:2927', 'dem', 1, 1000, 'bilinear'),
+    ]:
+        assert engine.ProfileCache.make_key(*changed) != key
+
+
+def test_cached_arrays_are_read_only_copies():
+    cache = engine.ProfileCache()
+    x, z = make_profile(10)
+    cache.put('a', x, z)
+    z[0] = 5.0
+    cached_x, cached_z = cache.get('a')
+    assert cached_z[0] == 0.0
+    with pytest.raises(ValueError):
+        cached_z[0] = 1.0
+
+
+def test_cache_folder_is_pruned_least_recently_used_first(tmp_path):
+    cache = engine.ProfileCache(cache_dir=tmp_path)
+    for i, key in enumerate('abc'):
+        cache.put(key, *make_profile(1000))
+        # files written within the same clock tick would have the same age
+        os.utime(cache.get_cache_file(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    file_size = cache.get_cache_file('a').stat().st_size
+    # reading 'a' back from disk makes it the most recently used file
+    cache.clear()
+    cache.get('a')
+    cache.max_disk_bytes = 3 * file_size
+    cache.put('d', *make_profile(1000))
+    assert sorted(path.stem for path in tmp_path.glob('*.npz')) == ['a', 'c', 'd']
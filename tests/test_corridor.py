@@ -0,0 +1,33 @@
+import numpy as np
+
+import engine
+
+TOLERANCE = 15.0
+
+
+def test_sweep_matches_brute_force():
+    rng = np.random.default_rng(4)
+    lines = {f'L{i}': rng.uniform(0.0, 500.0, (4, 2)) for i in range(12)}
+    points = rng.uniform(0.0, 500.0, (3000, 2))
+    corridors = engine.sweep_corridors(lines, points, TOLERANCE)
+    assert list(corridors) == list(lines)
+    for name, line in lines.items():
+        projection = engine.project_points_to_line(line, points)
+        expected = np.flatnonzero(projection['Dist'] <= TOLERANCE)
+        corridor = corridors[name]
+        assert sorted(corridor['index'].tolist()) == expected.tolist()
+        assert np.all(np.diff(corridor['distanceAlongLine']) >= 0)
+        np.testing.assert_allclose(corridor['Dist'], projection['Dist'][corridor['index']])
+
+
+def test_empty_points():
+    corridors = engine.sweep_corridors({'L': np.array([[0.0, 0.0], [1.0, 1.0]])}, np.empty((0, 2)), TOLERANCE)
+    assert len(corridors['L']['index']) == 0
+
+
+def test_rows():
+    lines = {'A': np.array([[0.0, 0.0], [100.0, 0.0]])}
+    points = np.array([[10.0, 1.0], [50.0, 50.0], [5.0, -2.0]])
+    corridors = engine.sweep_corridors(lines, points, TOLERANCE)
+    rows = engine.corridor.corridors_to_rows(corridors, names=['a', 'b', 'c'], attributes={'layer': ['x', 'y', 'z']})
+    assert [(row['line'], row['name'], row['layer']) for row in rows] == [('A', 'c', 'z'), ('A', 'a', 'x')]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from conftest import PLUGIN_DIR  # noqa: E402
+from engine import explorations  # noqa: E402
+
+DATABASE_PATH = PLUGIN_DIR.joinpath('data', 'Exploration_Database.csv')
+
+
+@pytest.fixture(scope='module')
+def database(tmp_path_factory):
+    database = explorations.ExplorationDatabase(DATABASE_PATH, cache_dir=tmp_path_factory.mktemp('cache'))
+    database.load()
+    return database
+
+
+def test_explorations_table(database):
+    table = database.explorations
+    assert list(table.columns) == list(explorations.EXPLORATION_COLUMNS.values())
+    assert len(table) > 0
+    assert table['exploration'].notna().all()
+    # the human header row is skipped, so the numeric columns parse as numbers
+    assert pd.api.types.is_float_dtype(table['ground_elev'])
+
+
+def test_unit_labels_come_from_the_human_header():
+    labels = explorations.read_unit_labels(DATABASE_PATH)
+    assert labels['QviQvt'] == 'Qvi-Qvt'
+    assert 'Fill' in labels
+
+
+def test_intervals(database):
+    intervals = database.intervals
+    assert set(intervals['exploration']) <= set(database.explorations['exploration'])
+    assert not (intervals['depth_top'].isna() & intervals['depth_bottom'].isna()
+                & intervals['elev_top'].isna() & intervals['elev_bottom'].isna()).any()
+    # BBOH bottoms are replaced by the total depth of their exploration
+    bottom = intervals[intervals['below_bottom_of_hole']]
+    total_depth = database.explorations.set_index('exploration')['total_depth']
+    np.testing.assert_array_equal(
+        bottom['depth_bottom'].to_numpy(), total_depth.loc[bottom['exploration']].to_numpy()
+    )
+
+
+def test_intervals_by_exploration(database):
+    name = database.intervals['exploration'].iloc[0]
+    one = database.get_intervals(name)
+    assert (one['exploration'] == name).all()
+    assert np.all(np.diff(one['depth_top'].to_numpy()) >= 0)
+    assert len(database.get_intervals('no such exploration')) == 0
+
+
+def test_loads_without_a_writable_cache_folder(tmp_path):
+    # a file where the cache folder should be, creating the folder raises like a read-only plugin folder does
+    blocked = tmp_path.joinpath('blocked')
+    blocked.write_text('')
+    database = explorations.ExplorationDatabase(DATABASE_PATH, cache_dir=blocked.joinpath('cache'))
+    database.load()
+    assert len(database.explorations)
+
+
+def test_loads_from_the_csv_when_the_cache_cannot_be_read(database, monkeypatch):
+    cache_files = database.get_cache_files()
+    if not all(cache_file.is_file() for cache_file in cache_files.values()):
+        pytest.skip('no parquet engine installed')
+
+    def read_parquet(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(explorations.pd, 'read_parquet', read_parquet)
+    reloaded = explorations.ExplorationDatabase(DATABASE_PATH, cache_dir=database.cache_dir)
+    reloaded.load()
+    pd.testing.assert_frame_equal(reloaded.explorations, database.explorations)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from engine import lod
+
+
+@pytest.mark.parametrize('method', ['minmax', 'lttb'])
+def test_downsample_keeps_endpoints(method):
+    x = np.linspace(0.0, 1000.0, 100001)
+    y = np.sin(x / 7.0) + 0.001 * x
+    x_out, y_out = lod.downsample(x, y, max_points=1000, method=method)
+    assert len(x_out) <= 1000
+    assert (x_out[0], x_out[-1]) == (x[0], x[-1])
+    assert (y_out[0], y_out[-1]) == (y[0], y[-1])
+    assert np.all(np.diff(x_out) > 0)
+
+
+def test_minmax_keeps_the_extremes():
+    x = np.arange(10000, dtype=float)
+    y = np.zeros(10000)
+    y[1234], y[8765] = 50.0, -50.0
+    _, y_out = lod.downsample(x, y, max_points=100, method='minmax')
+    assert y_out.max() == 50.0 and y_out.min() == -50.0
+
+
+def test_short_series_are_returned_as_is():
+    x, y = np.arange(10.0), np.arange(10.0)
+    x_out, y_out = lod.downsample(x, y, max_points=100)
+    np.testing.assert_array_equal(x_out, x)
+    np.testing.assert_array_equal(y_out, y)
+
+
+def test_x_range_keeps_one_point_past_each_end():
+    x = np.arange(100.0)
+    x_out, _ = lod.downsample(x, x, max_points=None, x_range=(10.5, 20.5))
+    assert (x_out[0], x_out[-1]) == (10.0, 21.0)
+
+
+def test_level_of_detail_sorts_its_series():
+    series = lod.LevelOfDetail([3.0, 1.0, 2.0], [30.0, 10.0, 20.0])
+    x, y = series.get()
+    assert x.tolist() == [1.0, 2.0, 3.0] and y.tolist() == [10.0, 20.0, 30.0]
+
+
+def test_sum_keeps_the_totals():
+    x = np.arange(10000, dtype=float)
+    y = np.random.default_rng(6).exponential(0.1, 10000)
+    y[::7] = np.nan
+    x_out, y_out = lod.downsample(x, y, max_points=100, method='sum')
+    assert len(x_out) == 100 and x_out[0] == 0.0
+    assert np.isclose(np.nansum(y_out), np.nansum(y))
+    np.testing.assert_allclose(y_out[:3], [np.nansum(y[:100]), np.nansum(y[100:200]), np.nansum(y[200:300])])
+
+
+def test_sum_of_a_range_leaves_out_the_points_past_it():
+    x = np.arange(1000, dtype=float)
+    x_out, y_out = lod.downsample(x, np.ones(1000), max_points=10, method='sum', x_range=(100.0, 299.0))
+    assert x_out[0] == 100.0 and y_out.sum() == 200.0
+
+
+def test_buckets_without_values_total_nan():
+    starts, totals = lod.sum_buckets(np.arange(4.0), np.array([1.0, np.nan, np.nan, 2.0]), 4)
+    assert starts.tolist() == [0, 1, 2, 3]
+    np.testing.assert_array_equal(totals, [1.0, np.nan, np.nan, 2.0])
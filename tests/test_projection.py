@@ -0,0 +1,56 @@
+import numpy as np
+
+import engine
+
+
+def project_brute_force(vertices, point):
+    """Closest point of each segment, one point and one segment at a time"""
+    best = None
+    chainage = 0.0
+    for i in range(len(vertices) - 1):
+        start, end = vertices[i], vertices[i + 1]
+        delta = end - start
+        length = np.hypot(*delta)
+        t = 0.0 if length == 0 else min(max(np.dot(point - start, delta) / length ** 2, 0.0), 1.0)
+        closest = start + t * delta
+        distance = np.hypot(*(point - closest))
+        if best is None or distance < best['Dist'] - 1e-12:
+            best = {
+                'Dist': distance,
+                'minDistX': closest[0],
+                'minDistY': closest[1],
+                'nextVertexIndex': i + 1,
+                'distanceAlongLine': chainage + t * length,
+            }
+        chainage += length
+    return best
+
+
+def test_matches_brute_force(line):
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-50.0, 450.0, (500, 2))
+    result = engine.project_points_to_line(line, points)
+    for i, point in enumerate(points):
+        expected = project_brute_force(line, point)
+        at_vertex = np.isclose(np.hypot(*(line[1:-1] - (expected['minDistX'], expected['minDistY'])).T), 0.0).any()
+        for key, value in expected.items():
+            if key == 'nextVertexIndex' and at_vertex:
+                # closest to a vertex, both segments next to it are equally close
+                continue
+            assert np.isclose(result[key][i], value), (i, key)
+
+
+def test_side_of_line():
+    line = np.array([[0.0, 0.0], [10.0, 0.0]])
+    result = engine.project_points_to_line(line, [[5.0, 2.0], [5.0, -2.0], [5.0, 0.0]])
+    # QGIS reports left as negative
+    assert result['leftOrRightOfSegment'].tolist() == [-1, 1, 0]
+
+
+def test_chunks_give_same_result(line, monkeypatch):
+    points = np.random.default_rng(2).uniform(0.0, 400.0, (1000, 2))
+    expected = engine.project_points_to_line(line, points)
+    monkeypatch.setattr(engine.projection, 'MAX_PAIRS_PER_CHUNK', 7)
+    result = engine.project_points_to_line(line, points)
+    for key in expected:
+        np.testing.assert_array_equal(result[key], expected[key])
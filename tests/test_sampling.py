@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import engine
+from conftest import PIXEL_SIZE, plane
+
+
+@pytest.fixture
+def inner_points():
+    """Points at least two cells from the DEM's edges, so every kernel has all its cells"""
+    return np.random.default_rng(3).uniform(3 * PIXEL_SIZE, 197 * PIXEL_SIZE, (300, 2))
+
+
+@pytest.mark.parametrize('interpolation', ['bilinear', 'cubic'])
+def test_interpolating_kernels_are_exact_on_a_plane(plane_dem, inner_points, interpolation):
+    xs, ys = inner_points.T
+    z = engine.sample_array(plane_dem.array, plane_dem.geotransform, xs, ys, interpolation=interpolation)
+    np.testing.assert_allclose(z, plane(xs, ys))
+
+
+def test_nearest_takes_the_cell_value(plane_dem, inner_points):
+    xs, ys = inner_points.T
+    z = engine.sample_array(plane_dem.array, plane_dem.geotransform, xs, ys, interpolation='nearest')
+    centre_xs = (np.floor(xs / PIXEL_SIZE) + 0.5) * PIXEL_SIZE
+    centre_ys = (np.floor(ys / PIXEL_SIZE) + 0.5) * PIXEL_SIZE
+    np.testing.assert_allclose(z, plane(centre_xs, centre_ys))
+
+
+def test_outside_and_nodata_are_nan(plane_dem):
+    array = plane_dem.array.copy()
+    array[0, 0] = -9999
+    z = engine.sample_array(
+        array, plane_dem.geotransform, np.array([1.0, -5.0]), np.array([399.0, 10.0]), nodata=-9999
+    )
+    assert np.isnan(z).all()
+
+
+def test_unknown_interpolation(plane_dem):
+    with pytest.raises(ValueError):
+        engine.sample_array(plane_dem.array, plane_dem.geotransform, [1.0], [1.0], interpolation='spline')
+
+
+def test_window_read_matches_full_array(plane_dem, inner_points):
+    xs, ys = inner_points.T
+    for interpolation in ('nearest', 'bilinear', 'cubic'):
+        full = engine.sample_array(plane_dem.array, plane_dem.geotransform, xs, ys, interpolation=interpolation)
+        # the window geotransform is rounded differently from the full raster's
+        np.testing.assert_allclose(engine.sample_points(plane_dem, xs, ys, interpolation=interpolation), full)
+
+
+def test_profile_stations(plane_dem, line):
+    x, z = engine.sample_profile(line, plane_dem, num_points=100, interpolation='bilinear')
+    chainage = engine.sampling.cumulative_length(line)
+    assert len(x) == 101
+    assert x[0] == 0.0 and np.isclose(x[-1], chainage[-1])
+    xs, ys = engine.sampling.interpolate_stations(line, chainage, x)
+    np.testing.assert_allclose(z, plane(xs, ys))
@@ -0,0 +1,40 @@
+import numpy as np
+
+import engine
+from conftest import plane
+
+
+class WindowLog:
+    """DEM source recording the bounds of every window read"""
+
+    def __init__(self, dem):
+        self.dem = dem
+        self.pixel_size = dem.pixel_size
+        self.windows = []
+
+    def read_window(self, xmin, ymin, xmax, ymax, pad=0):
+        self.windows.append((xmin, ymin, xmax, ymax))
+        return self.dem.read_window(xmin, ymin, xmax, ymax, pad=pad)
+
+
+def test_only_explorations_within_tolerance_are_sampled(plane_dem):
+    line = np.array([[100.0, 100.0], [120.0, 100.0]])
+    points = np.array([[105.0, 102.0], [115.0, 97.0], [390.0, 390.0], [2.0, 2.0]])
+    dem = WindowLog(plane_dem)
+    explorations = engine.project_explorations(
+        line, points, ['a', 'b', 'far', 'corner'], dem=dem, tolerance=5.0, interpolation='bilinear'
+    )
+    assert list(explorations) == ['a', 'b']
+    xmin, ymin, xmax, ymax = dem.windows[0]
+    assert (xmin, ymin, xmax, ymax) == (105.0, 97.0, 115.0, 102.0)
+    assert np.isclose(explorations['b']['lidar'], plane(115.0, 97.0))
+    assert explorations['a']['distanceAlongLine'] == 5.0
+
+
+def test_without_tolerance_every_exploration_is_kept(plane_dem):
+    line = np.array([[100.0, 100.0], [120.0, 100.0]])
+    explorations = engine.project_explorations(
+        line, [[105.0, 102.0], [390.0, 390.0]], ['a', 'far'], depths=[10.0, None], dem=plane_dem
+    )
+    assert list(explorations) == ['a', 'far']
+    assert explorations['a']['ExploDepth'] == 10.0 and explorations['far']['ExploDepth'] is None
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import engine
+
+pd = pytest.importorskip('pandas')
+
+
+@pytest.fixture
+def section(plane_dem, line):
+    rng = np.random.default_rng(5)
+    points = rng.uniform(20.0, 380.0, (40, 2))
+    names = [f'B-{i}' for i in range(len(points))]
+    intervals = {
+        'B-0': pd.DataFrame({
+            'exploration': ['B-0', 'B-0'],
+            'unit': ['Qvt', 'Qva'],
+            'unit_label': ['Qvt', 'Qva'],
+            'depth_top': [0.0, 12.5],
+            'depth_bottom': [12.5, np.nan],
+            'elev_top': [400.0, 387.5],
+            'elev_bottom': [387.5, np.nan],
+            'below_bottom_of_hole': [False, True],
+        })
+    }
+    return engine.build_cross_section(
+        line, plane_dem,
+        points=points,
+        names=names,
+        depths=[None if i % 3 == 0 else float(i) for i in range(len(points))],
+        attributes={'projectNumber': [f'P{i % 4}' for i in range(len(points))]},
+        tolerance=60.0,
+        num_points=200,
+        surfaces={'shifted': engine.Dem(plane_dem.array + 1.0, plane_dem.geotransform)},
+        intervals=intervals,
+    )
+
+
+def assert_same_section(loaded, section):
+    for name in ('x', 'z', 'line', 'surfaces_x'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(section, name))
+    assert list(loaded.surfaces) == list(section.surfaces)
+    for name, z in section.surfaces.items():
+        np.testing.assert_array_equal(loaded.surfaces[name], z)
+    assert (loaded.num_points, loaded.interpolation) == (section.num_points, section.interpolation)
+    assert list(loaded.explorations) == list(section.explorations)
+    for name, expected in section.explorations.items():
+        d = loaded.explorations[name]
+        for key, value in expected.items():
+            if key == 'intervals':
+                if value is None:
+                    assert d[key] is None
+                else:
+                    pd.testing.assert_frame_equal(d[key], value, check_dtype=False)
+            elif isinstance(value, float) and np.isnan(value):
+                assert np.isnan(d[key])
+            else:
+                assert d[key] == value, (name, key)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(section, tmp_path, mmap):
+    path = engine.save_section(section, tmp_path.joinpath('section'), style={'renderer': 'plotly'})
+    assert path.suffix == engine.section_io.SUFFIX
+    section_file = engine.SectionFile(path, mmap=mmap)
+    assert section_file.style == {'renderer': 'plotly'}
+    assert_same_section(section_file.to_cross_section(), section)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path.joinpath('other.xsec')
+    np.savez(path.with_suffix(''), x=np.arange(3))
+    path.with_suffix('.npz').rename(path)
+    with pytest.raises(KeyError):
+        engine.SectionFile(path)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_over_the_opened_file(section, tmp_path, mmap):
+    """Saving a section back to the file it was opened from used to truncate the file under its memory maps"""
+    path = engine.save_section(section, tmp_path.joinpath('section.xsec'))
+    opened = engine.load_section(path, mmap=mmap)
+    engine.save_section(opened, path, style={'renderer': 'bokeh'})
+    assert_same_section(opened, section)
+    assert engine.SectionFile(path).style == {'renderer': 'bokeh'}
+    assert_same_section(engine.load_section(path), section)
+    assert [p.name for p in tmp_path.iterdir()] == ['section.xsec']
+
+
+def test_depths_that_are_not_numbers_are_saved_as_missing(section, tmp_path):
+    names = list(section.explorations)
+    # a blank or text ExploDepth of a layer, and a NULL QVariant, which is neither None nor a number
+    section.explorations[names[1]]['ExploDepth'] = 'unknown'
+    section.explorations[names[2]]['ExploDepth'] = object()
+    path = engine.save_section(section, tmp_path.joinpath('section'))
+    loaded = engine.load_section(path).explorations
+    assert loaded[names[1]]['ExploDepth'] is None and loaded[names[2]]['ExploDepth'] is None
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import engine
+
+
+@pytest.mark.parametrize('chunk_length', [97.3, 250.0, 40.0])
+@pytest.mark.parametrize('num_points', [None, 500])
+def test_chunked_profile_matches_unchunked(wavy_dem, line, chunk_length, num_points):
+    x, z = engine.sample_profile(line, wavy_dem, num_points=num_points, interpolation='bilinear')
+    x_chunked, z_chunked = engine.sample_profile(
+        line, wavy_dem, num_points=num_points, interpolation='bilinear', chunk_length=chunk_length
+    )
+    np.testing.assert_array_equal(x_chunked, x)
+    np.testing.assert_allclose(z_chunked, z)
+
+
+def test_explorations_are_sampled_chunk_by_chunk(wavy_dem, line, monkeypatch):
+    points = np.random.default_rng(4).uniform(20.0, 370.0, (200, 2))
+    names = [str(i) for i in range(len(points))]
+    expected = engine.project_explorations(line, points, names, dem=wavy_dem, interpolation='bilinear')
+    monkeypatch.setattr(engine.sampling, 'MAX_WINDOW_CELLS', 1000)
+    monkeypatch.setattr(engine.sampling, 'CHUNK_CELLS', 16)
+    windows = []
+    read_window = wavy_dem.read_window
+
+    def log_window(xmin, ymin, xmax, ymax, pad=0):
+        windows.append((xmax - xmin) * (ymax - ymin))
+        return read_window(xmin, ymin, xmax, ymax, pad=pad)
+
+    monkeypatch.setattr(wavy_dem, 'read_window', log_window)
+    explorations = engine.project_explorations(line, points, names, dem=wavy_dem, interpolation='bilinear')
+    assert len(windows) > 1 and max(windows) < 350.0 ** 2 / 4
+    np.testing.assert_allclose([d['lidar'] for d in explorations.values()], [d['lidar'] for d in expected.values()])
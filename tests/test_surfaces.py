@@ -0,0 +1,41 @@
+import numpy as np
+
+import engine
+from conftest import plane
+
+# the DEMs in another CRS are the plane DEM shifted by this offset
+OFFSET = 1000.0
+
+
+def shifted_dem(plane_dem, crs):
+    x_origin, pixel_width, _, y_origin, _, pixel_height = plane_dem.geotransform
+    geotransform = (x_origin + OFFSET, pixel_width, 0.0, y_origin + OFFSET, 0.0, pixel_height)
+    return engine.Dem(plane_dem.array, geotransform, crs=crs)
+
+
+def test_surfaces_share_the_stations(plane_dem, line):
+    upper = engine.Dem(plane_dem.array + 2.0, plane_dem.geotransform)
+    x, z = engine.sample_profiles(line, [plane_dem, upper], num_points=100, interpolation='bilinear')
+    x_ground, z_ground = engine.sample_profile(line, plane_dem, num_points=100, interpolation='bilinear')
+    np.testing.assert_array_equal(x, x_ground)
+    np.testing.assert_allclose(z[0], z_ground)
+    np.testing.assert_allclose(z[1] - z[0], 2.0)
+
+
+def test_stations_are_transformed_once_per_crs(plane_dem, line):
+    calls = []
+
+    def transform(xs, ys):
+        calls.append(len(xs))
+        return xs + OFFSET, ys + OFFSET
+
+    dems = [
+        engine.ReprojectedDem(shifted_dem(plane_dem, 'EPSG:1'), transform),
+        engine.ReprojectedDem(shifted_dem(plane_dem, 'EPSG:1'), transform),
+        engine.ReprojectedDem(shifted_dem(plane_dem, 'EPSG:2'), transform),
+    ]
+    x, z = engine.sample_profiles(line, dems, num_points=100, interpolation='bilinear')
+    assert len(calls) == 2
+    xs, ys = engine.sampling.interpolate_stations(line, engine.sampling.cumulative_length(line), x)
+    for elevations in z:
+        np.testing.assert_allclose(elevations, plane(xs, ys))
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+import engine
+from engine.trace import Tracer, count_items
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+
+    @tracer.traced()
+    def add(a, b):
+        return a + b
+
+    with tracer.stage('stage'):
+        pass
+    assert add(1, 2) == 3
+    assert tracer.summary() == [] and tracer.revision == 0
+
+
+def test_stages_and_items():
+    tracer = Tracer(enabled=True)
+
+    @tracer.traced(items=len)
+    def numbers(n):
+        return list(range(n))
+
+    numbers(3)
+    numbers(4)
+    with tracer.stage('block') as span:
+        span.set_items(5)
+    stats = {row['stage']: row for row in tracer.summary()}
+    assert stats['numbers']['calls'] == 2 and stats['numbers']['items'] == 7
+    assert stats['block']['items'] == 5
+
+
+def test_errors_of_traced_functions_are_raised_as_is():
+    tracer = Tracer(enabled=True)
+
+    @tracer.traced(items=len)
+    def fails():
+        raise KeyError('missing')
+
+    with pytest.raises(KeyError):
+        fails()
+    stats = tracer.summary()[0]
+    assert (stats['stage'], stats['calls'], stats['items']) == ('fails', 1, 0)
+
+
+def test_chrome_trace(tmp_path):
+    tracer = Tracer(enabled=True, max_events=2)
+    for _ in range(3):
+        with tracer.stage('stage', items=1):
+            pass
+    path = tmp_path.joinpath('trace.json')
+    tracer.write_chrome_trace(path)
+    events = json.loads(path.read_text())['traceEvents']
+    assert len(events) == 2 and events[0]['ph'] == 'X' and events[0]['args'] == {'items': 1}
+    assert tracer.summary()[0]['calls'] == 3
+
+
+def test_count_items():
+    assert count_items(None) == 0
+    assert count_items([1, 2]) == 2
+    assert count_items({'a': [1, 2], 'b': [3]}) == 3
+    assert count_items(5) is None
+
+
+def test_engine_calls_of_the_cross_section_task_are_traced(plane_dem, line, monkeypatch):
+    monkeypatch.setattr(engine.tracer, 'enabled', True)
+    engine.tracer.reset()
+    x, _ = engine.sample_profile(line, plane_dem, num_points=100)
+    engine.project_explorations(line, np.array([[100.0, 150.0], [300.0, 200.0]]), ['a', 'b'], dem=plane_dem)
+    stats = {row['stage']: row for row in engine.tracer.summary()}
+    engine.tracer.reset()
+    assert stats['sample_profile']['items'] == len(x)
+    assert stats['project_explorations']['items'] == 2
+    assert stats['project_points_to_line']['calls'] == 1
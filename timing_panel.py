@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import qgis.PyQt.QtWidgets as w
+import qgis.gui as gui
+from qgis.PyQt.QtCore import QTimer
+
+try:
+    from . import engine
+except ImportError:
+    import engine
+
+TABLE_COLUMNS = ['Stage', 'Calls', 'Total (ms)', 'Mean (ms)', 'Max (ms)', 'Items']
+# how often the table is refreshed while timings are recorded
+REFRESH_INTERVAL_MS = 500
+
+
+class TimingPanel(gui.QgsCollapsibleGroupBox):
+
+    def __init__(self, tracer: engine.Tracer = None, parent=None):
+        """
+        Collapsible dock panel with the per stage timings of a tracer, see engine.trace. Recording is off until
+        the checkbox is checked, so the traced stages cost next to nothing by default.
+        :param tracer: tracer to show and switch on and off, defaults to engine.tracer
+        """
+        super().__init__('Timings', parent)
+        self.tracer = tracer or engine.tracer
+        self._shown_revision = None
+        self.setCollapsed(True)
+
+        self.record_checkbox = w.QCheckBox('Record Timings')
+        self.record_checkbox.setChecked(self.tracer.enabled)
+        self.record_checkbox.toggled.connect(self.on_record_toggled)
+        self.reset_button = w.QPushButton('Reset')
+        self.reset_button.clicked.connect(self.reset)
+        self.export_button = w.QPushButton('Export Trace')
+        self.export_button.clicked.connect(self.export_trace)
+        self.table = w.QTableWidget(0, len(TABLE_COLUMNS))
+        self.table.setHorizontalHeaderLabels(TABLE_COLUMNS)
+        self.table.setEditTriggers(w.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+
+        buttons = w.QHBoxLayout()
+        buttons.addWidget(self.record_checkbox)
+        buttons.addStretch()
+        buttons.addWidget(self.reset_button)
+        buttons.addWidget(self.export_button)
+        layout = w.QVBoxLayout(self)
+        layout.addLayout(buttons)
+        layout.addWidget(self.table)
+
+        # the traced stages may run in task threads, the table is refreshed from the main thread
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        if self.tracer.enabled:
+            self.refresh_timer.start()
+
+    def on_record_toggled(self, checked: bool):
+        self.tracer.enabled = checked
+        if checked:
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+            self.refresh()
+
+    def refresh(self):
+        """Shows the tracer's statistics, if anything was recorded since the last refresh"""
+        if self.tracer.revision == self._shown_revision:
+            return
+        self._shown_revision = self.tracer.revision
+        rows = self.tracer.summary()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [
+                row['stage'],
+                str(row['calls']),
+                f"{row['seconds'] * 1000:.1f}",
+                f"{row['mean_seconds'] * 1000:.1f}",
+                f"{row['max_seconds'] * 1000:.1f}",
+                str(row['items']),
+            ]
+            for j, value in enumerate(values):
+                self.table.setItem(i, j, w.QTableWidgetItem(value))
+        self.table.resizeColumnsToContents()
+
+    def reset(self):
+        self.tracer.reset()
+        self.refresh()
+
+    def export_trace(self):
+        """Writes the recorded spans as a Chrome trace json file, to open in chrome://tracing or Perfetto"""
+        file_path, _ = w.QFileDialog.getSaveFileName(
+            self, 'Export Trace', str(Path().home().joinpath('xsection_trace.json')), 'JSON (*.json)'
+        )
+        if not file_path:
+            return
+        self.tracer.write_chrome_trace(file_path)
+        print(f'trace written to {file_path}')
+
+    def stop(self):
+        self.refresh_timer.stop()
@@ -4,28 +4,70 @@
 import sys
 from pathlib import Path
 
-import bokeh.plotting
-
 custom_package_dir = Path(r'C:\Users\lukem\Python\Projects')
 #  add custom package path, so we can import custom packages from other directly.
 if str(custom_package_dir) not in sys.path:
     sys.path.append(str(custom_package_dir))
 
+import collections
+import csv
 import math
+import tempfile
+import webbrowser
+import numpy as np
 import qgis.PyQt.QtWidgets as w
 import qgis.gui as gui
 import qgis.core as core
-import bokeh.plotting as bkp
-from .bokeh_fig import BokehFig
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QTimer
 
 try:
+    from . import engine
     from . import gis_functions as gis
+    from . import tasks
+    from .plot_view import PlotView
+    from .timing_panel import TimingPanel
 except ImportError:
+    import engine
     import gis_functions as gis
+    import tasks
+    from plot_view import PlotView
+    from timing_panel import TimingPanel
 from qgis.PyQt.QtGui import QColor
 from pathlib import Path
-from figs._fig import Fig
+
+# attributes fetched for nearby features, the rest of the fields are left empty
+NEARBY_FEATURE_ATTRIBUTES = ['ExploName', 'Name', 'ExploDepth', 'AESI_Pro_1']
+# exploration database export with the unit intervals of each exploration
+EXPLORATION_DATABASE_PATH = Path(__file__).parent.joinpath('data', 'Exploration_Database.csv')
+# survey database with the surveyed coordinates of the explorations
+SURVEY_DATABASE_PATH = Path(__file__).parent.joinpath('data', 'Tehaleh_Survey_Database.xlsx')
+# CRS of the survey database's coordinates, WA83-SF: NAD83 / Washington South (ftUS)
+SURVEY_CRS_AUTHID = 'EPSG:2927'
+# local DuckDB file both databases are ingested into, see engine.ExplorationStore
+EXPLORATION_STORE_PATH = Path().home().joinpath('.xsection_cache', 'explorations.duckdb')
+# file dialog filter of saved cross sections, see engine.save_section()
+SECTION_FILE_FILTER = f'Cross sections (*{engine.section_io.SUFFIX})'
+# quiet time after the last tolerance or layer change before nearby features are searched
+NEARBY_QUERY_DEBOUNCE_MS = 150
+# memory limit of the profile cache
+PROFILE_CACHE_MAX_BYTES = 256 * 2 ** 20
+# size limit of the profile cache folder, the least recently used profiles are deleted first
+PROFILE_CACHE_MAX_DISK_BYTES = 2 ** 30
+
+
+def get_fig_class(renderer: str = 'plotly'):
+    """
+    The figure class of a renderer: Fig (plotly) or BokehFig. Imported on first use, so plotly and bokeh are not
+    loaded with QGIS.
+    """
+    if renderer == 'bokeh':
+        try:
+            from .bokeh_fig import BokehFig
+        except ImportError:
+            from bokeh_fig import BokehFig
+        return BokehFig
+    from figs._fig import Fig
+    return Fig
 
 
 class XSectionPlugin(w.QWidget):
@@ -40,7 +82,23 @@ class XSectionPlugin(w.QWidget):
         self.test_action = w.QAction(parent=self.toolbar)
         self.feature_identifier = gui.QgsMapToolIdentifyFeature(self.iface.mapCanvas())
         self.raster_combobox = w.QComboBox()
+        # other rasters to sample at the same stations as the combobox dem, e.g. other lidar years
+        self.surface_list = w.QListWidget()
+        self.difference_checkbox = w.QCheckBox('Show Cut/Fill')
+        # plot explorations as stratigraphic columns from the exploration database, one trace per unit
+        self.stratigraphy_checkbox = w.QCheckBox('Show Stratigraphy')
+        # query the explorations from the exploration store instead of the selected vector layers
+        self.store_checkbox = w.QCheckBox('Explorations From Database')
+        # space the stations from the dem's cell size instead of 1000 fixed intervals, see sample_profile_adaptive()
+        self.adaptive_checkbox = w.QCheckBox('Adaptive Stations')
+        # batch sections of the selected lines only, picking a line selects it so this is not implied by a selection
+        self.batch_selected_checkbox = w.QCheckBox('Batch Selected Lines Only')
         self.tolerance_slider = w.QSlider()
+        self.progress_bar = w.QProgressBar()
+        # per stage timings of the pipeline, recorded by engine.tracer once switched on in the panel
+        self.timing_panel = TimingPanel(engine.tracer)
+        # figures shown in the dock and updated in place, the browser is used if QtWebEngine is not installed
+        self.plot_view = PlotView()
 
         #  add radio buttons to choose plot renderer
         self.plot_renderer = 'plotly'
@@ -58,10 +116,48 @@ class XSectionPlugin(w.QWidget):
         self.buffer_geometry = None
         self.vector_list_selection = None
         self._nearby_features_as_ids = None
+        self._nearby_features = None
         self.dock_widget = w.QDockWidget(parent=self.profile_canvas)
         self.dock_widget.setWidget(self.main_widget)
         self._nearby_features_dict = None
-        self.fig = Fig()
+        self.spatial_index_cache = gis.SpatialIndexCache(
+            cache_dir=Path().home().joinpath('.xsection_cache', 'spatial_index')
+        )
+        # transforms between the CRSs of the line, the vector layers and the DEMs, set up once per CRS pair
+        self.transform_cache = gis.CoordinateTransformCache()
+        core.QgsProject.instance().transformContextChanged.connect(self.transform_cache.clear)
+        # nearby features of the selected line, searched incrementally as the tolerance and layers change
+        self.nearby_query = gis.NearbyFeatureQuery(
+            self.spatial_index_cache,
+            attributes=NEARBY_FEATURE_ATTRIBUTES,
+            transform_cache=self.transform_cache
+        )
+        self.nearby_query_timer = QTimer()
+        self.nearby_query_timer.setSingleShot(True)
+        self.nearby_query_timer.setInterval(NEARBY_QUERY_DEBOUNCE_MS)
+        self.nearby_query_timer.timeout.connect(self.get_nearby_features_as_ids)
+        self._exploration_database = None
+        self._exploration_store = None
+        self.profile_cache = engine.ProfileCache(
+            max_bytes=PROFILE_CACHE_MAX_BYTES,
+            cache_dir=Path().home().joinpath('.xsection_cache', 'profiles'),
+            max_disk_bytes=PROFILE_CACHE_MAX_DISK_BYTES
+        )
+        # the figure being built, created on first use, see the fig property
+        self._fig = None
+        # the latest cross section task, and all tasks still running. python references to running tasks
+        # must be kept or the task manager crashes when they finish
+        self.profile_task: tasks.CrossSectionTask = None
+        self._running_profile_tasks = []
+        self.batch_task: tasks.BatchSectionsTask = None
+        # the latest computed cross section and the settings it was plotted with, see save_section()
+        self.section: engine.CrossSection = None
+        self.section_style: dict = None
+        # nearby features of each of many selected lines, see sweep_corridors()
+        self.corridors: dict = None
+        # the swept features and the names of their layers, by index in the swept points
+        self.corridor_features: list = None
+        self.corridor_layers: list = None
         print('plugin has inited')
 
     def initGui(self):
@@ -73,15 +169,30 @@ class XSectionPlugin(w.QWidget):
         self.feature_identifier.featureIdentified.connect(self.select_line_feature)
         self.add_button_to_toolbar(name='Plot Selected Line', callback_function=self.plot_selected_line)
         self.add_button_to_toolbar(name='Get Nearby Features', callback_function=self.get_nearby_features_dict)
+        self.add_button_to_toolbar(name='Batch Sections', callback_function=self.start_batch_sections_task)
+        self.add_button_to_toolbar(name='Corridor Sweep', callback_function=self.sweep_corridors)
+        self.add_button_to_toolbar(name='Export Corridors', callback_function=self.export_corridors)
+        self.add_button_to_toolbar(name='Save Section', callback_function=self.save_section)
+        self.add_button_to_toolbar(name='Open Section', callback_function=self.open_section)
 
         self.tolerance_slider.setOrientation(Qt.Orientation(1))  # 1 = horizontal
         self.toolbar.addWidget(self.tolerance_slider)
+        self.tolerance_slider.valueChanged.connect(self.on_tolerance_slider_changed)
         self.tolerance_slider.sliderReleased.connect(self.on_tolerance_slider_release)
         self.toolbar.addWidget(self.plotly_radiobutton)
         self.toolbar.addWidget(self.bokeh_radiobutton)
 
         self.layout.addWidget(self.raster_combobox)
+        self.layout.addWidget(self.surface_list)
+        self.layout.addWidget(self.difference_checkbox)
+        self.layout.addWidget(self.stratigraphy_checkbox)
+        self.layout.addWidget(self.store_checkbox)
+        self.layout.addWidget(self.adaptive_checkbox)
+        self.layout.addWidget(self.batch_selected_checkbox)
         self.layout.addWidget(self.vector_list)
+        self.layout.addWidget(self.progress_bar)
+        self.layout.addWidget(self.plot_view)
+        self.layout.addWidget(self.timing_panel)
         self.vector_list.itemSelectionChanged.connect(self.check_vector_list_selection)
 
         self.iface.addToolBarIcon(self.open_action)
@@ -93,6 +204,11 @@ class XSectionPlugin(w.QWidget):
         for vector_layer_name in selection:
             vector_layer = core.QgsProject.instance().mapLayersByName(vector_layer_name)[0]
             vector_layer.removeSelection()
+        self.cancel_profile_task()
+        self.nearby_query_timer.stop()
+        self.timing_panel.stop()
+        if self.batch_task is not None:
+            self.batch_task.cancel()
         # Remove the toolbar icon
         self.iface.removeToolBarIcon(self.open_action)
         # Reset the map tool to the default (e.g., pan tool)
@@ -111,6 +227,13 @@ class XSectionPlugin(w.QWidget):
             self.dock_widget.deleteLater()
         del self.profile_canvas
         self.clear_rubber_band()
+        self.spatial_index_cache.clear()
+        try:
+            core.QgsProject.instance().transformContextChanged.disconnect(self.transform_cache.clear)
+        except TypeError:
+            pass
+        if self._exploration_store is not None:
+            self._exploration_store.close()
         del self.toolbar
         del self.main_widget
         del self.layout
@@ -121,6 +244,7 @@ class XSectionPlugin(w.QWidget):
         self.tolerance_slider.setMaximum(500)
         self.tolerance_slider.setValue(100)
         self.vector_list.setSelectionMode(w.QAbstractItemView.SelectionMode(2))
+        self.surface_list.setSelectionMode(w.QAbstractItemView.SelectionMode(2))
         self.get_rasters_for_combobox()
         self.raster_combobox.setCurrentIndex(3)
         self.vector_list.setCurrentRow(0)
@@ -140,58 +264,373 @@ class XSectionPlugin(w.QWidget):
         for layer in layers:
             if layer.type() == core.QgsMapLayer.RasterLayer:
                 self.raster_combobox.addItem(layer.name(), layer)
+                self.surface_list.addItem(layer.name())
             if layer.type() == core.QgsMapLayer.VectorLayer:
                 self.vector_list.addItem(layer.name())
 
+    def on_tolerance_slider_changed(self, tolerance: int):
+        """Redraws the buffer while the slider moves. Shrinking the tolerance, or growing it within what has
+        been searched already, only filters the known features, so the selection follows the slider live.
+        Otherwise the search waits until the slider has been still for NEARBY_QUERY_DEBOUNCE_MS."""
+        if not self.selected_line:
+            return
+        self.cancel_profile_task()
+        self.draw_buffer()
+        if self.nearby_query.covers(self.get_selected_vector_layers(), tolerance):
+            self.get_nearby_features_as_ids()
+        else:
+            self.nearby_query_timer.start()
+
     def on_tolerance_slider_release(self):
-        """what to do when the tolerance slider is moved then released"""
-        if self.selected_line:
-            self.draw_buffer()
-        self.get_nearby_features_as_ids()
+        """what to do when the tolerance slider is moved then released: search without waiting"""
+        if self.nearby_query_timer.isActive():
+            self.nearby_query_timer.stop()
+            self.get_nearby_features_as_ids()
 
     def on_plot_radio_button_toggled(self, checked):
         if checked:
             if self.plotly_radiobutton.isChecked():
                 print("Plotly button is checked")
                 self.plot_renderer = 'plotly'
-                self.fig = Fig()
+                self.fig = get_fig_class('plotly')()
             elif self.bokeh_radiobutton.isChecked():
                 print("Bokeh button is checked")
                 self.plot_renderer = 'bokeh'
-                self.fig = BokehFig()
+                self.fig = get_fig_class('bokeh')()
+
+    @property
+    def fig(self):
+        """Figure of the current plot renderer, created on first use"""
+        if self._fig is None:
+            self._fig = get_fig_class(self.plot_renderer)()
+        return self._fig
+
+    @fig.setter
+    def fig(self, value):
+        self._fig = value
 
     def activate_select_line(self):
         self.feature_identifier.setLayer(self.iface.activeLayer())
         self.iface.mapCanvas().setMapTool(self.feature_identifier)
 
     def select_line_feature(self, feature: core.QgsFeature):
+        self.cancel_profile_task()
         self.layer_for_selection = self.iface.activeLayer()
         self.selected_line = feature
         feature_id = feature.id()
         self.layer_for_selection.selectByIds([feature_id])
         self.draw_buffer()
+        self.nearby_query.set_line(feature.geometry(), crs=self.line_crs)
         self.get_nearby_features_as_ids()
 
     def plot_selected_line(self):
-        x, z = self.get_profile_xz_from_QgsFeature(self.selected_line)
         print(f"plotting line: {self.selected_line.id()} | {self.iface.activeLayer().name()}")
-        self.plot_fig(x, z)
+        self.start_profile_task(num_points=None if self.adaptive_checkbox.isChecked() else 1000)
+
+    def start_profile_task(self, num_points: int = 1000, interpolation: str = 'nearest'):
+        """Computes and plots the cross section of the selected line in a background QgsTask. Any
+        running task is cancelled first, only the result of the latest task is shown."""
+        self.cancel_profile_task()
+        dem_layer = self.get_layer_by_name(self.raster_combobox.currentData().name())
+        fig_factory = get_fig_class(self.plot_renderer)
+        line = gis.geometry_to_line_string(self.selected_line.geometry())
+        explorations_input = None
+        explorations = None
+        if self.use_exploration_store():
+            explorations = self.get_store_explorations(dem_layer)
+        else:
+            explorations_input = self.get_explorations_input()
+        task = tasks.CrossSectionTask(
+            line=gis.line_to_array(line),
+            dem=self.get_dem(dem_layer, thread_safe=True),
+            explorations_input=explorations_input,
+            explorations=explorations,
+            fig_factory=fig_factory,
+            renderer=self.plot_renderer,
+            num_points=num_points,
+            interpolation=interpolation,
+            on_finished=self.on_profile_task_finished,
+            profile_cache=self.profile_cache,
+            profile_cache_key=self.get_profile_cache_key(line, dem_layer, num_points, interpolation),
+            surfaces=self.get_selected_surfaces(exclude=dem_layer.name()),
+            show_difference=self.difference_checkbox.isChecked(),
+            stratigraphy=self.stratigraphy_checkbox.isChecked(),
+            live_plot=self.plot_view.available,
+            shown_signature=self.plot_view.get_shown_signature(self.plot_renderer),
+        )
+        task.progressChanged.connect(lambda progress: self.on_profile_task_progress(task, progress))
+        self.profile_task = task
+        self._running_profile_tasks.append(task)
+        self.progress_bar.setValue(0)
+        core.QgsApplication.taskManager().addTask(task)
+
+    def get_selected_surfaces(self, exclude: str = None) -> dict:
+        """
+        Thread safe dem sources of the rasters selected in the surface list
+        :param exclude: name of a raster to leave out, e.g. the ground dem
+        :return: dict with raster names as keys and DEM sources as values, see get_dem()
+        """
+        return {
+            item.text(): self.get_dem(self.get_layer_by_name(item.text()), thread_safe=True)
+            for item in self.surface_list.selectedItems()
+            if item.text() != exclude
+        }
+
+    def cancel_profile_task(self):
+        """Cancels the latest cross section task, if it is still running"""
+        if self.profile_task is None:
+            return
+        try:
+            self.profile_task.cancel()
+        except RuntimeError:
+            # the task manager has already deleted the task
+            pass
+        self.profile_task = None
+
+    def on_profile_task_progress(self, task: tasks.CrossSectionTask, progress: float):
+        if task is self.profile_task:
+            self.progress_bar.setValue(int(progress))
+
+    def on_profile_task_finished(self, task: tasks.CrossSectionTask, result: bool):
+        self._running_profile_tasks.remove(task)
+        if not result or task is not self.profile_task:
+            # failed, cancelled or superseded by a newer task
+            return
+        self.profile_task = None
+        self._nearby_features_dict = task.section.explorations
+        for d in self._nearby_features_dict.values():
+            d['minDistPoint'] = core.QgsPointXY(d['minDistX'], d['minDistY'])
+        self.fig = task.fig
+        self.section = task.section
+        self.section_style = {
+            'renderer': task.renderer,
+            'show_difference': task.show_difference,
+            'stratigraphy': task.stratigraphy,
+        }
+        if task.plot_update is not None:
+            self.plot_view.show_update(task.plot_update, fig=task.fig)
+        else:
+            webbrowser.open(task.html_path.as_uri())
+
+    def save_section(self):
+        """Saves the latest cross section to a section file, see engine.save_section()"""
+        if self.section is None:
+            print('plot a line before saving its cross section')
+            return
+        file_path, _ = w.QFileDialog.getSaveFileName(
+            self.main_widget, 'Save Cross Section', str(Path().home()), SECTION_FILE_FILTER
+        )
+        if not file_path:
+            return
+        file_path = engine.save_section(self.section, file_path, style=self.section_style)
+        print(f'cross section saved to {file_path}')
+
+    def open_section(self):
+        """Opens a section file and plots it with its stored settings, in the renderer the file was saved with"""
+        file_path, _ = w.QFileDialog.getOpenFileName(
+            self.main_widget, 'Open Cross Section', str(Path().home()), SECTION_FILE_FILTER
+        )
+        if not file_path:
+            return
+        # read into memory, a memory-mapped file could not be saved over while the section is open
+        section_file = engine.SectionFile(file_path, mmap=False)
+        renderer = section_file.style.get('renderer', 'plotly')
+        self.fig = section_file.to_figure(fig_factory=get_fig_class(renderer))
+        self.plot_renderer = renderer
+        self.section = section_file.to_cross_section()
+        self.section_style = section_file.style
+        self.show_fig(html_path=Path(tempfile.gettempdir()).joinpath(f'{Path(file_path).stem}.html'))
+
+    def start_batch_sections_task(self):
+        """Builds a cross-section for every line of the active layer, or its selected lines if 'Batch Selected Lines
+        Only' is checked, in worker processes, written as html files with an index to a folder chosen by the user.
+        Explorations are taken from all features of the selected vector layers. The worker processes sample the DEM
+        file without QGIS, so lines and explorations are transformed to the DEM's CRS first, one call per array, and
+        the distances of the sections are in the DEM's units. Geographic CRSs are refused, as distances and the
+        tolerance would be in degrees."""
+        if self.batch_task is not None:
+            print('a batch of cross sections is already running')
+            return
+        line_layer = self.iface.activeLayer()
+        dem_layer = self.get_layer_by_name(self.raster_combobox.currentData().name())
+        if dem_layer.providerType() != 'gdal':
+            print('batch cross sections need a dem layer read from a file')
+            return
+        dem_crs = dem_layer.crs()
+        geographic = [layer.name() for layer in (dem_layer, line_layer) if layer.crs().isGeographic()]
+        if geographic:
+            print(f"batch cross sections need projected CRSs, {', '.join(geographic)} has a geographic CRS: "
+                  "reproject it to a projected CRS in map units, e.g. meters or feet")
+            return
+        selected_only = self.batch_selected_checkbox.isChecked()
+        if selected_only and not line_layer.selectedFeatureCount():
+            print('select the lines to section in the active layer, or uncheck Batch Selected Lines Only')
+            return
+        output_dir = w.QFileDialog.getExistingDirectory(self.main_widget, 'Folder for the cross sections')
+        if not output_dir:
+            return
+        lines = {
+            name: self.transform_cache.transform_points(line_layer.crs(), dem_crs, line)
+            for name, line in self.get_line_arrays(line_layer, selected_only=selected_only).items()
+        }
+        vector_layers = self.get_selected_vector_layers()
+        explorations = None
+        if vector_layers:
+            explorations_input = self.get_explorations_input(
+                features_by_layer={layer.name(): list(layer.getFeatures()) for layer in vector_layers},
+                crs=dem_crs
+            )
+            explorations = {key: explorations_input[key] for key in ('points', 'names', 'depths')}
+        # the tolerance is in the line's units, both CRSs are projected so this is a length unit conversion
+        tolerance = self.tolerance_slider.value() * core.QgsUnitTypes.fromUnitToUnitFactor(
+            line_layer.crs().mapUnits(), dem_crs.mapUnits()
+        )
+        self.batch_task = tasks.BatchSectionsTask(
+            lines,
+            dem=dem_layer.source(),
+            output_dir=Path(output_dir),
+            on_finished=self.on_batch_sections_task_finished,
+            explorations=explorations,
+            exploration_database=EXPLORATION_DATABASE_PATH if EXPLORATION_DATABASE_PATH.is_file() else None,
+            tolerance=tolerance,
+        )
+        self.batch_task.progressChanged.connect(lambda progress: self.progress_bar.setValue(int(progress)))
+        self.progress_bar.setValue(0)
+        core.QgsApplication.taskManager().addTask(self.batch_task)
+
+    def get_line_arrays(self, line_layer: core.QgsVectorLayer, selected_only: bool = False) -> dict:
+        """
+        Vertices of the lines of a layer
+        :param selected_only: only the selected lines, else all lines whatever the selection
+        :return: dict with the line names ('Name' field, or feature id) as keys and (n, 2) arrays as values. A
+            name shared by several lines gets the feature id of each appended, e.g. 'A (3)', so none is dropped.
+        """
+        name_field = 'Name' if 'Name' in line_layer.fields().names() else None
+        features = list(line_layer.selectedFeatures() if selected_only else line_layer.getFeatures())
+        names = [
+            str(feature.attribute(name_field)) if name_field is not None else str(feature.id()) for feature in features
+        ]
+        counts = collections.Counter(names)
+        lines = {}
+        for name, feature in zip(names, features):
+            if counts[name] > 1:
+                name = f'{name} ({feature.id()})'
+            lines[name] = gis.geometry_to_line_array(feature.geometry())
+        return lines
+
+    def sweep_corridors(self):
+        """Finds the nearby features of every selected line of the active layer at once: the indexes of the
+        selected vector layers are queried once with the envelope of all corridors, and each feature is assigned
+        to every line it is within the tolerance of, see engine.sweep_corridors(). The result is kept in
+        self.corridors, with the line names as keys and the offsets of their nearby features as values, and the
+        swept features in self.corridor_features."""
+        line_layer = self.iface.activeLayer()
+        if line_layer is None or not line_layer.selectedFeatureCount():
+            print('select the lines to sweep in the active layer')
+            return
+        lines = self.get_line_arrays(line_layer, selected_only=True)
+        tolerance = self.tolerance_slider.value()
+        vector_layers = self.get_selected_vector_layers()
+        features_by_layer = gis.get_features_in_envelope(
+            self.spatial_index_cache,
+            vector_layers,
+            engine.corridor.get_union_envelope(lines, tolerance),
+            attributes=NEARBY_FEATURE_ATTRIBUTES,
+            crs=line_layer.crs(),
+            transform_cache=self.transform_cache,
+        )
+        features = [feature for layer_features in features_by_layer.values() for feature in layer_features]
+        layer_names = [name for name, layer_features in features_by_layer.items() for _ in layer_features]
+        points = self.get_feature_points(features_by_layer, crs=line_layer.crs())
+        self.corridors = engine.sweep_corridors(lines, points, tolerance)
+        self.corridor_features = features
+        self.corridor_layers = layer_names
+        # highlight every feature that is in at least one corridor
+        in_corridors = {
+            (layer_names[i], features[i].id())
+            for corridor in self.corridors.values()
+            for i in corridor['index'].tolist()
+        }
+        for layer in vector_layers:
+            layer.selectByIds([fid for layer_name, fid in in_corridors if layer_name == layer.name()])
+        self.draw_corridors(line_layer.selectedFeatures(), tolerance)
+        counts = ', '.join(f"{name}: {len(corridor['index'])}" for name, corridor in self.corridors.items())
+        print(f'nearby features per line ({len(in_corridors)} features): {counts}')
+
+    def draw_corridors(self, line_features: list, tolerance: float):
+        """Draws the union of the buffers around the lines in the buffer rubber band"""
+        self.clear_rubber_band()
+        buffers = [feature.geometry().buffer(tolerance, segments=20) for feature in line_features]
+        self.buffer_rubber_band = gui.QgsRubberBand(self.iface.mapCanvas())
+        self.buffer_rubber_band.setColor(QColor(255, 0, 0, 50))
+        self.buffer_rubber_band.setWidth(2)
+        self.buffer_rubber_band.setToGeometry(core.QgsGeometry.unaryUnion(buffers))
+
+    def export_corridors(self):
+        """Writes the last corridor sweep to a csv file, one row per line and nearby feature"""
+        if not self.corridors:
+            print('run a corridor sweep first')
+            return
+        file_path, _ = w.QFileDialog.getSaveFileName(
+            self.main_widget, 'Export Corridors', str(Path().home().joinpath('corridors.csv')), 'CSV (*.csv)'
+        )
+        if not file_path:
+            return
+        names = []
+        for feature in self.corridor_features:
+            field_names = feature.fields().names()
+            name_field = next((field for field in ('ExploName', 'Name') if field in field_names), None)
+            names.append(feature.attribute(name_field) if name_field is not None else None)
+        rows = engine.corridor.corridors_to_rows(
+            self.corridors,
+            names=names,
+            attributes={'layer': self.corridor_layers, 'fid': [feature.id() for feature in self.corridor_features]},
+        )
+        fieldnames = [
+            'line', 'layer', 'fid', 'name', 'Dist', 'distanceAlongLine', 'leftOrRightOfSegment', 'minDistX', 'minDistY'
+        ]
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f'corridors written to {file_path}')
 
+    def on_batch_sections_task_finished(self, task: tasks.BatchSectionsTask, result: bool):
+        self.batch_task = None
+        if task.results is None:
+            return
+        failed = [r['name'] for r in task.results if r['error'] is not None]
+        print(f'{len(task.results)} cross sections written to {task.output_dir}, {len(failed)} failed')
+        webbrowser.open(task.output_dir.joinpath('index.html').as_uri())
+
+    @engine.tracer.traced(items=engine.trace.count_items)
     def get_nearby_features_as_ids(self) -> dict:
         """Method to get nearby features to the selected line. Various other methods call this
         to get nearby features when a gui element changes or is updated. That way
         self.nearby_features_as_ids will always return the nearby features based on the currently
-        set parameters"""
-        vector_layer_names_to_check = [item.text() for item in self.vector_list.selectedItems()]
-        vector_layers_to_check = [self.get_layer_by_name(name) for name in vector_layer_names_to_check]
-        spatial_index = gis.SpatialIndex(
-            iface=self.iface,
+        set parameters. Only what earlier searches for the line have not fetched is read from the layers,
+        see gis.NearbyFeatureQuery"""
+        self.nearby_query_timer.stop()
+        vector_layers_to_check = self.get_selected_vector_layers()
+        nearby_features = self.nearby_query.get_nearby_features(
             layers=vector_layers_to_check,
+            tolerance=self.tolerance_slider.value()
         )
-        nearby_features_ids = spatial_index.get_nearby_features_ids(reference_geometry=self.buffer_geometry)
+        self._nearby_features = nearby_features
+        if nearby_features is None:
+            nearby_features_ids = None
+        else:
+            nearby_features_ids = {layer_name: [feature.id() for feature in features]
+                                   for layer_name, features in nearby_features.items()}
+            for layer in vector_layers_to_check:
+                layer.selectByIds(nearby_features_ids[layer.name()])
         self._nearby_features_as_ids = nearby_features_ids
         return nearby_features_ids
 
+    def get_selected_vector_layers(self) -> list:
+        """QgsVectorLayers selected in the vector list"""
+        return [self.get_layer_by_name(item.text()) for item in self.vector_list.selectedItems()]
+
     def get_profile_xz_from_QgsFeature(self, feature: core.QgsFeature):
         try:
             feature_geometry_as_multipolyline = feature.geometry().asMultiPolyline()[0]
@@ -207,10 +646,19 @@ class XSectionPlugin(w.QWidget):
         self.get_nearby_features_dict()
         self.add_ground_line(x, z)
         self.add_nearby_explo_lines()
-        if self.plot_renderer == 'plotly':
-            self.fig.show()
-        elif self.plot_renderer == 'bokeh':
-            self.fig.show()
+        self.show_fig()
+
+    def show_fig(self, html_path: Path = None):
+        """Shows the figure in the plot view, or, without QtWebEngine, writes it to html and opens it in the
+        browser
+        :param html_path: html file for the browser, defaults to a temporary file
+        """
+        if self.plot_view.show_figure(self.fig, self.plot_renderer):
+            return
+        if html_path is None:
+            html_path = Path(tempfile.gettempdir()).joinpath('xsection_plot.html')
+        self.write_fig_html(html_path)
+        webbrowser.open(html_path.as_uri())
 
     def write_fig_html(self, file_path: Path = None):
         if file_path is None:
@@ -218,23 +666,18 @@ class XSectionPlugin(w.QWidget):
         self.fig.write_html(file_path, config={'scrollZoom': True})
 
     def write_fig_image(self, file_path: Path = None, width=1500, height=750):
+        """Writes the figure as an image. Plotly figures go through the shared pool of warm image renderers, see
+        engine.export.ImageExporter, so only the first export pays for starting the renderer"""
         if file_path is None:
             file_path = Path().home().joinpath("output_xsection.pdf")
-        self.fig.write_image(file_path, width=width, height=height)
+        if self.plot_renderer != 'plotly':
+            self.fig.write_image(file_path, width=width, height=height)
+            return
+        stats = engine.export.get_image_exporter().write_image(self.fig, file_path, width=width, height=height)
+        print(f"{stats['path']} written in {stats['seconds']} s")
 
     def add_ground_line(self, x, z):
-        if self.plot_renderer == 'plotly':
-            self.fig: Fig
-            self.fig.add_scattergl(
-                x=x, y=z,
-                hoverinfo='y',
-                name='Ground Surface Elevation',
-                mode='lines',
-                line_color='brown'
-            )
-        elif self.plot_renderer == 'bokeh':
-            self.fig: BokehFig
-            self.fig.line(x=x, y=z)
+        engine.plotting.add_ground_line(self.fig, x, z, renderer=self.plot_renderer)
 
     def add_nearby_explo_lines(self, line_color='blue', line_width=2):
         """
@@ -243,50 +686,13 @@ class XSectionPlugin(w.QWidget):
         :param line_width: width of the exploration lines
         :return:
         """
-        for feature_name, feature_data_dict in self.nearby_features_dict.items():
-            distance_along_line = feature_data_dict['distanceAlongLine']
-            lidar_elevation = feature_data_dict['lidar']
-            total_depth = feature_data_dict['ExploDepth']
-            if type(total_depth) not in [float, int]:
-                bottom_elevation = lidar_elevation
-                total_depth = None
-            else:
-                bottom_elevation = lidar_elevation - total_depth
-
-            if self.plot_renderer == 'plotly':
-                if total_depth is None:
-                    self.fig.add_scattergl(
-                        x=(distance_along_line,),
-                        y=(lidar_elevation,),
-                        name=feature_name
-                    )
-                else:
-                    self.fig.add_scattergl(
-                        mode='lines',
-                        line_width=line_width,
-                        line_color=line_color,
-                        marker_symbol=1,
-                        name=feature_name,
-                        x=(distance_along_line, distance_along_line),
-                        y=(lidar_elevation, bottom_elevation)
-                    )
-                """if feature_data_dict['screenTopBotElev'] is not None:
-                    screen_top, screen_bot = feature_data_dict['screenTopBotElev']
-                    self.fig.add_scattergl()"""
-            elif self.plot_renderer == 'bokeh':
-                if total_depth is None:
-                    self.fig: BokehFig
-                    self.fig.f.scatter(
-                        x=(distance_along_line,),
-                        y=(lidar_elevation,),
-                        name=feature_name
-                    )
-                else:
-                    self.fig.f.line(
-                        name=feature_name,
-                        x=(distance_along_line, distance_along_line),
-                        y=(lidar_elevation, bottom_elevation)
-                    )
+        engine.plotting.add_nearby_explo_lines(
+            self.fig,
+            self.nearby_features_dict,
+            renderer=self.plot_renderer,
+            line_color=line_color,
+            line_width=line_width
+        )
 
     def get_elevation_of_QgsPointXY(
             self,
@@ -307,47 +713,56 @@ class XSectionPlugin(w.QWidget):
             self,
             dem_layer_name: str = None,
             line: core.QgsLineString = None,
-            num_points: int = 1000
+            num_points: int = 1000,
+            interpolation: str = 'nearest'
     ) -> tuple:
         """
-        This function needs some revisions
+        Samples the dem along the line. The raster window under the line is read in one block and
+        all stations are sampled at once, see engine.sample_profile(). Lines whose window would be too
+        large are streamed in chunks, see engine.sampling.iter_profile_chunks()
         :param dem_layer_name: name of raster layer that is the reference dem
         :param line: the profile line to get x, z coordinates, as a core.QgsLineString
-        :param num_points: Number of points to interpolate (increase for higher resolution)
-        :return: a tuple with an x-coordinate list and a z-coordinate list
+        :param num_points: Number of points to interpolate (increase for higher resolution). None spaces the
+        stations from the dem's cell size and refines them where the ground curves, see
+        engine.sampling.sample_profile_adaptive()
+        :param interpolation: 'nearest' (the cell value, as dataProvider().sample() returns), 'bilinear' or 'cubic'
+        :return: a tuple with an x-coordinate array and a z-coordinate array
         """
         if dem_layer_name is None:
             dem_layer_name = self.raster_combobox.currentData().name()
         dem_layer = core.QgsProject.instance().mapLayersByName(dem_layer_name)[0]
 
-        # Transform context for CRS transformations
-        transform_context = core.QgsCoordinateTransformContext()
-        # CRS transformation from line CRS to DEM CRS
-        # transform = core.QgsCoordinateTransform(line.crs(), dem_layer.crs(), transform_context)
-
-        line_length = line.length()
-        interval = line_length / num_points
-
-        elevation_profile = []
-        for i in range(num_points + 1):
-            point_on_line = line.interpolatePoint(i * interval)
-            # point_on_line = point_on_line.transform(ct=dem_layer.crs())
-            # Transform point to DEM CRS if needed
-            # point_on_dem = transform.transform(point_on_line)
-
-            # Sample elevation
-            elevation, success = dem_layer.dataProvider().sample(core.QgsPointXY(point_on_line), 1)
-            if success:
-                x = i * interval
-                elevation_profile.append((x, elevation))
-            else:
-                print("Elevation data not available at", point_on_line)
-                continue
-        x = list(zip(*elevation_profile))[0]
-        z = list(zip(*elevation_profile))[1]
-
+        cache_key = self.get_profile_cache_key(line, dem_layer, num_points, interpolation)
+        profile = self.profile_cache.get(cache_key)
+        if profile is not None:
+            return profile
+        x, z = engine.sample_profile(
+            vertices=gis.line_to_array(line),
+            dem=self.get_dem(dem_layer),
+            num_points=num_points,
+            interpolation=interpolation
+        )
+        self.profile_cache.put(cache_key, x, z)
         return x, z
 
+    def get_profile_cache_key(
+            self,
+            line: core.QgsLineString,
+            dem_layer: core.QgsRasterLayer,
+            num_points: int,
+            interpolation: str
+    ) -> str:
+        """Key of a profile in the profile cache: the line's WKB and CRS, the dem layer's id and data timestamp,
+        and the sampling settings"""
+        return engine.ProfileCache.make_key(
+            line_wkb=bytes(line.asWkb()),
+            line_crs=self.line_crs.authid(),
+            dem_id=dem_layer.id(),
+            dem_timestamp=dem_layer.dataProvider().dataTimestamp().toMSecsSinceEpoch(),
+            spacing=num_points,
+            interpolation=interpolation
+        )
+
     def draw_buffer(self):
         self.clear_rubber_band()
         geometry: core.QgsGeometry = self.selected_line.geometry()
@@ -365,30 +780,157 @@ class XSectionPlugin(w.QWidget):
             self.buffer_rubber_band.reset()
             self.buffer_rubber_band = None
 
-    def get_nearby_features_dict(self):
-        features = self.get_nearby_features_as_QgsFeatures()
-        self._nearby_features_dict = {}
+    @engine.tracer.traced(items=len)
+    def get_nearby_features_dict(self) -> dict:
+        """Projects the nearby features onto the selected line with engine.project_explorations().
+        The result is stored in self.nearby_features_dict, and returned"""
+        dem_layer = self.get_layer_by_name(self.raster_combobox.currentData().name())
+        if self.use_exploration_store():
+            self._nearby_features_dict = self.get_store_explorations(dem_layer)
+        else:
+            self._nearby_features_dict = engine.project_explorations(
+                line=gis.geometry_to_line_array(self.selected_line.geometry()),
+                dem=self.get_dem(dem_layer),
+                **self.get_explorations_input()
+            )
+        for d in self._nearby_features_dict.values():
+            d['minDistPoint'] = core.QgsPointXY(d['minDistX'], d['minDistY'])
+        return self._nearby_features_dict
+
+    def get_explorations_input(self, features_by_layer: dict = None, crs: core.QgsCoordinateReferenceSystem = None
+                               ) -> dict:
+        """Reads the names, depths, project numbers and centroids of the nearby features. The centroids of each
+        layer are transformed to the line's CRS in one call. Attributes are read as plain str and float values, None
+        where they are NULL, so they can be sent to worker processes.
+        :param features_by_layer: dict with layer names as keys and lists of QgsFeatures to read as values, instead
+        of the nearby features
+        :param crs: CRS of the points, defaults to the CRS of the selected line
+        :return: dict with keys 'points', 'names', 'depths', 'attributes' and 'intervals', the keyword arguments of
+        engine.project_explorations()
+        """
+        if features_by_layer is None:
+            if self.nearby_query_timer.isActive():
+                # a search is waiting for the tolerance or layers to settle, run it now
+                self.get_nearby_features_as_ids()
+            features_by_layer = self._nearby_features or {}
+        features = [feature for layer_features in features_by_layer.values() for feature in layer_features]
+        names = []
+        depths = []
+        project_numbers = []
         for feature in features:
             field_names = feature.fields().names()
             if 'ExploName' in field_names:
-                name = feature.attribute('ExploName')
+                name = gis.attribute_to_str(feature.attribute('ExploName'), default='No Name')
             elif 'Name' in field_names:
-                name = feature.attribute('ExploName')
+                name = gis.attribute_to_str(feature.attribute('Name'), default='No Name')
             else:
                 name = 'No Name'
                 print('no valid name attribute found')
             if 'ExploDepth' in field_names:
-                explo_depth = feature.attribute('ExploDepth')
+                explo_depth = gis.attribute_to_float(feature.attribute('ExploDepth'))
             else:
                 explo_depth = None
-            project_number = feature.attribute('AESI_Pro_1')
-            d = self.get_distance_of_geometry_to_line_geometry(
-                geometry_to_check=feature.geometry().centroid().asPoint())
-            elevation = self.get_elevation_of_QgsPointXY(point=feature.geometry().asPoint())
-            d['lidar'] = elevation
-            d['ExploDepth'] = explo_depth
-            d['projectNumber'] = project_number
-            self._nearby_features_dict[name] = d
+            names.append(name)
+            depths.append(explo_depth)
+            project_numbers.append(
+                gis.attribute_to_str(feature.attribute('AESI_Pro_1')) if 'AESI_Pro_1' in field_names else None
+            )
+        intervals = None
+        if self.exploration_database is not None:
+            intervals = self.exploration_database.intervals_by_exploration
+        return {
+            'points': self.get_feature_points(features_by_layer, crs=crs),
+            'names': names,
+            'depths': depths,
+            'attributes': {'projectNumber': project_numbers},
+            'intervals': intervals,
+        }
+
+    def get_feature_points(self, features_by_layer: dict, crs: core.QgsCoordinateReferenceSystem = None
+                           ) -> np.ndarray:
+        """
+        Centroids of features, transformed from the CRS of their layer with one call per layer
+        :param features_by_layer: dict with layer names as keys and lists of QgsFeatures as values
+        :param crs: CRS of the points, defaults to the CRS of the selected line
+        :return: (n, 2) array of x, y coordinates, in the order of the features
+        """
+        crs = crs if crs is not None else self.line_crs
+        points = [np.empty((0, 2))]
+        for layer_name, layer_features in features_by_layer.items():
+            centroids = [feature.geometry().centroid().asPoint() for feature in layer_features]
+            points.append(self.transform_cache.transform_points(
+                self.get_layer_by_name(layer_name).crs(),
+                crs,
+                [(point.x(), point.y()) for point in centroids]
+            ))
+        return np.concatenate(points)
+
+    @property
+    def exploration_database(self):
+        """The exploration database with the unit intervals of each exploration, parsed on first use. None if the
+        database file does not exist"""
+        if self._exploration_database is None and EXPLORATION_DATABASE_PATH.is_file():
+            self._exploration_database = engine.ExplorationDatabase(EXPLORATION_DATABASE_PATH)
+        return self._exploration_database
+
+    @property
+    def exploration_store(self):
+        """The exploration store, opened on first use and brought up to date with the database files on each use.
+        None if duckdb is not installed or the database files do not exist"""
+        if self._exploration_store is None:
+            if not EXPLORATION_DATABASE_PATH.is_file() or not SURVEY_DATABASE_PATH.is_file():
+                return None
+            try:
+                import duckdb  # noqa: F401
+            except ImportError:
+                print('duckdb is not installed, the exploration store is not available')
+                return None
+            self._exploration_store = engine.ExplorationStore(
+                EXPLORATION_STORE_PATH,
+                exploration_database_path=EXPLORATION_DATABASE_PATH,
+                survey_path=SURVEY_DATABASE_PATH
+            )
+        ingested = self._exploration_store.ingest()
+        if ingested:
+            print(f'exploration store updated: {", ".join(ingested)}')
+        return self._exploration_store
+
+    def use_exploration_store(self) -> bool:
+        return self.store_checkbox.isChecked() and self.exploration_store is not None
+
+    def get_store_explorations(self, dem_layer: core.QgsRasterLayer) -> dict:
+        """Explorations within the tolerance of the selected line and their unit intervals, from one query of the
+        exploration store. The store is queried in the survey's CRS (WA83-SF): a line in another CRS is transformed
+        to it for the query, and the explorations found are projected again onto the line in its own CRS, so their
+        distances are in the line's units like the profile's.
+        :return: dict in the layout of self.nearby_features_dict, empty for a line in a geographic CRS
+        """
+        line_crs = self.line_crs
+        if line_crs.isGeographic():
+            print('the exploration store needs the line in a projected CRS, the tolerance would be in degrees')
+            return {}
+        survey_crs = core.QgsCoordinateReferenceSystem(SURVEY_CRS_AUTHID)
+        line = gis.geometry_to_line_array(self.selected_line.geometry())
+        tolerance = self.tolerance_slider.value()
+        scale = core.QgsUnitTypes.fromUnitToUnitFactor(line_crs.mapUnits(), survey_crs.mapUnits())
+        explorations = self.exploration_store.get_explorations_dict(
+            line=self.transform_cache.transform_points(line_crs, survey_crs, line),
+            distance=tolerance * scale,
+            dem=self.get_dem(dem_layer, crs=survey_crs)
+        )
+        if explorations and self.transform_cache.needs_transform(survey_crs, line_crs):
+            points = self.transform_cache.transform_points(
+                survey_crs, line_crs, [(d['x'], d['y']) for d in explorations.values()]
+            )
+            projection = engine.project_points_to_line(line, points)
+            for i, d in enumerate(explorations.values()):
+                d.update({key: values[i].item() for key, values in projection.items()})
+                d['x'], d['y'] = points[i].tolist()
+            # the corridor in the survey's CRS is not exactly the one in the line's
+            explorations = {name: d for name, d in explorations.items() if d['Dist'] <= tolerance}
+        for d in explorations.values():
+            d['projectNumber'] = None
+        return explorations
 
     def get_screen_elevations(self, point_name: str):
         screen_top = None
@@ -405,13 +947,38 @@ class XSectionPlugin(w.QWidget):
         layer = core.QgsProject.instance().mapLayersByName(name)[0]
         return layer
 
+    @property
+    def line_crs(self) -> core.QgsCoordinateReferenceSystem:
+        """CRS of the layer of the selected line, section distances are in its units"""
+        if self.layer_for_selection is None:
+            return core.QgsProject.instance().crs()
+        return self.layer_for_selection.crs()
+
+    def get_dem(self, dem_layer: core.QgsRasterLayer, crs: core.QgsCoordinateReferenceSystem = None,
+                thread_safe: bool = False):
+        """
+        DEM source of a raster layer for the engine, sampled with coordinates in the line's CRS. A DEM in another
+        CRS is wrapped in an engine.ReprojectedDem, whose station arrays are transformed with a cached transform
+        :param crs: CRS of the sampled coordinates, defaults to the CRS of the selected line
+        :param thread_safe: see gis.RasterLayerDem
+        """
+        crs = crs if crs is not None else self.line_crs
+        dem = gis.RasterLayerDem(dem_layer, thread_safe=thread_safe)
+        transform = self.transform_cache.get_array_transform(crs, dem_layer.crs())
+        if transform is None:
+            return dem
+        scale = core.QgsUnitTypes.fromUnitToUnitFactor(dem_layer.crs().mapUnits(), crs.mapUnits())
+        return engine.ReprojectedDem(dem, transform, pixel_size=dem.pixel_size * scale)
+
     def check_vector_list_selection(self):
         """Checks the current selection of the vector layer list relative to the old selection. If
         any of the vector layers are no longer selected, then their selection is removed. Then
-        redetermine nearby features and update the vector layer selection list"""
+        redetermine nearby features and update the vector layer selection list. The search waits for the
+        selection to settle, and only newly selected layers are searched, see gis.NearbyFeatureQuery"""
         if self.vector_list_selection is None:
             self.vector_list_selection = self.vector_list.selectedItems()
-            return self.get_nearby_features_as_ids()
+            self.nearby_query_timer.start()
+            return
         new_selection = [item.text() for item in self.vector_list.selectedItems()]
         for vector_layer_name in self.vector_list_selection:
             if vector_layer_name not in new_selection:
@@ -420,7 +987,7 @@ class XSectionPlugin(w.QWidget):
                 vector_layer.removeSelection()
                 print(f'{vector_layer} not in the new selection')
                 print('removed selection')
-        self.get_nearby_features_as_ids()
+        self.nearby_query_timer.start()
         self.vector_list_selection = self.vector_list.selectedItems()
         return
 
@@ -433,14 +1000,14 @@ class XSectionPlugin(w.QWidget):
         return self._nearby_features_dict
 
     def get_nearby_features_as_QgsFeatures(self):
-        """Iterates through self.nearby_features_as_ids which is a dict of layer names as keys and feature
-        ids and values. Returns a list of QgsFeatures corresponding to the self.nearby_features_as_ids dict."""
+        """Returns a list of the QgsFeatures fetched by the last get_nearby_features_as_ids() call, for all layers.
+        The features are not fetched again, only the attributes in NEARBY_FEATURE_ATTRIBUTES are populated."""
+        if self.nearby_query_timer.isActive():
+            # a search is waiting for the tolerance or layers to settle, run it now
+            self.get_nearby_features_as_ids()
         nearby_QgsFeatures = []
-        for layer_name, feature_ids in self.nearby_features_as_ids.items():
-            layer = self.get_layer_by_name(layer_name)
-            for fid in feature_ids:
-                feature = layer.getFeature(fid)
-                nearby_QgsFeatures.append(feature)
+        for layer_name, features in self._nearby_features.items():
+            nearby_QgsFeatures.extend(features)
         return nearby_QgsFeatures
 
     def get_distance_of_geometry_to_line_geometry(